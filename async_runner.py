@@ -0,0 +1,105 @@
+# Asyncio runner for multi-symbol live strategies
+#
+# BarScheduler calls the strategies of all symbols one after the other, so
+# with a long symbol list the last symbol's order waits for every other
+# symbol's fetch, indicators and order.  Here every symbol/timeframe
+# subscription is its own asyncio task: it waits for its bar boundary, then
+# runs the new-bar check and its strategy callbacks (all blocking terminal
+# calls) on a bounded thread pool.  Symbols proceed concurrently, up to
+# max_workers at a time, and a slow symbol no longer delays the others.
+#
+# A single driver coroutine owns the clock: it wakes the tasks whose bar is
+# due and, when every task is waiting, sleeps until the next boundary with
+# the scheduler's sleep.  With the offline shim that sleep advances the
+# simulated clock, so a replayed session only moves on once all symbols
+# have finished with the current bar.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from bar_scheduler import BarScheduler
+
+
+class AsyncBarRunner(BarScheduler):
+    """
+    BarScheduler that runs each subscription's new-bar pipeline concurrently.
+
+    Callbacks are the same blocking callback(symbol, timeframe) functions;
+    callbacks of one subscription still run in order, and state kept per
+    symbol needs no locking as long as each symbol has one subscription.
+    """
+
+    def __init__(self, mt5, max_workers=4, settle=0.2, retry=1.0, max_retry=60.0, clock=None, sleep=None):
+        super().__init__(mt5, settle, retry, max_retry, clock, sleep)
+        self.max_workers = max_workers
+        self.executor = None
+        self._sleepers = []  # (due, future) of tasks waiting for their next bar
+        self._changed = None
+
+    def run(self):
+        """
+        Run until stop() is called (from any callback) or every task has ended.
+        """
+        asyncio.run(self.run_async())
+
+    def stop(self):
+        self.running = False
+
+    async def run_async(self):
+        self.running = True
+        self._changed = asyncio.Event()
+        self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="mt5")
+        tasks = [asyncio.create_task(self._watch(subscription)) for subscription in self.subscriptions.values()]
+        for task in tasks:
+            task.add_done_callback(lambda _: self._changed.set())
+        try:
+            await self._drive(tasks)
+        finally:
+            self.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        for task in tasks:
+            if not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    async def _watch(self, subscription):
+        loop = asyncio.get_running_loop()
+        while self.running:
+            await self._sleep_until(subscription.due)
+            if self.running:
+                await loop.run_in_executor(self.executor, self._check, subscription)
+
+    async def _sleep_until(self, due):
+        future = asyncio.get_running_loop().create_future()
+        self._sleepers.append((due, future))
+        self._changed.set()
+        await future
+
+    async def _drive(self, tasks):
+        while self.running:
+            now = self.clock()
+            due_now = [entry for entry in self._sleepers if entry[0] <= now]
+            if due_now:
+                for entry in due_now:
+                    self._sleepers.remove(entry)
+                    entry[1].set_result(None)
+                await asyncio.sleep(0)  # Let the woken tasks hand their work to the pool
+                continue
+
+            running = [task for task in tasks if not task.done()]
+            if not running or any(task.done() and task.exception() for task in tasks if not task.cancelled()):
+                break
+            next_due = min((entry[0] for entry in self._sleepers), default=None)
+            if len(self._sleepers) == len(running):
+                # Every task waits for its next bar: nothing else can run meanwhile
+                self.sleep(max(next_due - now, 0))
+                continue
+            self._changed.clear()
+            timeout = None if next_due is None else max(next_due - now, 0)
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
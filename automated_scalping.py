@@ -1,10 +1,13 @@
-import MetaTrader5 as mt5
-import pandas as pd
+try:
+    import MetaTrader5 as mt5
+except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+    import mt5_offline as mt5
+import math
 from datetime import datetime, timedelta
-from ta.trend import EMAIndicator
-from ta.momentum import RSIIndicator
-from ta.volatility import BollingerBands, AverageTrueRange
-import time
+from streaming_indicators import IndicatorState
+from bar_buffer import BarRingBuffer
+from async_runner import AsyncBarRunner
+from latency import LatencyRecorder
 
 # Initialize MetaTrader 5 connection
 if not mt5.initialize():
@@ -24,40 +27,39 @@ cooldown_period = timedelta(minutes=2)  # Minimum time between trades per symbol
 # Store last trade times for cooldown
 last_trade_time = {symbol: None for symbol in symbols}
 
+# Last 200 closed bars and the indicators per symbol, updated with each new closed bar
+bars = {symbol: BarRingBuffer(symbol, timeframe, capacity=200) for symbol in symbols}
+indicators = {
+    symbol: IndicatorState(ema_windows=(9, 21), rsi_window=14, atr_window=14, bb_window=20, bb_dev=2)
+    for symbol in symbols
+}
+
+# Stage latency histograms per symbol, written as text metrics every minute
+latency = LatencyRecorder(path="latency_automated_scalping.prom", interval=60)
+
 # Define the scalping strategy
-def fetch_data(symbol, timeframe, lookback=200):
-    """
-    Fetch historical data for the given symbol and timeframe.
-    """
-    now = datetime.now()
-    rates = mt5.copy_rates_from(symbol, timeframe, now, lookback)
-    if rates is None or len(rates) == 0:
-        return None
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    df.set_index('time', inplace=True)
-    return df
-
-def calculate_indicators(df):
+def update_indicators(state, bars):
     """
-    Calculate EMA, RSI, Bollinger Bands, and ATR indicators.
+    Append the bars closed since the last poll to the ring buffer and feed them to the indicator state.
     """
-    df['EMA_9'] = EMAIndicator(close=df['close'], window=9).ema_indicator()
-    df['EMA_21'] = EMAIndicator(close=df['close'], window=21).ema_indicator()
-    df['RSI'] = RSIIndicator(close=df['close'], window=14).rsi()
-    bb = BollingerBands(close=df['close'], window=20, window_dev=2)
-    df['bb_high'] = bb.bollinger_hband()
-    df['bb_low'] = bb.bollinger_lband()
-    atr = AverageTrueRange(high=df['high'], low=df['low'], close=df['close'], window=14)
-    df['ATR'] = atr.average_true_range()
-    return df
+    with latency.time(bars.symbol, "fetch"):
+        added = bars.poll(mt5)
+    if added is None:
+        print(f"Failed to fetch data for {bars.symbol}.")
+        return False
+    with latency.time(bars.symbol, "indicators"):
+        # One bar the state has seen as overlap; None: bars were missed, warm up again
+        if state.update_rates(bars.view(added + 1)) is None:
+            state.update_rates(bars.view())
+    return True
 
 def place_order(symbol, action, lot, sl_price, tp_price):
     """
     Place a market order with the given parameters.
     """
-    order_type = mt5.ORDER_BUY if action == "buy" else mt5.ORDER_SELL
-    price = mt5.symbol_info_tick(symbol).ask if action == "buy" else mt5.symbol_info_tick(symbol).bid
+    order_type = mt5.ORDER_TYPE_BUY if action == "buy" else mt5.ORDER_TYPE_SELL
+    with latency.time(symbol, "tick"):
+        price = mt5.symbol_info_tick(symbol).ask if action == "buy" else mt5.symbol_info_tick(symbol).bid
     request = {
         "action": mt5.TRADE_ACTION_DEAL,
         "symbol": symbol,
@@ -72,75 +74,90 @@ def place_order(symbol, action, lot, sl_price, tp_price):
         "type_time": mt5.ORDER_TIME_GTC,
         "type_filling": mt5.ORDER_FILLING_IOC,
     }
-    result = mt5.order_send(request)
+    with latency.time(symbol, "order_send"):
+        result = mt5.order_send(request)
     if result.retcode != mt5.TRADE_RETCODE_DONE:
         print(f"Order failed for {symbol}. Error code: {result.retcode}")
         return False
     print(f"Order placed: {symbol}, {action}, Volume: {lot}, SL: {sl_price}, TP: {tp_price}")
     return True
 
-# Main loop
+# Evaluate the strategy for one symbol on each newly closed bar
+def on_bar(symbol, timeframe):
+    """
+    Update the symbol's indicators with the bar that just closed and trade on its signal.
+    """
+    started = scheduler.bar_close_ns(symbol, timeframe)
+    now = datetime.fromtimestamp(scheduler.clock())
+    latency.maybe_dump()
+    # Check if the market is open (Monday-Friday)
+    if now.weekday() >= 5:  # Skip weekends
+        return
+
+    print(f"Checking {symbol}...")
+    
+    # Fetch newly closed bars and update the indicators
+    state = indicators[symbol]
+    if not update_indicators(state, bars[symbol]):
+        return
+
+    if state.count < 21:  # Ensure sufficient data for indicators
+        print(f"Not enough data for indicators on {symbol}.")
+        return
+
+    # Get the latest closed bar
+    latest = state.latest
+    atr = latest['ATR']
+    if math.isnan(atr):  # Skip if ATR is unavailable
+        return
+
+    # Avoid overtrading (cooldown)
+    if last_trade_time[symbol] is not None and (now - last_trade_time[symbol]) < cooldown_period:
+        return
+
+    with latency.time(symbol, "signal"):
+        # Buy signal: EMA 9 > EMA 21, RSI > 30, and price near lower Bollinger Band
+        if (
+            latest['EMA_9'] > latest['EMA_21']
+            and latest['RSI'] > 30
+            and latest['close'] <= latest['bb_low']
+        ):
+            action = "buy"
+
+        # Sell signal: EMA 9 < EMA 21, RSI < 70, and price near upper Bollinger Band
+        elif (
+            latest['EMA_9'] < latest['EMA_21']
+            and latest['RSI'] < 70
+            and latest['close'] >= latest['bb_high']
+        ):
+            action = "sell"
+
+        else:
+            action = None
+    if action is None:
+        return
+
+    direction = 1 if action == "buy" else -1
+    sl_price = latest['close'] - direction * (atr * atr_multiplier_sl)
+    tp_price = latest['close'] + direction * (atr * atr_multiplier_tp)
+    placed = place_order(symbol, action, lot_size, sl_price, tp_price)
+    latency.record_since(symbol, "bar_to_order", started)  # Bar close to order_send returning
+    if placed:
+        last_trade_time[symbol] = now
+
+# Main loop: each symbol's pipeline runs concurrently when a new bar closes for it
+scheduler = AsyncBarRunner(mt5, max_workers=len(symbols))
+for symbol in symbols:
+    scheduler.subscribe(symbol, timeframe, on_bar)
 try:
-    while True:
-        now = datetime.now()
-        # Check if the market is open (Monday-Friday)
-        if now.weekday() >= 5:  # Skip weekends
-            print("Market closed. Waiting for Monday...")
-            time.sleep(3600)  # Sleep for 1 hour
-            continue
-
-        for symbol in symbols:
-            print(f"Checking {symbol}...")
-            
-            # Fetch and prepare data
-            df = fetch_data(symbol, timeframe)
-            if df is None:
-                print(f"Failed to fetch data for {symbol}.")
-                continue
-
-            df = calculate_indicators(df)
-            if len(df) < 21:  # Ensure sufficient data for indicators
-                print(f"Not enough data for indicators on {symbol}.")
-                continue
-
-            # Get the latest row
-            latest = df.iloc[-1]
-            atr = latest['ATR']
-            if pd.isna(atr):  # Skip if ATR is unavailable
-                continue
-
-            # Avoid overtrading (cooldown)
-            if last_trade_time[symbol] is not None and (now - last_trade_time[symbol]) < cooldown_period:
-                continue
-
-            # Buy signal: EMA 9 > EMA 21, RSI > 30, and price near lower Bollinger Band
-            if (
-                latest['EMA_9'] > latest['EMA_21']
-                and latest['RSI'] > 30
-                and latest['close'] <= latest['bb_low']
-            ):
-                sl_price = latest['close'] - (atr * atr_multiplier_sl)
-                tp_price = latest['close'] + (atr * atr_multiplier_tp)
-                if place_order(symbol, "buy", lot_size, sl_price, tp_price):
-                    last_trade_time[symbol] = now
-
-            # Sell signal: EMA 9 < EMA 21, RSI < 70, and price near upper Bollinger Band
-            elif (
-                latest['EMA_9'] < latest['EMA_21']
-                and latest['RSI'] < 70
-                and latest['close'] >= latest['bb_high']
-            ):
-                sl_price = latest['close'] + (atr * atr_multiplier_sl)
-                tp_price = latest['close'] - (atr * atr_multiplier_tp)
-                if place_order(symbol, "sell", lot_size, sl_price, tp_price):
-                    last_trade_time[symbol] = now
-
-        # Wait before the next iteration
-        time.sleep(60)  # Check every 1 minute
+    scheduler.run()
 
 except KeyboardInterrupt:
     print("Terminating the script...")
 
 finally:
+    latency.dump()
+    print(latency.summary())
+
     # Shutdown MT5 connection
     mt5.shutdown()
@@ -0,0 +1,257 @@
+# Vectorized backtest engine shared by the backtest scripts
+#
+# The scripts used to walk the DataFrame bar by bar (df['col'][i] or
+# df.iloc[i]) and re-scan every open position on every bar.  Here entries,
+# cooldowns, stop-loss/take-profit exits (via the batched first-passage
+# kernel in exit_kernel) and the equity curve are computed with array
+# operations on NumPy columns, reproducing the trades and the balance of
+# those loops exactly (same SL-first tie-break, same order of additions to
+# the balance).
+
+from collections import namedtuple
+from datetime import timedelta
+import numpy as np
+
+from exit_kernel import first_exits
+
+# Exit reasons
+OPEN = 0  # Still open at the end of the data
+STOP_LOSS = 1
+TAKE_PROFIT = 2
+SESSION_CLOSE = 3  # Closed at the bar close by a session-end rule
+SIGNAL_EXIT = 4  # Closed at the bar close by an exit signal
+
+TRADE_DTYPE = np.dtype([
+    ("entry_index", "<i8"),
+    ("exit_index", "<i8"),
+    ("direction", "i1"),  # 1 = buy, -1 = sell
+    ("entry_price", "<f8"),
+    ("stop_loss", "<f8"),
+    ("take_profit", "<f8"),
+    ("exit_price", "<f8"),
+    ("reason", "i1"),
+    ("profit", "<f8"),
+])
+
+BacktestResult = namedtuple(
+    "BacktestResult", "trades equity_curve equity_index initial_balance final_balance"
+)
+
+
+def _time_values(times, cooldown):
+    """
+    Convert bar times and a cooldown to comparable int64 values.
+
+    datetime64 times are compared in nanoseconds; integer times (epoch
+    seconds, as in MT5 rates) are compared in seconds.
+    """
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        values = times.astype("datetime64[ns]").view("i8")
+        gap = np.timedelta64(cooldown).astype("timedelta64[ns]").astype("i8")
+    else:
+        values = times.astype("i8")
+        gap = int(cooldown.total_seconds()) if isinstance(cooldown, timedelta) else int(cooldown)
+    return values, gap
+
+
+def simulate(high, low, close, long_entries, short_entries, stop_loss, take_profit,
+             start=0, valid=None, times=None, cooldown=None, check_entry_bar=False,
+             session_close=None, intrabar=None, lot_size=0.1, initial_balance=10000, contract_size=100000):
+    """
+    Backtest market entries at the bar close with fixed stop-loss/take-profit exits.
+
+    high, low, close: price columns.
+    long_entries, short_entries: boolean signal masks (long wins when both are set).
+    stop_loss, take_profit: per-bar SL/TP price for a position opened on that bar.
+    start: first bar processed (the scripts' range(start, len(df))).
+    valid: optional mask of bars to process at all (e.g. ATR not NaN); other
+        bars are skipped entirely, without exit checks or equity points.
+    times, cooldown: bar times and the minimum gap between entries; bars inside
+        the cooldown only record equity (no entries, no exit checks).
+    check_entry_bar: check exits on the entry bar itself (scripts that test
+        entries before exits) instead of from the next bar.
+    session_close: optional mask of session-end bars; on such a bar, if any
+        position is open, all positions close at the bar close and the bar is
+        skipped (no entries, no equity point).
+    intrabar: optional intrabar.IntrabarResolver deciding, from lower-timeframe
+        data, whether SL or TP came first on exit bars touching both.
+
+    Returns a BacktestResult with a TRADE_DTYPE array in entry order, the
+    balance after each processed bar and the bar index of each equity point.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    stop_loss = np.asarray(stop_loss, dtype=np.float64)
+    take_profit = np.asarray(take_profit, dtype=np.float64)
+    n = len(close)
+    if cooldown is not None and session_close is not None:
+        raise ValueError("cooldown and session_close cannot be combined")
+
+    active = np.zeros(n, dtype=bool)
+    active[start:] = True
+    if valid is not None:
+        active &= np.asarray(valid, dtype=bool)
+    long_entries = np.asarray(long_entries, dtype=bool) & active
+    short_entries = np.asarray(short_entries, dtype=bool) & active & ~long_entries
+    candidates = np.flatnonzero(long_entries | short_entries)
+    record = active.copy()
+    checkable = active.copy()
+
+    if cooldown is not None:
+        t, gap = _time_values(times, cooldown)
+        accepted = []
+        next_allowed = None
+        for i in candidates:
+            if next_allowed is None or t[i] >= next_allowed:
+                accepted.append(i)
+                next_allowed = t[i] + gap
+        entries = np.asarray(accepted, dtype=np.int64)
+        # Bars inside a cooldown window only record equity
+        if len(entries):
+            last = np.searchsorted(entries, np.arange(n), side="left") - 1
+            blocked = (last >= 0) & (t - t[entries[np.maximum(last, 0)]] < gap)
+            checkable &= ~blocked
+    else:
+        entries = candidates
+
+    if session_close is not None:
+        return _simulate_sessions(
+            high, low, close, long_entries, stop_loss, take_profit, entries, active,
+            np.asarray(session_close, dtype=bool), check_entry_bar, intrabar,
+            lot_size, initial_balance, contract_size,
+        )
+
+    direction = np.where(long_entries[entries], 1, -1).astype(np.int8)
+    scan_from = entries if check_entry_bar else entries + 1
+    exit_index, exit_price, reason = first_exits(
+        np.where(checkable, high, -np.inf), np.where(checkable, low, np.inf),
+        direction, stop_loss[entries], take_profit[entries], scan_from,
+    )
+    if intrabar is not None:
+        exit_price, reason = intrabar.resolve(exit_index, direction, stop_loss[entries], take_profit[entries],
+                                              high, low, exit_price, reason, entries)
+    trades = _make_trades(entries, exit_index, direction, close, stop_loss, take_profit,
+                          exit_price, reason, lot_size, contract_size)
+    return _finish(trades, record, initial_balance)
+
+
+def _simulate_sessions(high, low, close, long_entries, stop_loss, take_profit, candidates,
+                       active, session_close, check_entry_bar, intrabar, lot_size, initial_balance,
+                       contract_size):
+    """
+    simulate() with a session-end flush: a position is closed at the first
+    session-end bar after its entry unless SL/TP closed it earlier.  Whether a
+    session-end bar flushes (and is skipped) depends on earlier positions, so
+    candidates are accepted in order while flushed bars are tracked.
+    """
+    n = len(close)
+    flush_bars = np.flatnonzero(session_close & active)
+    direction = np.where(long_entries[candidates], 1, -1).astype(np.int8)
+    scan_from = candidates if check_entry_bar else candidates + 1
+    natural_exit, natural_price, natural_reason = first_exits(
+        np.where(active, high, -np.inf), np.where(active, low, np.inf),
+        direction, stop_loss[candidates], take_profit[candidates], scan_from,
+    )
+    if intrabar is not None:
+        natural_price, natural_reason = intrabar.resolve(natural_exit, direction, stop_loss[candidates],
+                                                         take_profit[candidates], high, low, natural_price,
+                                                         natural_reason, candidates)
+    if len(flush_bars) == 0:
+        # No session-end bar in the processed range: only SL/TP closes positions
+        next_flush = np.full(len(candidates), n)
+    else:
+        pos = np.searchsorted(flush_bars, candidates, side="right")
+        next_flush = np.where(pos < len(flush_bars), flush_bars[np.minimum(pos, len(flush_bars) - 1)], n)
+
+    flushed = set()
+    keep = np.zeros(len(candidates), dtype=bool)
+    exit_index = natural_exit.copy()
+    exit_price = natural_price.copy()
+    reason = natural_reason.copy()
+    for k, i in enumerate(candidates):
+        if i in flushed:
+            continue
+        keep[k] = True
+        f = next_flush[k]
+        if f < n and (natural_exit[k] < 0 or f <= natural_exit[k]):
+            flushed.add(f)
+            exit_index[k], exit_price[k], reason[k] = f, close[f], SESSION_CLOSE
+
+    record = active.copy()
+    if flushed:
+        record[np.fromiter(flushed, dtype=np.int64)] = False
+    trades = _make_trades(candidates[keep], exit_index[keep], direction[keep], close, stop_loss,
+                          take_profit, exit_price[keep], reason[keep], lot_size, contract_size)
+    return _finish(trades, record, initial_balance)
+
+
+def _make_trades(entries, exit_index, direction, close, stop_loss, take_profit, exit_price,
+                 reason, lot_size, contract_size):
+    trades = np.zeros(len(entries), dtype=TRADE_DTYPE)
+    trades["entry_index"] = entries
+    trades["exit_index"] = exit_index
+    trades["direction"] = direction
+    trades["entry_price"] = close[entries]
+    trades["stop_loss"] = stop_loss[entries]
+    trades["take_profit"] = take_profit[entries]
+    trades["exit_price"] = exit_price
+    trades["reason"] = reason
+    entry_price = trades["entry_price"]
+    move = np.where(direction > 0, exit_price - entry_price, entry_price - exit_price)
+    trades["profit"] = np.where(exit_index >= 0, move * contract_size * lot_size, 0.0)
+    return trades
+
+
+def _finish(trades, record, initial_balance):
+    """
+    Build the equity curve: the balance after each recorded bar, adding
+    closed trades in (exit bar, entry order) like the original loops did.
+    """
+    closed = trades[trades["exit_index"] >= 0]
+    order = np.lexsort((closed["entry_index"], closed["exit_index"]))
+    exit_bars = closed["exit_index"][order]
+    balances = np.cumsum(np.concatenate(([float(initial_balance)], closed["profit"][order])))
+    equity_index = np.flatnonzero(record)
+    equity_curve = balances[np.searchsorted(exit_bars, equity_index, side="right")]
+    return BacktestResult(trades, equity_curve, equity_index, initial_balance, balances[-1])
+
+
+def fifo_crossover(close, buy_signal, sell_signal, start=0, lot_size=0.1,
+                   initial_balance=10000, contract_size=100000):
+    """
+    Backtest long-only signals where each sell signal closes the oldest open buy.
+
+    Every bar from start records equity.  The open-queue length is a running
+    count, so matching buys to sells needs no per-bar loop: after the k-th
+    sell, matched = k + min(0, min_j (buys_before_sell_j - j)).
+    """
+    close = np.asarray(close, dtype=np.float64)
+    n = len(close)
+    active = np.zeros(n, dtype=bool)
+    active[start:] = True
+    buys = np.flatnonzero(np.asarray(buy_signal, dtype=bool) & active)
+    sells = np.flatnonzero(np.asarray(sell_signal, dtype=bool) & active & ~np.asarray(buy_signal, dtype=bool))
+
+    buys_before = np.searchsorted(buys, sells, side="left")
+    k = np.arange(1, len(sells) + 1)
+    matched = k + np.minimum(0, np.minimum.accumulate(buys_before - k)) if len(sells) else k
+    filled = np.diff(np.concatenate(([0], matched))) > 0
+
+    entries = buys[matched[filled] - 1]
+    exits = sells[filled]
+    trades = np.zeros(len(buys), dtype=TRADE_DTYPE)
+    trades["entry_index"] = buys
+    trades["exit_index"] = -1
+    trades["direction"] = 1
+    trades["entry_price"] = close[buys]
+    trades["stop_loss"] = np.nan
+    trades["take_profit"] = np.nan
+    trades["exit_price"] = np.nan
+    done = np.searchsorted(buys, entries)
+    trades["exit_index"][done] = exits
+    trades["exit_price"][done] = close[exits]
+    trades["reason"][done] = SIGNAL_EXIT
+    trades["profit"][done] = (close[exits] - close[entries]) * contract_size * lot_size
+    return _finish(trades, active, initial_balance)
@@ -1,6 +1,12 @@
-import MetaTrader5 as mt5
+try:
+    import MetaTrader5 as mt5
+except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+    import mt5_offline as mt5
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+import bar_cache
+import backtest_engine
 
 # Initialize MetaTrader 5 connection
 if not mt5.initialize():
@@ -14,7 +20,8 @@ start_date = "2023-01-01"  # Start date for historical data
 end_date = "2023-12-31"  # End date for historical data
 
 # Fetch historical data
-rates = mt5.copy_rates_range(
+rates = bar_cache.copy_rates_range(
+    mt5,
     symbol,
     timeframe,
     pd.Timestamp(start_date).to_pydatetime(),
@@ -38,23 +45,25 @@ df['SMA_30'] = df['close'].rolling(window=30).mean()
 # Backtesting the strategy
 initial_balance = 10000  # Initial capital in USD
 lot_size = 0.1  # Lot size per trade
-balance = initial_balance
-positions = []  # To track open positions
-equity_curve = []  # To track equity over time
+sma_10 = df['SMA_10'].to_numpy()
+sma_30 = df['SMA_30'].to_numpy()
+buy_signal = np.zeros(len(df), dtype=bool)
+sell_signal = np.zeros(len(df), dtype=bool)
+buy_signal[1:] = (sma_10[1:] > sma_30[1:]) & (sma_10[:-1] <= sma_30[:-1])
+sell_signal[1:] = (sma_10[1:] < sma_30[1:]) & (sma_10[:-1] >= sma_30[:-1])
 
-for i in range(30, len(df)):
-    if df['SMA_10'][i] > df['SMA_30'][i] and df['SMA_10'][i - 1] <= df['SMA_30'][i - 1]:
-        # Buy signal
-        positions.append(df['close'][i])  # Open a buy position
-        print(f"Buy Signal at {df.index[i]} - Price: {df['close'][i]}")
-    elif df['SMA_10'][i] < df['SMA_30'][i] and df['SMA_10'][i - 1] >= df['SMA_30'][i - 1]:
-        # Sell signal
-        if positions:
-            entry_price = positions.pop(0)
-            profit = (df['close'][i] - entry_price) * 100000 * lot_size  # Profit calculation
-            balance += profit
-            print(f"Sell Signal at {df.index[i]} - Price: {df['close'][i]}, Profit: {profit:.2f}")
-    equity_curve.append(balance)
+# Each sell signal closes the oldest open buy position
+result = backtest_engine.fifo_crossover(
+    df['close'].to_numpy(), buy_signal, sell_signal,
+    start=30, lot_size=lot_size, initial_balance=initial_balance,
+)
+balance = result.final_balance
+equity_curve = result.equity_curve
+
+for trade in result.trades:
+    print(f"Buy Signal at {df.index[trade['entry_index']]} - Price: {trade['entry_price']}")
+    if trade['exit_index'] >= 0:
+        print(f"Sell Signal at {df.index[trade['exit_index']]} - Price: {trade['exit_price']}, Profit: {trade['profit']:.2f}")
 
 # Plot the equity curve
 plt.figure(figsize=(12, 6))
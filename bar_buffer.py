@@ -0,0 +1,100 @@
+# Fixed-capacity ring buffer of closed bars for the live strategies
+#
+# One buffer per symbol/timeframe is allocated once and then fed only the
+# bars that closed since the previous poll (copy_rates_from_pos with a small
+# count), instead of building a new DataFrame from 200 bars on every loop.
+#
+# Bars are kept in the MT5 rates layout and every bar is written twice, at
+# slot and slot + capacity.  The most recent bars therefore always sit in
+# one contiguous slice of the storage, so view() hands out zero-copy views
+# (and view()['close'] a zero-copy column) without ever re-ordering data.
+
+import numpy as np
+
+from bar_cache import RATES_DTYPE
+
+
+class BarRingBuffer:
+    """
+    The last `capacity` closed bars of one symbol/timeframe.
+    """
+
+    def __init__(self, symbol, timeframe, capacity=200):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.capacity = capacity
+        self.storage = np.zeros(2 * capacity, dtype=RATES_DTYPE)
+        self.total = 0  # Bars appended since the last clear()
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    @property
+    def last_time(self):
+        """
+        Open time of the newest bar, or None when the buffer is empty.
+        """
+        if self.total == 0:
+            return None
+        return int(self.storage["time"][(self.total - 1) % self.capacity])
+
+    def clear(self):
+        self.total = 0
+
+    def extend(self, rates):
+        """
+        Append the bars of an MT5 rates array that are newer than the newest
+        bar held; returns the number of bars added.
+        """
+        if rates is None or len(rates) == 0:
+            return 0
+        last_time = self.last_time
+        if last_time is not None:
+            rates = rates[np.searchsorted(rates["time"], last_time, side="right"):]
+        rates = rates[-self.capacity:]
+        count = len(rates)
+        if count == 0:
+            return 0
+        slots = (self.total + np.arange(count)) % self.capacity
+        self.storage[slots] = rates
+        self.storage[slots + self.capacity] = rates
+        self.total += count
+        return count
+
+    def view(self, count=None):
+        """
+        Zero-copy view of the newest `count` bars (all held bars by default), oldest first.
+        """
+        size = len(self)
+        count = size if count is None else min(count, size)
+        if count == 0:
+            return self.storage[:0]
+        end = (self.total - 1) % self.capacity + self.capacity + 1
+        return self.storage[end - count:end]
+
+    def latest(self):
+        """
+        The newest closed bar (a zero-copy record), or None when empty.
+        """
+        if self.total == 0:
+            return None
+        return self.storage[(self.total - 1) % self.capacity]
+
+    def poll(self, mt5, count=3):
+        """
+        Fetch the bars closed since the last poll and append them.
+
+        An empty buffer is filled with `capacity` bars.  If none of the
+        `count` fetched bars overlaps the buffer, bars were missed and the
+        buffer is refilled from scratch.  Returns the number of bars added,
+        or None when the terminal call fails.
+        """
+        fetch = self.capacity if self.total == 0 else count
+        # Position 0 is the bar still forming, so closed bars start at 1
+        rates = mt5.copy_rates_from_pos(self.symbol, self.timeframe, 1, fetch)
+        if rates is None:
+            return None
+        if self.total and len(rates) and rates["time"][0] > self.last_time:
+            self.clear()
+            return self.poll(mt5, count)
+        return self.extend(rates)
@@ -0,0 +1,217 @@
+# Persistent on-disk bar store in front of mt5.copy_rates_range
+#
+# Bars are stored per symbol/timeframe/month as compressed column files:
+#
+#     <cache_dir>/<SYMBOL>/<TIMEFRAME>/<YYYY-MM>.npz
+#
+# Each partition holds one array per rates field (time, open, high, ...),
+# so reading a month only decompresses the columns of that month.  Months
+# that have fully closed are written once and never fetched again; the
+# current month is always fetched from the terminal because it still grows.
+# A closed month is only stored when the fetched bars reach its last bar
+# (see month_complete), so a month the terminal returned only part of,
+# e.g. while its history is still downloading, is fetched again next time.
+# A closed month without any bar is stored empty once the terminal has bars
+# on both sides of it, so it is not asked for again on every run either.
+
+import os
+import calendar
+import tempfile
+from datetime import datetime, timezone
+import numpy as np
+
+from timeframes import timeframe_name, timeframe_seconds
+
+CACHE_DIR = os.environ.get(
+    "ALGO_BAR_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "bar_cache"),
+)
+
+# A closed month's last bar may end this long before the month does (weekend or holiday closes)
+MONTH_END_SLACK = 4 * 86400
+
+# Same layout as the structured array returned by mt5.copy_rates_*
+RATES_DTYPE = np.dtype([
+    ("time", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("tick_volume", "<u8"),
+    ("spread", "<i4"),
+    ("real_volume", "<u8"),
+])
+
+
+def to_timestamp(value):
+    """
+    Convert a datetime or ISO string (naive values are taken as UTC, like MT5 does) to epoch seconds.
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        return int(value.timestamp())
+    return calendar.timegm(value.timetuple())
+
+
+def month_start(timestamp):
+    """
+    Return the epoch seconds of the first second of the month containing timestamp.
+    """
+    dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    return calendar.timegm((dt.year, dt.month, 1, 0, 0, 0))
+
+
+def next_month_start(timestamp):
+    """
+    Return the epoch seconds of the first second of the month after timestamp.
+    """
+    dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    year, month = (dt.year + 1, 1) if dt.month == 12 else (dt.year, dt.month + 1)
+    return calendar.timegm((year, month, 1, 0, 0, 0))
+
+
+def month_keys(start_date, end_date):
+    """
+    List (key, first_second, last_second) for every month touched by [start_date, end_date].
+    """
+    start, end = to_timestamp(start_date), to_timestamp(end_date)
+    months = []
+    current = month_start(start)
+    while current <= end:
+        following = next_month_start(current)
+        key = datetime.fromtimestamp(current, tz=timezone.utc).strftime("%Y-%m")
+        months.append((key, current, following - 1))
+        current = following
+    return months
+
+
+def partition_path(symbol, timeframe, key, cache_dir=None):
+    """
+    Return the file path of one symbol/timeframe/month partition.
+    """
+    return os.path.join(cache_dir or CACHE_DIR, symbol, timeframe_name(timeframe), f"{key}.npz")
+
+
+def read_partition(path):
+    """
+    Load a partition file back into an MT5-style rates array.
+    """
+    with np.load(path) as columns:
+        rates = np.empty(len(columns["time"]), dtype=RATES_DTYPE)
+        for name in RATES_DTYPE.names:
+            if name in columns:
+                rates[name] = columns[name]
+            else:
+                rates[name] = 0
+    return rates
+
+
+def write_partition(path, rates):
+    """
+    Write an MT5 rates array as one compressed column per field.
+
+    The file is written to a temporary name first and renamed into place so
+    concurrent backtests never read a half-written partition.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rates = np.asarray(rates)
+    columns = {name: np.ascontiguousarray(rates[name]) for name in rates.dtype.names}
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(f, **columns)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def month_complete(mt5, symbol, timeframe, rates, first, last):
+    """
+    Whether bars fetched for a closed month run up to the month's last bar.
+
+    The last fetched bar must be the last bar the terminal has at or before
+    the end of the month, and end at most MONTH_END_SLACK before it.  A
+    month without bars is complete when the terminal's last bar at or before
+    its end opened before it and the terminal also has bars after it.
+    """
+    expected = mt5.copy_rates_from(symbol, timeframe, datetime.fromtimestamp(last, tz=timezone.utc), 1)
+    if expected is None or len(expected) == 0:
+        return False
+    if len(rates) == 0:
+        newest = mt5.copy_rates_from_pos(symbol, timeframe, 0, 1)
+        return (expected["time"][-1] < first and newest is not None and len(newest) > 0
+                and newest["time"][-1] > last)
+    if rates["time"][-1] + timeframe_seconds(timeframe) < last - MONTH_END_SLACK:
+        return False
+    return rates["time"][-1] >= expected["time"][-1]
+
+
+def load_month(mt5, symbol, timeframe, key, first, last, cache_dir=None, now=None):
+    """
+    Return the bars of one month, reading the local partition when present.
+
+    Missing months are fetched from the terminal; months that have already
+    closed and came back complete are stored so later runs never ask the
+    terminal for them again.
+    Returns None if the terminal call fails.
+    """
+    path = partition_path(symbol, timeframe, key, cache_dir)
+    if os.path.exists(path):
+        return read_partition(path)
+    if mt5 is None or getattr(mt5, "OFFLINE", False):
+        return np.empty(0, dtype=RATES_DTYPE)
+
+    rates = mt5.copy_rates_range(
+        symbol,
+        timeframe,
+        datetime.fromtimestamp(first, tz=timezone.utc),
+        datetime.fromtimestamp(last, tz=timezone.utc),
+    )
+    if rates is None:
+        return None
+    rates = np.asarray(rates).astype(RATES_DTYPE, copy=False)
+
+    now = to_timestamp(now) if now is not None else int(datetime.now(timezone.utc).timestamp())
+    if last < now and month_complete(mt5, symbol, timeframe, rates, first, last):
+        write_partition(path, rates)
+    return rates
+
+
+def copy_rates_range(mt5, symbol, timeframe, start_date, end_date, cache_dir=None):
+    """
+    Drop-in replacement for mt5.copy_rates_range(symbol, timeframe, start_date, end_date)
+    that serves bars from the local store and only asks the terminal for missing months.
+
+    Pass mt5=None (or the mt5_offline module) to read the store without
+    ever contacting a terminal.
+    """
+    start, end = to_timestamp(start_date), to_timestamp(end_date)
+    parts = []
+    for key, first, last in month_keys(start, end):
+        rates = load_month(mt5, symbol, timeframe, key, first, last, cache_dir)
+        if rates is None:
+            return None
+        parts.append(rates)
+    rates = np.concatenate(parts) if parts else np.empty(0, dtype=RATES_DTYPE)
+    lo = np.searchsorted(rates["time"], start, side="left")
+    hi = np.searchsorted(rates["time"], end, side="right")
+    return rates[lo:hi]
+
+
+def iter_months(mt5, symbol, timeframe, start_date, end_date, cache_dir=None):
+    """
+    Yield the bars of [start_date, end_date] one month partition at a time.
+    """
+    start, end = to_timestamp(start_date), to_timestamp(end_date)
+    for key, first, last in month_keys(start, end):
+        rates = load_month(mt5, symbol, timeframe, key, first, last, cache_dir)
+        if rates is None:
+            raise RuntimeError(f"Failed to fetch {symbol} {timeframe_name(timeframe)} bars for {key}")
+        lo = np.searchsorted(rates["time"], start, side="left")
+        hi = np.searchsorted(rates["time"], end, side="right")
+        yield rates[lo:hi]
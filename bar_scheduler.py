@@ -0,0 +1,173 @@
+# New-bar scheduler for the live strategies
+#
+# The live loops used to sleep a fixed 10 or 60 seconds and re-evaluate
+# whatever bar was latest, so M1 signals fired up to a minute late or were
+# evaluated several times per bar.  Here strategies subscribe to a
+# symbol/timeframe and are called once per closed bar: the scheduler sleeps
+# until the next bar boundary of any subscription, confirms with a single
+# symbol_info_tick call that the terminal has a tick at or after the
+# boundary (the new bar exists, so the previous one has closed) and calls
+# only the strategies subscribed to that symbol/timeframe.
+#
+# Bar and tick times are in trade-server time, usually a few hours off UTC.
+# The offset to the local clock is estimated from each confirming tick and
+# rounded to 15 minutes, so tick latency does not leak into it.  While no
+# tick arrives (market closed, quiet symbol) the check backs off up to
+# max_retry seconds.
+
+import time
+
+import bar_cache
+from timeframes import TIMEFRAMES, timeframe_seconds
+
+OFFSET_STEP = 900  # Server UTC offsets are whole quarter hours
+
+
+class _Subscription:
+    def __init__(self, symbol, timeframe):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.callbacks = []
+        self.boundary = None  # Server time at which the forming bar closes
+        self.closed = None  # Server time at which the bar being dispatched closed
+        self.due = 0.0  # Local time of the next check
+        self.delay = None  # Current retry delay
+
+
+class BarScheduler:
+    """
+    Call subscribed strategies once for each newly closed bar.
+
+    Callbacks are called as callback(symbol, timeframe), after the bar has
+    closed, in subscription order.  clock and sleep default to the ones of
+    the mt5 module when it has them (the offline shim, to replay sessions),
+    otherwise to time.time and time.sleep.
+    """
+
+    def __init__(self, mt5, settle=0.2, retry=1.0, max_retry=60.0, clock=None, sleep=None):
+        self.mt5 = mt5
+        self.settle = settle  # Seconds after a boundary before the first check
+        self.retry = retry
+        self.max_retry = max_retry
+        self.clock = clock or getattr(mt5, "clock", time.time)
+        self.sleep = sleep or getattr(mt5, "sleep", time.sleep)
+        self.offset = 0.0  # Server time minus local time
+        self.subscriptions = {}
+        self.running = False
+
+    def subscribe(self, symbol, timeframe, callback):
+        """
+        Call callback(symbol, timeframe) whenever a symbol/timeframe bar closes.
+        """
+        key = (symbol, timeframe)
+        if key not in self.subscriptions:
+            self.subscriptions[key] = _Subscription(symbol, timeframe)
+        self.subscriptions[key].callbacks.append(callback)
+
+    def unsubscribe(self, symbol, timeframe, callback):
+        key = (symbol, timeframe)
+        subscription = self.subscriptions.get(key)
+        if subscription is not None and callback in subscription.callbacks:
+            subscription.callbacks.remove(callback)
+            if not subscription.callbacks:
+                del self.subscriptions[key]
+
+    def next_due(self):
+        """
+        Local time of the earliest pending check, or None without subscriptions.
+        """
+        if not self.subscriptions:
+            return None
+        return min(subscription.due for subscription in self.subscriptions.values())
+
+    def run_pending(self):
+        """
+        Check every subscription that is due; returns the number of bars dispatched.
+        """
+        now = self.clock()
+        dispatched = 0
+        for subscription in list(self.subscriptions.values()):
+            if subscription.due <= now and self._check(subscription):
+                dispatched += 1
+        return dispatched
+
+    def run(self):
+        """
+        Sleep until the next bar boundary and dispatch, until stop() is called.
+        """
+        self.running = True
+        while self.running:
+            due = self.next_due()
+            if due is None:
+                break
+            wait = due - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+            self.run_pending()
+
+    def stop(self):
+        self.running = False
+
+    def bar_close_ns(self, symbol, timeframe):
+        """
+        The close of the bar being dispatched to symbol/timeframe callbacks, as
+        a time.perf_counter_ns() value: latencies measured from it include the
+        scheduler's wake-up and settle delay after the bar closed.
+        """
+        now = time.perf_counter_ns()
+        closed = self.subscriptions[(symbol, timeframe)].closed
+        if closed is None:
+            return now
+        elapsed = self.clock() - (closed - self.offset)  # Seconds since the close, on the scheduler clock
+        return now - int(max(elapsed, 0.0) * 1e9)
+
+    def _forming_bar_close(self, subscription):
+        """
+        Server time at which the bar currently forming will close, or None.
+        """
+        rates = self.mt5.copy_rates_from_pos(subscription.symbol, subscription.timeframe, 0, 1)
+        if rates is None or len(rates) == 0:
+            return None
+        opened = int(rates["time"][-1])
+        if subscription.timeframe == TIMEFRAMES["MN1"]:
+            return bar_cache.next_month_start(opened)
+        return opened + timeframe_seconds(subscription.timeframe)
+
+    def _update_offset(self, tick_time):
+        self.offset = round((tick_time - self.clock()) / OFFSET_STEP) * OFFSET_STEP
+
+    def _back_off(self, subscription):
+        subscription.delay = self.retry if subscription.delay is None else min(subscription.delay * 2, self.max_retry)
+        subscription.due = self.clock() + subscription.delay
+
+    def _schedule(self, subscription):
+        subscription.delay = None
+        subscription.due = subscription.boundary - self.offset + self.settle
+
+    def _check(self, subscription):
+        tick = self.mt5.symbol_info_tick(subscription.symbol)
+        if subscription.boundary is None:
+            # First check (or the forming bar could not be read): only find the next boundary
+            if tick is not None:
+                self._update_offset(tick.time)
+            subscription.boundary = self._forming_bar_close(subscription)
+            if subscription.boundary is None:
+                self._back_off(subscription)
+            else:
+                self._schedule(subscription)
+            return False
+
+        if tick is None or tick.time < subscription.boundary:
+            self._back_off(subscription)  # The new bar has not started yet
+            return False
+        self._update_offset(tick.time)
+        subscription.closed = subscription.boundary
+        for callback in list(subscription.callbacks):
+            callback(subscription.symbol, subscription.timeframe)
+
+        subscription.boundary = self._forming_bar_close(subscription)
+        if subscription.boundary is None:
+            self._back_off(subscription)
+        else:
+            self._schedule(subscription)
+        return True
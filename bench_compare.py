@@ -0,0 +1,268 @@
+# Performance regression gate over benchmark_suite runs
+#
+# Runs the benchmark suite, stores the results under the current commit in
+# a local results directory and compares them with a baseline commit (by
+# default the parent commit, if its results are stored):
+#
+#     python bench_compare.py run                        # store, compare with HEAD~1
+#     python bench_compare.py run --baseline main        # compare with another commit
+#     python bench_compare.py compare v1.2 HEAD          # two stored commits (or JSON files)
+#
+# A stage's time on one side is the median over the stored runs of each
+# run's best time, so running the suite again on a noisy machine tightens
+# the estimate.  A stage counts as slower when that time grew by more than
+# the larger of --tolerance and --sigmas times the combined relative noise
+# of the two sides: the spread (median absolute deviation) of the runs'
+# best times over the square root of their number, or the spread of one
+# run's samples when only one run is stored.  Stages
+# faster than --min-seconds are reported but never fail the gate, as their
+# timings are mostly noise.  The memory of a case is its peak
+# RSS above the interpreter's startup RSS, and fails when it grew by more
+# than --rss-tolerance and --rss-floor.  The exit status is 1 when anything
+# regressed, with the failures listed first in the report.
+
+import argparse
+from collections import namedtuple
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+import benchmark_suite
+
+RESULTS_DIR = "benchmark_results"
+GATE_BARS = (100_000, 1_000_000)
+
+# One compared metric: kind is "throughput" (bars/s of a stage) or "rss" (bytes of a case)
+Comparison = namedtuple("Comparison", "kind case bars stage baseline candidate change limit status")
+
+
+def result_key(commit, dirty=False):
+    """
+    File stem of a commit's results; uncommitted changes are kept apart.
+    """
+    return f"{commit}-dirty" if dirty else commit
+
+
+def store(document, results_dir=RESULTS_DIR):
+    """
+    Append a benchmark_suite document to the stored runs of its commit.
+    """
+    if document.get("commit") is None:
+        raise ValueError("Benchmark results without a commit cannot be stored")
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, result_key(document["commit"], document.get("dirty")) + ".json")
+    stored = _read(path) if os.path.exists(path) else {"commit": document["commit"], "runs": []}
+    stored["runs"].append(document)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(stored, f, indent=1)
+    os.replace(temporary, path)
+    return path
+
+
+def _read(path):
+    with open(path) as f:
+        stored = json.load(f)
+    # A plain benchmark_suite output file is a single run
+    return stored if "runs" in stored else {"commit": stored.get("commit"), "runs": [stored]}
+
+
+def resolve(ref, path=None):
+    """
+    Full commit hash of a git ref, or None.
+    """
+    path = path or os.path.dirname(os.path.abspath(__file__))
+    try:
+        return subprocess.run(["git", "rev-parse", "--verify", "--quiet", f"{ref}^{{commit}}"], cwd=path,
+                              capture_output=True, text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load(ref, results_dir=RESULTS_DIR):
+    """
+    Stored runs of a commit: a JSON file path, a stored key or a git ref.
+    Returns None when nothing is stored for it.
+    """
+    if os.path.isfile(ref):
+        return _read(ref)
+    for key in (ref, resolve(ref)):
+        if key is not None:
+            path = os.path.join(results_dir, key + ".json")
+            if os.path.exists(path):
+                return _read(path)
+    return None
+
+
+def _collect(stored):
+    # Timing samples of each run per (case, bars, stage), own peak RSS of each run per (case, bars)
+    samples, rss = {}, {}
+    for run in stored["runs"]:
+        for record in run["results"]:
+            key = (record["case"], record["bars"])
+            for stage, values in record["stages"].items():
+                samples.setdefault(key + (stage,), []).append(values.get("samples") or [values["seconds"]])
+            if run.get("isolated", True) and record.get("peak_rss_bytes") is not None:
+                rss.setdefault(key, []).append(record["peak_rss_bytes"] - (record.get("startup_rss_bytes") or 0))
+    return samples, rss
+
+
+def relative_noise(values):
+    """
+    Robust relative spread of timing samples: 1.4826 MAD / median.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    median = np.median(values)
+    if len(values) < 2 or median <= 0:
+        return 0.0
+    return float(1.4826 * np.median(np.abs(values - median)) / median)
+
+
+def stage_time(runs):
+    """
+    (time, relative noise) of a stage from the timing samples of each run:
+    the median of the runs' best times, and its standard error.
+    """
+    best = [min(samples) for samples in runs]
+    noise = relative_noise(best) / np.sqrt(len(best)) if len(best) > 1 else relative_noise(runs[0])
+    return float(np.median(best)), noise
+
+
+def compare(baseline, candidate, tolerance=0.10, sigmas=3.0, min_seconds=0.002,
+            rss_tolerance=0.10, rss_floor=16 * 2**20):
+    """
+    Compare the stored runs of two commits.
+
+    Returns a list of Comparison rows for every stage and case both have;
+    status is "slower", "larger" (RSS), "faster", "smaller", "ok" or "noise"
+    (too short to judge).  change is the relative change of the throughput
+    (negative = slower) or of the RSS (positive = larger), limit the allowed one.
+    """
+    base_samples, base_rss = _collect(baseline)
+    new_samples, new_rss = _collect(candidate)
+    rows = []
+    for key in sorted(base_samples.keys() & new_samples.keys()):
+        case, bars, stage = key
+        (base_time, base_noise), (new_time, new_noise) = stage_time(base_samples[key]), stage_time(new_samples[key])
+        noise = np.hypot(base_noise, new_noise)
+        limit = max(tolerance, sigmas * noise)
+        base_speed, new_speed = bars / base_time, bars / new_time
+        change = new_speed / base_speed - 1
+        if base_time < min_seconds:
+            status = "noise"
+        elif base_time * (1 + limit) < new_time:
+            status = "slower"
+        elif new_time * (1 + limit) < base_time:
+            status = "faster"
+        else:
+            status = "ok"
+        # Throughput may drop by up to 1 - 1 / (1 + limit) before the time has grown by limit
+        rows.append(Comparison("throughput", case, bars, stage, base_speed, new_speed, change,
+                               -limit / (1 + limit), status))
+
+    for key in sorted(base_rss.keys() & new_rss.keys()):
+        case, bars = key
+        base_bytes, new_bytes = min(base_rss[key]), min(new_rss[key])
+        change = new_bytes / base_bytes - 1 if base_bytes > 0 else 0.0
+        if new_bytes > base_bytes * (1 + rss_tolerance) and new_bytes - base_bytes > rss_floor:
+            status = "larger"
+        elif base_bytes > new_bytes * (1 + rss_tolerance) and base_bytes - new_bytes > rss_floor:
+            status = "smaller"
+        else:
+            status = "ok"
+        rows.append(Comparison("rss", case, bars, None, base_bytes, new_bytes, change, rss_tolerance, status))
+    return rows
+
+
+def regressions(rows):
+    return [row for row in rows if row.status in ("slower", "larger")]
+
+
+def _format_row(row):
+    if row.kind == "throughput":
+        values = f"{row.baseline:>15,.0f}{row.candidate:>15,.0f} bars/s"
+    else:
+        values = f"{row.baseline / 2**20:>15.1f}{row.candidate / 2**20:>15.1f} MiB   "
+    limit = f"{row.limit * 100:+.1f}%"
+    return (f"{row.case:<16}{row.bars:>10} {row.stage or 'peak RSS':<11}{values}"
+            f"{row.change * 100:>+9.1f}%{limit:>9}  {row.status}")
+
+
+def report(rows, baseline, candidate):
+    """
+    Readable report: a verdict, the regressions, then every comparison.
+    """
+    failed = regressions(rows)
+    lines = [f"Baseline:  {baseline.get('commit')} ({len(baseline['runs'])} run(s))",
+             f"Candidate: {candidate.get('commit')} ({len(candidate['runs'])} run(s))"]
+    environments = {json.dumps(run.get("environment"), sort_keys=True)
+                    for run in baseline["runs"] + candidate["runs"]}
+    if len(environments) > 1:
+        lines.append("Warning: the runs come from different environments; differences may not be the code's.")
+    header = (f"{'case':<16}{'bars':>10} {'stage':<11}{'baseline':>15}{'candidate':>15}"
+              f"{'':7}{'change':>10}{'limit':>9}  status")
+    if not rows:
+        lines.append("Nothing to compare: no case and bar count in common.")
+        return "\n".join(lines)
+    if failed:
+        lines += ["", f"FAIL: {len(failed)} regression(s) beyond tolerance", header]
+        lines += [_format_row(row) for row in failed]
+    else:
+        lines += ["", "PASS: no regression beyond tolerance"]
+    lines += ["", "All comparisons", header] + [_format_row(row) for row in rows]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Store benchmark results per commit and gate regressions.")
+    parser.add_argument("--results-dir", default=RESULTS_DIR, help="directory of the stored results")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown")
+    parser.add_argument("--sigmas", type=float, default=3.0, help="noise multiples allowed on top of it")
+    parser.add_argument("--min-seconds", type=float, default=0.002, help="shorter stages are never gated")
+    parser.add_argument("--rss-tolerance", type=float, default=0.10, help="allowed relative RSS growth")
+    parser.add_argument("--rss-floor", type=float, default=16, help="allowed RSS growth in MiB")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the suite, store it under HEAD and compare with a baseline")
+    run.add_argument("--baseline", default="HEAD~1", help="commit, stored key or results file (default: HEAD~1)")
+    run.add_argument("--bars", type=int, nargs="+", default=list(GATE_BARS))
+    run.add_argument("--cases", nargs="+", choices=list(benchmark_suite.CASES))
+    run.add_argument("--repeat", type=int, default=5)
+    run.add_argument("--seed", type=int, default=0)
+
+    compare_command = commands.add_parser("compare", help="compare two stored commits or results files")
+    compare_command.add_argument("baseline")
+    compare_command.add_argument("candidate")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        print(benchmark_suite.TABLE_HEADER)
+        document = benchmark_suite.run_suite(
+            args.cases, args.bars, seed=args.seed, repeat=args.repeat,
+            progress=lambda record: print(benchmark_suite.format_record(record), flush=True),
+        )
+        print(f"Stored in {store(document, args.results_dir)}\n")
+        candidate = load(result_key(document["commit"], document["dirty"]), args.results_dir)
+        baseline_ref = args.baseline
+    else:
+        candidate = load(args.candidate, args.results_dir)
+        if candidate is None:
+            print(f"No stored results for {args.candidate}")
+            return 2
+        baseline_ref = args.baseline
+
+    baseline = load(baseline_ref, args.results_dir)
+    if baseline is None:
+        print(f"No stored results for the baseline {baseline_ref}: nothing to compare against.")
+        return 0 if args.command == "run" else 2
+
+    rows = compare(baseline, candidate, args.tolerance, args.sigmas, args.min_seconds,
+                   args.rss_tolerance, args.rss_floor * 2**20)
+    print(report(rows, baseline, candidate))
+    return 1 if regressions(rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
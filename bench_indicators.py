@@ -0,0 +1,72 @@
+# Benchmark: indicators.py kernels against the ta library
+#
+# Times EMA, RSI, ATR and Bollinger bands on the deterministic synthetic
+# M1 bars of synthetic_data (1M bars by default) through ta and through
+# indicators, and reports the largest difference between the two (for
+# Bollinger bands that is pandas' own rolling-window rounding).  Run with
+# and without Numba installed to compare the compiled and the NumPy
+# kernels:
+#
+#     python bench_indicators.py [bars]
+
+import sys
+import time
+import numpy as np
+import pandas as pd
+from ta.trend import EMAIndicator
+from ta.momentum import RSIIndicator
+from ta.volatility import BollingerBands, AverageTrueRange
+
+import indicators
+from synthetic_data import synthetic_bars
+
+
+def timed(function, repeat=3):
+    """
+    Best wall time of repeat calls, and the last result.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def max_difference(a, b):
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    if not np.array_equal(np.isnan(a), np.isnan(b)):
+        return float("inf")
+    return float(np.nanmax(np.abs(a - b))) if len(a) else 0.0
+
+
+def run(count):
+    bars = synthetic_bars(count, seed=42)
+    high, low, close = bars["high"], bars["low"], bars["close"]
+    h, l, c = pd.Series(high), pd.Series(low), pd.Series(close)
+    cases = [
+        ("EMA 21", lambda: EMAIndicator(close=c, window=21).ema_indicator(),
+         lambda: indicators.ema(close, 21)),
+        ("RSI 14", lambda: RSIIndicator(close=c, window=14).rsi(),
+         lambda: indicators.rsi(close, 14)),
+        ("ATR 14", lambda: AverageTrueRange(high=h, low=l, close=c, window=14).average_true_range(),
+         lambda: indicators.atr(high, low, close, 14)),
+        ("BB 20 high", lambda: BollingerBands(close=c, window=20, window_dev=2).bollinger_hband(),
+         lambda: indicators.bollinger_bands(close, 20, 2)[1]),
+    ]
+    jit = count >= indicators.JIT_MIN_BARS and bool(indicators.jit_kernels())
+    if jit:  # Compile the Numba kernels before timing
+        indicators.jit_kernels()["ewm"](close[:100], 0.1, close[0])
+        indicators.jit_kernels()["wilder"](close[:100], 14, 0.0)
+
+    print(f"{count} bars, Numba {'on' if jit else 'off'}")
+    print(f"{'indicator':<12}{'ta (s)':>10}{'numpy (s)':>12}{'speedup':>10}{'max diff':>12}")
+    for name, reference, candidate in cases:
+        ta_time, expected = timed(reference, repeat=1 if name.startswith("ATR") else 3)
+        own_time, values = timed(candidate)
+        print(f"{name:<12}{ta_time:>10.4f}{own_time:>12.4f}{ta_time / own_time:>9.1f}x"
+              f"{max_difference(values, expected):>12.2e}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,332 @@
+# Benchmark suite: backtest and indicator stages on synthetic bars
+#
+# Times each stage of the strategy pipelines (indicator columns, signals,
+# the stop-loss/take-profit exit scan and the full backtest) on synthetic
+# bars (synthetic_data, the same bars for a given seed on every machine),
+# for series of 10k to 10M bars, without a terminal or the bar store:
+#
+#     python benchmark_suite.py --bars 10000 100000 1000000 --output results.json
+#
+# Every (case, bars) run happens in a fresh process, so its peak RSS is its
+# own.  Each stage reports the best wall time of --repeat runs, the
+# throughput in bars per second and the peak of the memory it allocated
+# (tracemalloc, measured in a separate, untimed run).  The results are
+# written as JSON (one record per case and bar count, with the commit and
+# the environment) for trend tracking; a table is printed as well.
+# bench_compare.py stores them per commit and gates regressions.
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+import backtest_engine
+import indicators
+import param_sweep
+import streaming_backtest
+import synthetic_data
+from exit_kernel import first_exits
+from timeframes import TIMEFRAMES
+
+try:
+    import resource
+except ImportError:  # Windows: no getrusage
+    resource = None
+
+DEFAULT_BARS = (10_000, 100_000, 1_000_000)
+SCHEMA_VERSION = 1
+
+
+class StageTimer:
+    """
+    Runs the stages of one case and keeps their timings.
+
+    repeat: timed runs per stage (the best is kept).
+    trace: also measure the peak allocated memory of each stage.
+    """
+
+    def __init__(self, bars, repeat=3, trace=True):
+        self.bars = bars
+        self.repeat = repeat
+        self.trace = trace
+        self.stages = {}
+
+    def run(self, stage, function):
+        """
+        Time function() as stage and return its result.
+        """
+        samples = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            result = function()
+            samples.append(time.perf_counter() - started)
+        best = min(samples)
+        record = {"seconds": best, "bars_per_second": self.bars / best if best > 0 else float("inf"),
+                  "samples": samples}
+        if self.trace:
+            result = None
+            tracemalloc.start()
+            try:
+                result = function()
+                record["peak_alloc_bytes"] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        self.stages[stage] = record
+        return result
+
+
+def _strategy_case(name):
+    # Stages of a param_sweep strategy with its default parameters
+    def case(bars, timer):
+        strategy = param_sweep.STRATEGIES[name]
+        params = dict(strategy.defaults)
+        columns = timer.run("indicators", lambda: param_sweep.prepare_columns(strategy, bars, [params]))
+        buy_signal, sell_signal = timer.run("signals", lambda: strategy.signals(columns, params))
+
+        close, high, low = columns["close"], columns["high"], columns["low"]
+        atr = columns[f"ATR_{params['atr_window']}"]
+        entries = np.flatnonzero((buy_signal | sell_signal) & ~np.isnan(atr))
+        direction = np.where(buy_signal[entries], 1, -1).astype(np.int8)
+        distance_sl = atr[entries] * params["atr_multiplier_sl"]
+        distance_tp = atr[entries] * params["atr_multiplier_tp"]
+        timer.run("exits", lambda: first_exits(
+            high, low, direction, close[entries] - direction * distance_sl,
+            close[entries] + direction * distance_tp, entries + 1,
+        ))
+        timer.run("backtest", lambda: strategy.backtest(columns, params))
+    return case
+
+
+def sma_crossover(bars, timer):
+    """
+    backtest_strategy.py: SMA 10/30 crossover, sells close the oldest buy.
+    """
+    close = bars["close"]
+    fast, slow = timer.run("indicators", lambda: indicators.sma_family(close, [10, 30]))
+
+    def signals():
+        buy_signal = np.zeros(len(close), dtype=bool)
+        sell_signal = np.zeros(len(close), dtype=bool)
+        buy_signal[1:] = (fast[1:] > slow[1:]) & (fast[:-1] <= slow[:-1])
+        sell_signal[1:] = (fast[1:] < slow[1:]) & (fast[:-1] >= slow[:-1])
+        return buy_signal, sell_signal
+
+    buy_signal, sell_signal = timer.run("signals", signals)
+    timer.run("backtest", lambda: backtest_engine.fifo_crossover(close, buy_signal, sell_signal, start=30))
+
+
+def scalping_stream(bars, timer, chunk_bars=100_000):
+    """
+    scalping_strategy.py: EMA/RSI/Bollinger scalping, chunk by chunk
+    (streaming_backtest), indicators and backtest timed over all chunks.
+    """
+    chunks = [{name: values[lo:lo + chunk_bars] for name, values in bars.items()}
+              for lo in range(0, len(bars["close"]), chunk_bars)]
+
+    def run_indicators():
+        chunk_indicators = streaming_backtest.ChunkIndicators(ema_windows=(9, 21), rsi_window=14, atr_window=14,
+                                                              bb_window=20, bb_dev=2)
+        return [chunk_indicators.update(chunk) for chunk in chunks]
+
+    def run_backtest():
+        backtest = streaming_backtest.StreamingBacktest(start=21, cooldown=timedelta(minutes=2),
+                                                        check_entry_bar=True, initial_balance=2000)
+        for columns in chunk_columns:
+            close, atr = columns["close"], columns["ATR"]
+            buy_signal = (columns["EMA_9"] > columns["EMA_21"]) & (columns["RSI"] > 30) & (close <= columns["bb_low"])
+            sell_signal = (columns["EMA_9"] < columns["EMA_21"]) & (columns["RSI"] < 70) & (close >= columns["bb_high"])
+            stop_loss = np.where(buy_signal, close - atr, close + atr)
+            take_profit = np.where(buy_signal, close + 1.5 * atr, close - 1.5 * atr)
+            backtest.process(columns, buy_signal, sell_signal, stop_loss, take_profit, valid=~np.isnan(atr))
+        return backtest.trades()
+
+    chunk_columns = timer.run("indicators", run_indicators)
+    timer.run("backtest", run_backtest)
+
+
+CASES = {
+    "sma_crossover": sma_crossover,
+    "ema_rsi_atr": _strategy_case("ema_rsi_session"),
+    "ema_rsi_bb": _strategy_case("ema_rsi_bb"),
+    "sma_cross_bb": _strategy_case("sma_cross_bb"),
+    "scalping_stream": scalping_stream,
+}
+
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process so far, or None where unknown.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # Linux reports KiB
+
+
+def _warm_up():
+    # Compile the Numba kernels (when installed) outside the timings
+    kernels = indicators.jit_kernels()
+    if kernels:
+        x = np.linspace(1.0, 2.0, 100)
+        kernels["ewm"](x, 0.1, x[0])
+        kernels["wilder"](x, 14, 0.0)
+
+
+def run_case(case, bars, seed=0, timeframe=TIMEFRAMES["M1"], repeat=3, trace=True):
+    """
+    Generate the synthetic bars and run one case; returns its result record.
+    """
+    _warm_up()
+    rss_before = peak_rss_bytes()
+    started = time.perf_counter()
+    data = synthetic_data.synthetic_bars(bars, seed=seed, timeframe=timeframe)
+    generate_seconds = time.perf_counter() - started
+
+    timer = StageTimer(bars, repeat, trace)
+    CASES[case](data, timer)
+    total = sum(stage["seconds"] for stage in timer.stages.values())
+    return {
+        "case": case,
+        "bars": bars,
+        "seconds": total,
+        "bars_per_second": bars / total if total > 0 else float("inf"),
+        "stages": timer.stages,
+        "generate_seconds": generate_seconds,
+        "startup_rss_bytes": rss_before,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def run_isolated(case, bars, **options):
+    """
+    run_case() in a fresh process, so the peak RSS is the case's own.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as pool:
+        return pool.submit(run_case, case, bars, **options).result()
+
+
+def git_commit(path=None):
+    """
+    (commit, dirty) of the working tree, or (None, None) outside git.
+    """
+    path = path or os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=path, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=path,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def environment():
+    """
+    Interpreter, library versions and machine of the run.
+    """
+    try:
+        import numba
+        numba_version = numba.__version__
+    except ImportError:
+        numba_version = None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": numba_version,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_suite(cases=None, bar_counts=DEFAULT_BARS, seed=0, timeframe=TIMEFRAMES["M1"], repeat=3,
+              trace=True, isolate=True, progress=None):
+    """
+    Run every case for every bar count and return the results document.
+
+    isolate: run each (case, bars) in its own process (peak RSS per case).
+    progress: optional callable receiving each result record as it is done.
+    """
+    commit, dirty = git_commit()
+    document = {
+        "schema": SCHEMA_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "environment": environment(),
+        "data": {"generator": "synthetic_data", "seed": seed, "timeframe": timeframe},
+        "repeat": repeat,
+        "isolated": isolate,
+        "results": [],
+    }
+    options = {"seed": seed, "timeframe": timeframe, "repeat": repeat, "trace": trace}
+    for count in bar_counts:
+        for case in cases or list(CASES):
+            record = run_isolated(case, count, **options) if isolate else run_case(case, count, **options)
+            document["results"].append(record)
+            if progress is not None:
+                progress(record)
+    return document
+
+
+def format_record(record):
+    """
+    One table row per stage of a result record.
+    """
+    rss = record["peak_rss_bytes"]
+    rows = []
+    for stage, values in record["stages"].items():
+        peak = values.get("peak_alloc_bytes")
+        rows.append(f"{record['case']:<16}{record['bars']:>10} {stage:<11}{values['seconds']:>11.4f}"
+                    f"{values['bars_per_second']:>15,.0f}"
+                    f"{'' if peak is None else f'{peak / 2**20:.1f}':>12}"
+                    f"{'' if rss is None else f'{rss / 2**20:.1f}':>12}")
+    return "\n".join(rows)
+
+
+TABLE_HEADER = (f"{'case':<16}{'bars':>10} {'stage':<11}{'seconds':>11}{'bars/s':>15}"
+                f"{'alloc MiB':>12}{'RSS MiB':>12}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the backtest and indicator stages on synthetic bars.")
+    parser.add_argument("--bars", type=int, nargs="+", default=list(DEFAULT_BARS),
+                        help="bar counts to run (e.g. 10000 100000 1000000 10000000)")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), help="cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage; the best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic bars")
+    parser.add_argument("--timeframe", choices=list(TIMEFRAMES), default="M1", help="timeframe of the synthetic bars")
+    parser.add_argument("--no-trace", action="store_true", help="skip the tracemalloc runs")
+    parser.add_argument("--no-isolate", action="store_true", help="run every case in this process")
+    parser.add_argument("--output", help="JSON results file (default: print the JSON to stdout)")
+    args = parser.parse_args(argv)
+
+    # The table goes to stderr when the JSON goes to stdout
+    table = sys.stdout if args.output else sys.stderr
+    print(TABLE_HEADER, file=table)
+    document = run_suite(
+        args.cases, args.bars, seed=args.seed, timeframe=TIMEFRAMES[args.timeframe], repeat=args.repeat,
+        trace=not args.no_trace, isolate=not args.no_isolate,
+        progress=lambda record: print(format_record(record), file=table, flush=True),
+    )
+    text = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return document
+
+
+if __name__ == "__main__":
+    main()
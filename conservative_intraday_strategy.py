@@ -1,8 +1,15 @@
-import MetaTrader5 as mt5
+try:
+    import MetaTrader5 as mt5
+except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+    import mt5_offline as mt5
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
-from ta.momentum import RSIIndicator
+import bar_cache
+import indicators
+import multi_timeframe
+import backtest_engine
 
 # Initialize MetaTrader 5 connection
 if not mt5.initialize():
@@ -11,16 +18,17 @@ if not mt5.initialize():
 
 # Define symbol and timeframe
 symbol = "EURUSD"  # Replace with a symbol available on your broker
-timeframe = mt5.TIMEFRAME_D1  # 1-week timeframe
+timeframe = mt5.TIMEFRAME_M1  # 1-minute candles; the H1 trend is derived from them
 
 # Define the day for intraday trading (today by default)
 today = datetime.now().date()
 start_time = datetime(2024, 1, 14, 8, 0)  # Start from January 13, 2025 earlier at 8:00 AM UTC
 end_time = datetime(2025, 1, 17, 17, 0)  # End at January 17, 2025 at 5:00 PM UTC
+warmup = timedelta(days=14)  # Extra history so the H1 SMA 200 is ready at start_time
 
 # Debugging: Fetch historical data for intraday trading
-print(f"Fetching 1-minute historical data for {symbol} from {start_time} to {end_time}...")
-rates = mt5.copy_rates_range(symbol, timeframe, start_time, end_time)
+print(f"Fetching 1-minute historical data for {symbol} from {start_time - warmup} to {end_time}...")
+rates = bar_cache.copy_rates_range(mt5, symbol, timeframe, start_time - warmup, end_time)
 
 # Handle cases where data is insufficient
 if rates is None or len(rates) == 0:
@@ -38,105 +46,63 @@ df.set_index('time', inplace=True)
 # Debugging: Print the first few rows of the data
 print(f"Sample data:\n{df.head()}")
 
-# Fetch higher timeframe (H1) data for trend filtering
-h1_start_time = start_time - timedelta(days=1)  # Start 1 day earlier for H1 data
-print(f"Fetching 1-hour historical data for trend filtering from {h1_start_time} to {end_time}...")
-h1_rates = mt5.copy_rates_range(symbol, mt5.TIMEFRAME_H1, h1_start_time, end_time)
-
-# Handle cases where higher timeframe data is insufficient
-if h1_rates is None or len(h1_rates) == 0:
-    print(f"No H1 data fetched for {symbol}. Rows fetched: {0 if h1_rates is None else len(h1_rates)}")
-    mt5.shutdown()
-    quit()
-else:
-    print(f"H1 data fetched successfully! Number of rows: {len(h1_rates)}")
-
-h1_df = pd.DataFrame(h1_rates)
-h1_df['time'] = pd.to_datetime(h1_df['time'], unit='s')
-h1_df.set_index('time', inplace=True)
-h1_df['SMA_200'] = h1_df['close'].rolling(window=200).mean()
-
-# Debugging: Print the first few rows of the H1 data
-print(f"Sample H1 data:\n{h1_df.head()}")
+# Higher timeframe (H1) trend filter, resampled from the 1-minute bars.  Each
+# 1-minute bar only sees the SMA of the H1 bars already closed at its close.
+mtf = multi_timeframe.MultiTimeframe(rates, timeframe)
+h1_bars = mtf.bars(mt5.TIMEFRAME_H1)
+print(f"H1 bars resampled for trend filtering: {len(h1_bars['time'])}")
+df['H1_SMA_200'] = mtf.align(mt5.TIMEFRAME_H1, indicators.sma(h1_bars['close'], 200))
 
 # Calculate RSI for the main dataframe
-df['RSI'] = RSIIndicator(close=df['close'], window=14).rsi()
+df['RSI'] = indicators.rsi(df['close'], 14)
 
 # Define trading parameters
 initial_balance = 10000  # Initial capital in USD
-balance = initial_balance
 lot_size = 0.1  # Fixed lot size per trade
-positions = []  # Track open positions
-equity_curve = []  # Track balance over time
 cooldown_period = timedelta(minutes=15)  # Cooldown between trades
-last_trade_time = None  # Track the time of the last trade
 
 # Conservative stop-loss and take-profit percentages
 stop_loss_percent = 1 / 100  # 1% of the entry price
 take_profit_percent = 3 / 100  # 3% of the entry price
 
-# Backtest intraday strategy
-for i in range(14, len(df)):
-    # Ensure cooldown period is respected
-    if last_trade_time is not None and (df.index[i] - last_trade_time) < cooldown_period:
-        equity_curve.append(balance)
-        continue
-
-    # Higher timeframe trend confirmation
-    higher_trend = h1_df['SMA_200'].iloc[-1]
-    current_price = df['close'][i]
-
-    # Buy condition
-    if df['RSI'][i] > 40 and df['RSI'][i] < 60 and current_price > higher_trend:
-        entry_price = current_price
-        stop_loss = entry_price * (1 - stop_loss_percent)
-        take_profit = entry_price * (1 + take_profit_percent)
-        positions.append((entry_price, stop_loss, take_profit, "buy"))
-        last_trade_time = df.index[i]
-        print(f"Buy Signal at {df.index[i]} - Entry: {entry_price:.4f}, SL: {stop_loss:.4f}, TP: {take_profit:.4f}")
-
-    # Sell condition
-    elif df['RSI'][i] > 40 and df['RSI'][i] < 60 and current_price < higher_trend:
-        entry_price = current_price
-        stop_loss = entry_price * (1 + stop_loss_percent)
-        take_profit = entry_price * (1 - take_profit_percent)
-        positions.append((entry_price, stop_loss, take_profit, "sell"))
-        last_trade_time = df.index[i]
-        print(f"Sell Signal at {df.index[i]} - Entry: {entry_price:.4f}, SL: {stop_loss:.4f}, TP: {take_profit:.4f}")
-
-    # Check existing positions for stop-loss/take-profit
-    closed_positions = []
-    for position in positions:
-        entry_price, stop_loss, take_profit, direction = position
-        if direction == "buy":
-            if df['low'][i] <= stop_loss:  # Stop-loss hit
-                profit = (stop_loss - entry_price) * 100000 * lot_size
-                balance += profit
-                print(f"Stop-Loss Hit (Buy) at {df.index[i]} - Price: {stop_loss:.4f}, Profit: {profit:.2f}")
-                closed_positions.append(position)
-            elif df['high'][i] >= take_profit:  # Take-profit hit
-                profit = (take_profit - entry_price) * 100000 * lot_size
-                balance += profit
-                print(f"Take-Profit Hit (Buy) at {df.index[i]} - Price: {take_profit:.4f}, Profit: {profit:.2f}")
-                closed_positions.append(position)
-        elif direction == "sell":
-            if df['high'][i] >= stop_loss:  # Stop-loss hit
-                profit = (entry_price - stop_loss) * 100000 * lot_size
-                balance += profit
-                print(f"Stop-Loss Hit (Sell) at {df.index[i]} - Price: {stop_loss:.4f}, Profit: {profit:.2f}")
-                closed_positions.append(position)
-            elif df['low'][i] <= take_profit:  # Take-profit hit
-                profit = (entry_price - take_profit) * 100000 * lot_size
-                balance += profit
-                print(f"Take-Profit Hit (Sell) at {df.index[i]} - Price: {take_profit:.4f}, Profit: {profit:.2f}")
-                closed_positions.append(position)
-
-    # Remove closed positions
-    for position in closed_positions:
-        positions.remove(position)
-
-    # Track equity over time
-    equity_curve.append(balance)
+# Backtest intraday strategy from start_time (earlier bars only warm up the indicators)
+close = df['close'].to_numpy()
+rsi = df['RSI'].to_numpy()
+higher_trend = df['H1_SMA_200'].to_numpy()  # NaN until an H1 SMA 200 has closed
+
+# Buy/sell: RSI between 40 and 60, price above/below the higher timeframe trend
+neutral_rsi = (rsi > 40) & (rsi < 60)
+buy_signal = neutral_rsi & (close > higher_trend)
+sell_signal = neutral_rsi & (close < higher_trend)
+stop_loss = np.where(buy_signal, close * (1 - stop_loss_percent), close * (1 + stop_loss_percent))
+take_profit = np.where(buy_signal, close * (1 + take_profit_percent), close * (1 - take_profit_percent))
+
+# Entries respect the cooldown period; open positions are checked against
+# SL/TP from the entry bar on, except on bars inside a cooldown
+result = backtest_engine.simulate(
+    df['high'].to_numpy(), df['low'].to_numpy(), close,
+    buy_signal, sell_signal, stop_loss, take_profit,
+    start=max(14, int(df.index.searchsorted(start_time))),
+    times=df.index.to_numpy(),
+    cooldown=cooldown_period,
+    check_entry_bar=True,
+    lot_size=lot_size,
+    initial_balance=initial_balance,
+)
+balance = result.final_balance
+equity_curve = result.equity_curve
+
+# Trade log
+for trade in result.trades:
+    side = "Buy" if trade['direction'] > 0 else "Sell"
+    print(f"{side} Signal at {df.index[trade['entry_index']]} - Entry: {trade['entry_price']:.4f}, "
+          f"SL: {trade['stop_loss']:.4f}, TP: {trade['take_profit']:.4f}")
+    if trade['reason'] == backtest_engine.STOP_LOSS:
+        print(f"Stop-Loss Hit ({side}) at {df.index[trade['exit_index']]} - Price: {trade['exit_price']:.4f}, "
+              f"Profit: {trade['profit']:.2f}")
+    elif trade['reason'] == backtest_engine.TAKE_PROFIT:
+        print(f"Take-Profit Hit ({side}) at {df.index[trade['exit_index']]} - Price: {trade['exit_price']:.4f}, "
+              f"Profit: {trade['profit']:.2f}")
 
 # Plot the equity curve
 plt.figure(figsize=(12, 6))
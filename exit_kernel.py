@@ -0,0 +1,145 @@
+# First-passage stop-loss/take-profit exit kernel
+#
+# Given many positions (entry bar, direction, SL and TP levels), find for
+# each one the first bar whose low/high touches its stop-loss or
+# take-profit, in one batched pass instead of re-scanning every open
+# position on every bar.
+#
+# The price series is split into blocks of block_size bars.  A sparse table
+# over the per-block extremes lets every position skip untouched blocks by
+# binary lifting (log2(n / block_size) vectorized steps); only the block it
+# starts in and the block containing the hit are examined bar by bar, as a
+# (positions x block_size) gather.  Work is O(positions * (block_size +
+# log n)) and extra memory is O(n / block_size * log n), so the kernel also
+# scales to multi-million-bar M1 histories.
+
+import numpy as np
+
+STOP_LOSS = 1
+TAKE_PROFIT = 2
+
+
+def _block_tables(x, block_size):
+    """
+    Pad x to whole blocks and build the sparse table of block minima:
+    tables[k][b] = min(x[b * block_size : (b + 2**k) * block_size]).
+    """
+    n = len(x)
+    blocks = max(1, -(-n // block_size))
+    padded = np.full(blocks * block_size, np.inf)
+    padded[:n] = x
+    tables = [padded.reshape(blocks, block_size).min(axis=1)]
+    step = 1
+    while 2 * step <= blocks:
+        previous = tables[-1]
+        tables.append(np.minimum(previous[:-step], previous[step:]))
+        step *= 2
+    return padded, tables
+
+
+def _first_in_block(padded, block, level, lower_bound, block_size):
+    """
+    Return the first column of each block with padded[...] <= level at or
+    after lower_bound, or block_size where there is none.
+    """
+    columns = np.arange(block_size)
+    window = padded[block[:, None] * block_size + columns]
+    hits = (window <= level[:, None]) & (columns >= lower_bound[:, None])
+    found = hits.any(axis=1)
+    return np.where(found, hits.argmax(axis=1), block_size)
+
+
+def first_touch(x, level, start, block_size=16, chunk_size=16384, tables=None):
+    """
+    Return, for each query, the first index j >= start with x[j] <= level
+    (len(x) when there is none).  NaN values in x and NaN levels never
+    count as a touch.
+
+    tables: optional result of _block_tables(x, block_size) to reuse.
+    """
+    n = len(x)
+    level = np.asarray(level, dtype=np.float64)
+    start = np.asarray(start, dtype=np.int64)
+    if tables is None:
+        x = np.where(np.isnan(x), np.inf, x)
+        padded, tables = _block_tables(x, block_size)
+    else:
+        padded, tables = tables
+    blocks = len(tables[0])
+    result = np.full(len(start), n, dtype=np.int64)
+
+    for lo in range(0, len(start), chunk_size):
+        s = start[lo:lo + chunk_size]
+        lv = level[lo:lo + chunk_size]
+        out = np.full(len(s), n, dtype=np.int64)
+        inside = (s < n) & ~np.isnan(lv)
+        s, lv, idx = s[inside], lv[inside], np.flatnonzero(inside)
+
+        # 1. Rest of the block the scan starts in
+        first_block = s // block_size
+        column = _first_in_block(padded, first_block, lv, s % block_size, block_size)
+        hit = column < block_size
+        out[idx[hit]] = first_block[hit] * block_size + column[hit]
+
+        # 2. Skip whole blocks that stay above the level
+        s, lv, idx = first_block[~hit] + 1, lv[~hit], idx[~hit]
+        for k in range(len(tables) - 1, -1, -1):
+            table = tables[k]
+            can_skip = s < len(table)
+            can_skip[can_skip] = table[s[can_skip]] > lv[can_skip]
+            s = s + np.where(can_skip, 1 << k, 0)
+
+        # 3. First touching bar inside the block found
+        found = s < blocks
+        s, lv, idx = s[found], lv[found], idx[found]
+        column = _first_in_block(padded, s, lv, np.zeros(len(s), dtype=np.int64), block_size)
+        hit = column < block_size
+        out[idx[hit]] = np.minimum(s[hit] * block_size + column[hit], n)
+        result[lo:lo + chunk_size] = out
+    return result
+
+
+def first_exits(high, low, direction, stop_loss, take_profit, scan_from, scan_to=None,
+                block_size=16):
+    """
+    Return (exit_index, exit_price, reason) arrays for a batch of positions.
+
+    A buy exits on the first bar j >= scan_from with low <= SL or
+    high >= TP; a sell on high >= SL or low <= TP.  A bar touching both
+    levels counts as a stop-loss, like the backtest loops.  Bars to ignore
+    can be masked beforehand with high = -inf / low = +inf.  Positions
+    without an exit before scan_to (default: end of data) get exit_index -1,
+    exit_price NaN and reason 0.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    direction = np.asarray(direction)
+    stop_loss = np.asarray(stop_loss, dtype=np.float64)
+    take_profit = np.asarray(take_profit, dtype=np.float64)
+    scan_from = np.asarray(scan_from, dtype=np.int64)
+    n = len(high)
+    count = len(scan_from)
+    is_buy = direction > 0
+
+    # Touch conditions as "series <= level": low <= L, or -high <= -H
+    low_tables = _block_tables(np.where(np.isnan(low), np.inf, low), block_size)
+    neg_high_tables = _block_tables(np.where(np.isnan(high), np.inf, -high), block_size)
+
+    sl_index = np.full(count, n, dtype=np.int64)
+    tp_index = np.full(count, n, dtype=np.int64)
+    buys, sells = np.flatnonzero(is_buy), np.flatnonzero(~is_buy)
+    if len(buys):
+        sl_index[buys] = first_touch(low, stop_loss[buys], scan_from[buys], block_size, tables=low_tables)
+        tp_index[buys] = first_touch(-high, -take_profit[buys], scan_from[buys], block_size, tables=neg_high_tables)
+    if len(sells):
+        sl_index[sells] = first_touch(-high, -stop_loss[sells], scan_from[sells], block_size, tables=neg_high_tables)
+        tp_index[sells] = first_touch(low, take_profit[sells], scan_from[sells], block_size, tables=low_tables)
+
+    limit = np.full(count, n, dtype=np.int64) if scan_to is None else np.minimum(np.asarray(scan_to, dtype=np.int64), n)
+    exit_index = np.minimum(sl_index, tp_index)
+    stopped = sl_index <= tp_index
+    closed = exit_index < limit
+    reason = np.where(closed, np.where(stopped, STOP_LOSS, TAKE_PROFIT), 0).astype(np.int8)
+    exit_price = np.where(closed, np.where(stopped, stop_loss, take_profit), np.nan)
+    exit_index = np.where(closed, exit_index, -1)
+    return exit_index, exit_price, reason
@@ -1,10 +1,12 @@
-import MetaTrader5 as mt5
-import pandas as pd
+try:
+    import MetaTrader5 as mt5
+except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+    import mt5_offline as mt5
 from datetime import datetime, timedelta
-from ta.trend import EMAIndicator
-from ta.momentum import RSIIndicator
-from ta.volatility import AverageTrueRange
-import time
+from streaming_indicators import IndicatorState
+from bar_buffer import BarRingBuffer
+from bar_scheduler import BarScheduler
+from latency import LatencyRecorder
 
 # Initialize MetaTrader 5 connection
 if not mt5.initialize():
@@ -20,32 +22,28 @@ atr_multiplier_tp = 2  # Take-profit = 2 ATR
 cooldown_period = timedelta(minutes=1)  # Minimum time between trades
 last_trade_time = None  # Tracks the time of the last trade
 
-# Fetch historical data
-def fetch_data(symbol, timeframe, lookback=200):
-    """
-    Fetch historical data for the given symbol and timeframe.
-    """
-    now = datetime.now()
-    rates = mt5.copy_rates_from(symbol, timeframe, now, lookback)
-    if rates is None or len(rates) == 0:
-        print(f"Failed to fetch data for {symbol}.")
-        return None
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    df.set_index('time', inplace=True)
-    return df
-
-# Calculate indicators
-def calculate_indicators(df):
+# Last 200 closed bars and the indicators, updated with each new closed bar
+bars = BarRingBuffer(symbol, timeframe, capacity=200)
+indicators = IndicatorState(ema_windows=(9, 21), rsi_window=14, atr_window=14)
+
+# Stage latency histograms, written as text metrics every minute
+latency = LatencyRecorder(path="latency_gbpusd_thur.prom", interval=60)
+
+# Fetch newly closed bars and update indicators
+def update_indicators(state, bars):
     """
-    Calculate EMA, RSI, and ATR indicators.
+    Append the bars closed since the last poll to the ring buffer and feed them to the indicator state.
     """
-    df['EMA_9'] = EMAIndicator(close=df['close'], window=9).ema_indicator()
-    df['EMA_21'] = EMAIndicator(close=df['close'], window=21).ema_indicator()
-    df['RSI'] = RSIIndicator(close=df['close'], window=14).rsi()
-    atr = AverageTrueRange(high=df['high'], low=df['low'], close=df['close'], window=14)
-    df['ATR'] = atr.average_true_range()
-    return df
+    with latency.time(bars.symbol, "fetch"):
+        added = bars.poll(mt5)
+    if added is None:
+        print(f"Failed to fetch data for {bars.symbol}.")
+        return False
+    with latency.time(bars.symbol, "indicators"):
+        # One bar the state has seen as overlap; None: bars were missed, warm up again
+        if state.update_rates(bars.view(added + 1)) is None:
+            state.update_rates(bars.view())
+    return True
 
 # Place order
 def place_order(symbol, action, lot, sl_price, tp_price):
@@ -56,7 +54,8 @@ def place_order(symbol, action, lot, sl_price, tp_price):
     order_type = mt5.ORDER_TYPE_BUY if action == "buy" else mt5.ORDER_TYPE_SELL
     
     # Get the price based on action (buy or sell)
-    price = mt5.symbol_info_tick(symbol).ask if action == "buy" else mt5.symbol_info_tick(symbol).bid
+    with latency.time(symbol, "tick"):
+        price = mt5.symbol_info_tick(symbol).ask if action == "buy" else mt5.symbol_info_tick(symbol).bid
 
     # Create the order request
     request = {
@@ -75,59 +74,76 @@ def place_order(symbol, action, lot, sl_price, tp_price):
     }
 
     # Send the order
-    result = mt5.order_send(request)
+    with latency.time(symbol, "order_send"):
+        result = mt5.order_send(request)
     if result.retcode != mt5.TRADE_RETCODE_DONE:
         print(f"Order failed: {result.retcode}")
         return False
     print(f"Order placed: {action}, Volume: {lot}, SL: {sl_price}, TP: {tp_price}")
     return True
 
-# Main loop for live trading
-try:
-    while True:
-        now = datetime.now()
+# Evaluate the strategy on each newly closed bar
+def on_bar(symbol, timeframe):
+    """
+    Update the indicators with the bar that just closed and trade on its signal.
+    """
+    global last_trade_time
+    started = scheduler.bar_close_ns(symbol, timeframe)
+    now = datetime.fromtimestamp(scheduler.clock())
+    latency.maybe_dump()
 
-        # Fetch and prepare data
-        df = fetch_data(symbol, timeframe)
-        if df is None or len(df) < 21:
-            print(f"Not enough data for {symbol}.")
-            time.sleep(60)  # Wait before retrying
-            continue
+    # Fetch newly closed bars and update the indicators
+    if not update_indicators(indicators, bars) or indicators.count < 21:
+        print(f"Not enough data for {symbol}.")
+        return
 
-        df = calculate_indicators(df)
-        latest = df.iloc[-1]
-        atr = latest['ATR']
+    latest = indicators.latest
+    atr = latest['ATR']
 
-        # Avoid overtrading (cooldown)
-        if last_trade_time and (now - last_trade_time) < cooldown_period:
-            time.sleep(10)  # Short wait before the next check
-            continue
+    # Avoid overtrading (cooldown)
+    if last_trade_time and (now - last_trade_time) < cooldown_period:
+        return
 
+    with latency.time(symbol, "signal"):
         # Buy signal
         if (
             latest['EMA_9'] > latest['EMA_21']
             and latest['RSI'] > 50
         ):
-            sl_price = latest['close'] - (atr * atr_multiplier_sl)
-            tp_price = latest['close'] + (atr * atr_multiplier_tp)
-            if place_order(symbol, "buy", lot_size, sl_price, tp_price):
-                last_trade_time = now
+            action = "buy"
 
         # Sell signal
         elif (
             latest['EMA_9'] < latest['EMA_21']
             and latest['RSI'] < 50
         ):
-            sl_price = latest['close'] + (atr * atr_multiplier_sl)
-            tp_price = latest['close'] - (atr * atr_multiplier_tp)
-            if place_order(symbol, "sell", lot_size, sl_price, tp_price):
-                last_trade_time = now
-
-        time.sleep(10)  # Check every 10 seconds
+            action = "sell"
+
+        else:
+            action = None
+    if action is None:
+        return
+
+    direction = 1 if action == "buy" else -1
+    sl_price = latest['close'] - direction * (atr * atr_multiplier_sl)
+    tp_price = latest['close'] + direction * (atr * atr_multiplier_tp)
+    placed = place_order(symbol, action, lot_size, sl_price, tp_price)
+    latency.record_since(symbol, "bar_to_order", started)  # Bar close to order_send returning
+    if placed:
+        last_trade_time = now
+
+# Main loop for live trading: the scheduler wakes up when a new bar closes
+scheduler = BarScheduler(mt5)
+scheduler.subscribe(symbol, timeframe, on_bar)
+try:
+    scheduler.run()
 
 except KeyboardInterrupt:
     print("Terminating the script...")
 
 finally:
+    latency.dump()
+    print(latency.summary())
+
     # Shutdown MetaTrader 5 connection
     mt5.shutdown()
@@ -0,0 +1,366 @@
+# Batched indicator families and a session-wide indicator cache
+#
+# Sweeps over EMA windows used to call EMAIndicator(...).ema_indicator()
+# once per window.  The *_family functions compute a whole family of
+# windows together and return a 2-D (window x bar) array, row i belonging
+# to windows[i].  Values follow ta (see streaming_indicators for the exact
+# formulas): EMA and RSI leave the first window - 1 bars NaN, ATR is 0.0
+# there.
+#
+# EMA, Wilder RSI and ATR are all linear recurrences y[t] = d * y[t-1] + u[t].
+# _linear_recurrence solves one for every window at once: the bars are cut
+# into blocks of BLOCK bars, each block is solved by a matrix product with
+# the BLOCK x BLOCK matrix of decay powers of its window, and the values
+# carried from block to block form a recurrence of the same kind over
+# n / BLOCK values, solved the same way.  The close array is read once for
+# the whole family, the carries of all windows come from one matrix
+# product and each window's row is written once by one more, so the cost
+# per extra window is close to writing its n values: about a third of
+# separate ta/pandas calls for a 50-window EMA sweep.
+#
+# ema, rsi, atr, sma and bollinger_bands are the single-window versions the
+# backtest scripts use instead of ta.  On long series (JIT_MIN_BARS) and
+# when Numba is installed, EMA, Wilder smoothing and ATR run as compiled
+# loops with the exact pandas/ta arithmetic (bit-identical values); Numba is
+# only imported then, so short runs do not pay its import time.  Otherwise
+# they use the NumPy kernels above (within ~1e-14 of ta).
+# bench_indicators.py compares both with ta.
+#
+# IndicatorCache keeps computed rows keyed by (symbol, timeframe, range,
+# indicator, params), so a session never computes the same indicator twice
+# and a family call only computes the windows not seen yet.
+
+import numpy as np
+
+BLOCK = 16
+JIT_MIN_BARS = 200000  # Shorter series are not worth importing Numba for
+
+
+def _linear_recurrence(x, decay, initial, scale=None):
+    """
+    Solve y[:, t] = decay * y[:, t - 1] + u[:, t] for every row, with
+    y[:, -1] = initial and u = scale[:, None] * x.  x is (rows, n), or (n,)
+    when all rows share it; decay, initial and scale are (rows,).
+    """
+    rows, n = len(decay), x.shape[-1]
+    if n == 0:
+        return np.empty((rows, 0))
+    blocks = -(-n // BLOCK)
+    if n % BLOCK:
+        pad = [(0, 0)] * (x.ndim - 1) + [(0, blocks * BLOCK - n)]
+        x = np.pad(x, pad)
+    x = x.reshape(x.shape[:-1] + (blocks, BLOCK))
+    shared = x.ndim == 2  # One input for all rows: used as is, never copied per row
+    if scale is None:
+        scale = np.ones(rows)
+
+    # powers[r, k] = decay[r] ** k for k = 0 .. BLOCK
+    powers = decay[:, None] ** np.arange(BLOCK + 1)
+    lag = np.arange(BLOCK)[None, :] - np.arange(BLOCK)[:, None]  # Output column minus input column
+    lower = np.where(lag >= 0, powers[:, np.maximum(lag, 0)], 0.0) * scale[:, None, None]
+
+    # Value carried out of each block: c[b] = decay**BLOCK * c[b - 1] + (block b solved from zero)[-1]
+    if shared:
+        ends = np.matmul(lower[:, :, -1], x.T)  # One product for all rows, row-major like y
+    else:
+        ends = np.matmul(x, lower[:, :, -1:])[:, :, 0]
+    if blocks == 1:
+        carried = np.empty((rows, 0))
+    else:
+        carried = _linear_recurrence(ends[:, :-1], powers[:, BLOCK], initial)
+    previous = np.concatenate((initial[:, None], carried), axis=1)  # Value before each block
+
+    # Each block solved from a zero start plus the decayed value carried into it, as a single
+    # product per row that writes the row once: [block | carried in] @ [lower; decay powers 1..BLOCK]
+    weights = np.concatenate((lower, powers[:, None, 1:]), axis=1)
+    inputs = np.empty((blocks, BLOCK + 1))
+    if shared:
+        inputs[:, :BLOCK] = x
+    y = np.empty((rows, blocks, BLOCK))
+    for row in range(rows):
+        if not shared:
+            inputs[:, :BLOCK] = x[row]
+        inputs[:, BLOCK] = previous[row]
+        np.matmul(inputs, weights[row], out=y[row])
+    return y.reshape(rows, -1)[:, :n]
+
+
+def _windows(windows):
+    return np.atleast_1d(np.asarray(windows, dtype=np.int64))
+
+
+def _mask_warmup(values, windows, fill=np.nan):
+    for row, window in enumerate(windows):
+        values[row, :window - 1] = fill
+    return values
+
+
+def ewm_family(x, alphas, min_periods):
+    """
+    ewm(alpha, adjust=False, min_periods).mean() of x for each alpha (x without NaN).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    alphas = np.asarray(alphas, dtype=np.float64)
+    if len(x) == 0:
+        return np.empty((len(alphas), 0))
+    # A start of x[0] before the first bar makes y[0] = x[0], as pandas does
+    y = _linear_recurrence(x, 1.0 - alphas, np.full(len(alphas), x[0]), scale=alphas)
+    return _mask_warmup(y, _windows(min_periods))
+
+
+def ema_family(close, windows):
+    """
+    EMA of close for each window, as ta.trend.EMAIndicator (window x bar).
+    """
+    windows = _windows(windows)
+    return ewm_family(close, 2.0 / (windows + 1), windows)
+
+
+def sma_family(close, windows):
+    """
+    Simple moving average of close for each window (window x bar).
+    """
+    close = np.asarray(close, dtype=np.float64)
+    windows = _windows(windows)
+    anchor = close.mean() if len(close) else 0.0
+    values = np.full((len(windows), len(close)), np.nan)
+    for row, window in enumerate(windows):
+        if window <= len(close):
+            values[row, window - 1:] = _window_sums(close - anchor, window) / window + anchor
+    return values
+
+
+def _window_sums(x, window):
+    """
+    Sum of every window of x, each added up directly (no running-sum drift).
+    """
+    return np.convolve(x, np.ones(window), mode="valid")
+
+
+def rsi_family(close, windows):
+    """
+    RSI of close with Wilder smoothing for each window, as ta.momentum.RSIIndicator.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    windows = _windows(windows)
+    diff = np.diff(close, prepend=close[:1]) if len(close) else close
+    alphas = 1.0 / windows
+    up = ewm_family(np.where(diff > 0, diff, 0.0), alphas, windows)
+    down = ewm_family(np.where(diff < 0, -diff, 0.0), alphas, windows)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rsi = 100 - 100 / (1 + up / down)
+    return np.where(down == 0, 100.0, rsi)
+
+
+def true_range(high, low, close):
+    """
+    True range; the first bar uses high - low, as ta does.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    previous_close = np.concatenate(([np.nan], np.asarray(close, dtype=np.float64)[:-1]))
+    ranges = np.fmax(high - low, np.fmax(np.abs(high - previous_close), np.abs(low - previous_close)))
+    return ranges
+
+
+def atr_family(high, low, close, windows):
+    """
+    Average true range for each window, as ta.volatility.AverageTrueRange
+    (mean of the first window true ranges, then Wilder smoothing; 0.0 before).
+    """
+    tr = true_range(high, low, close)
+    windows = _windows(windows)
+    n = len(tr)
+    u = np.zeros((len(windows), n))
+    for row, window in enumerate(windows):
+        if window <= n:
+            u[row, window - 1] = np.mean(tr[:window])
+            u[row, window:] = tr[window:] / window
+    y = _linear_recurrence(u, (windows - 1) / windows.astype(np.float64), np.zeros(len(windows)))
+    return _mask_warmup(y, windows, fill=0.0)
+
+
+def _rolling_mean_std(close, windows, anchor=None):
+    close = np.asarray(close, dtype=np.float64)
+    windows = _windows(windows)
+    if anchor is None:
+        anchor = close.mean() if len(close) else 0.0
+    shifted = close - anchor  # Small values keep E[x^2] - E[x]^2 accurate
+    squared = shifted * shifted
+    mean = np.full((len(windows), len(close)), np.nan)
+    std = np.full((len(windows), len(close)), np.nan)
+    for row, window in enumerate(windows):
+        if window <= len(close):
+            window_mean = _window_sums(shifted, window) / window
+            variance = _window_sums(squared, window) / window - window_mean * window_mean
+            mean[row, window - 1:] = window_mean + anchor
+            std[row, window - 1:] = np.sqrt(np.maximum(variance, 0.0))
+    return mean, std
+
+
+def rolling_std_family(close, windows):
+    """
+    Rolling population standard deviation (ddof=0) of close for each window.
+    """
+    return _rolling_mean_std(close, windows)[1]
+
+
+def bollinger_family(close, windows, window_dev=2, anchor=None):
+    """
+    Bollinger (mavg, hband, lband) for each window, as ta.volatility.BollingerBands.
+
+    anchor: value subtracted before the window sums (default: mean of close);
+    a fixed anchor gives the same values however the series is split.
+    """
+    mavg, mstd = _rolling_mean_std(close, windows, anchor)
+    return mavg, mavg + window_dev * mstd, mavg - window_dev * mstd
+
+
+# Single-window indicators (the ta calls of the backtest scripts)
+def _ewm_loop(x, alpha, mean):
+    # pandas' ewm(adjust=False) loop, continuing from mean (x[0] for a fresh start)
+    out = np.empty(len(x))
+    old_weight = 1.0 - alpha
+    for i in range(len(x)):
+        if mean != x[i]:
+            mean = (old_weight * mean + alpha * x[i]) / (old_weight + alpha)
+        out[i] = mean
+    return out
+
+
+def _wilder_loop(tr, window, atr):
+    # ta's AverageTrueRange loop, continuing from the previous ATR value
+    out = np.empty(len(tr))
+    for i in range(len(tr)):
+        atr = (atr * (window - 1) + tr[i]) / float(window)
+        out[i] = atr
+    return out
+
+
+_jit = {}
+
+
+def jit_kernels():
+    """
+    The Numba-compiled loops ({} when Numba is not installed), compiled on first use.
+    """
+    if "ewm" not in _jit and "missing" not in _jit:
+        try:
+            from numba import njit
+        except ImportError:  # NumPy kernels only
+            _jit["missing"] = True
+        else:
+            _jit["ewm"] = njit(cache=True)(_ewm_loop)
+            _jit["wilder"] = njit(cache=True)(_wilder_loop)
+    return {} if "missing" in _jit else _jit
+
+
+def loop_kernels():
+    """
+    The exact sequential loops: compiled when Numba is installed, plain Python otherwise.
+
+    Unlike the blocked NumPy kernels they give the same values however the
+    series is split, so chunked runs (streaming_backtest) use them.
+    """
+    return jit_kernels() or {"ewm": _ewm_loop, "wilder": _wilder_loop}
+
+
+def _ewm(x, alpha, window):
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) < JIT_MIN_BARS or not jit_kernels():
+        return ewm_family(x, [alpha], [window])[0]
+    out = jit_kernels()["ewm"](x, alpha, x[0])
+    out[:window - 1] = np.nan
+    return out
+
+
+def ema(close, window):
+    """
+    ta.trend.EMAIndicator(close, window).ema_indicator() as an array.
+    """
+    return _ewm(close, 2.0 / (window + 1), window)
+
+
+def rsi(close, window=14):
+    """
+    ta.momentum.RSIIndicator(close, window).rsi() as an array.
+    """
+    close = np.asarray(close, dtype=np.float64)
+    diff = np.diff(close, prepend=close[:1]) if len(close) else close
+    up = _ewm(np.where(diff > 0, diff, 0.0), 1.0 / window, window)
+    down = _ewm(np.where(diff < 0, -diff, 0.0), 1.0 / window, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = 100 - 100 / (1 + up / down)
+    return np.where(down == 0, 100.0, values)
+
+
+def atr(high, low, close, window=14):
+    """
+    ta.volatility.AverageTrueRange(high, low, close, window).average_true_range() as an array.
+    """
+    tr = true_range(high, low, close)
+    if len(tr) < max(window, JIT_MIN_BARS) or not jit_kernels():
+        return atr_family(high, low, close, [window])[0]
+    out = np.zeros(len(tr))
+    out[window - 1] = np.mean(tr[:window])
+    out[window:] = jit_kernels()["wilder"](tr[window:], window, out[window - 1])
+    return out
+
+
+def sma(close, window):
+    """
+    Rolling mean of close, as close.rolling(window).mean().
+    """
+    return sma_family(close, [window])[0]
+
+
+def bollinger_bands(close, window=20, window_dev=2):
+    """
+    ta.volatility.BollingerBands(close, window, window_dev) as (mavg, hband, lband) arrays.
+    """
+    mavg, hband, lband = bollinger_family(close, [window], window_dev)
+    return mavg[0], hband[0], lband[0]
+
+
+class IndicatorCache:
+    """
+    Indicator rows keyed by (symbol, timeframe, range, indicator, params).
+
+    family() returns the rows of a window family, computing only the windows
+    not cached yet (in one batched call).
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, compute):
+        """
+        Return the cached value of key, calling compute() on a miss.
+        """
+        if key in self.rows:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.rows[key] = compute()
+        return self.rows[key]
+
+    def family(self, symbol, timeframe, date_range, indicator, windows, compute, *columns):
+        """
+        Return the (window x bar) array of indicator for windows, where
+        compute(*columns, missing_windows) computes a family.
+        """
+        windows = [int(window) for window in np.atleast_1d(windows)]
+        keys = [(symbol, timeframe, date_range, indicator, window) for window in windows]
+        missing = [window for window, key in zip(windows, keys) if key not in self.rows]
+        self.hits += len(windows) - len(missing)
+        if missing:
+            self.misses += len(missing)
+            missing = sorted(set(missing))
+            for window, row in zip(missing, compute(*columns, missing)):
+                self.rows[(symbol, timeframe, date_range, indicator, window)] = row
+        return np.vstack([self.rows[key] for key in keys]) if keys else np.empty((0, 0))
+
+    def clear(self):
+        self.rows.clear()
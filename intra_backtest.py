@@ -1,10 +1,14 @@
-import MetaTrader5 as mt5
+try:
+    import MetaTrader5 as mt5
+except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+    import mt5_offline as mt5
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from ta.trend import EMAIndicator
-from ta.momentum import RSIIndicator
-from ta.volatility import AverageTrueRange
 import matplotlib.pyplot as plt
+import bar_cache
+import indicators
+import backtest_engine
 
 # Initialize MetaTrader 5 connection
 if not mt5.initialize():
@@ -28,7 +32,7 @@ def fetch_historical_data(symbol, timeframe, start_date, end_date):
     """
     Fetch historical data for the given symbol and timeframe.
     """
-    rates = mt5.copy_rates_range(symbol, timeframe, start_date, end_date)
+    rates = bar_cache.copy_rates_range(mt5, symbol, timeframe, start_date, end_date)
     if rates is None or len(rates) == 0:
         print(f"No data available for {symbol} in the given date range.")
         return None
@@ -42,11 +46,10 @@ def calculate_indicators(df):
     """
     Calculate EMA, RSI, and ATR indicators.
     """
-    df['EMA_20'] = EMAIndicator(close=df['close'], window=20).ema_indicator()
-    df['EMA_50'] = EMAIndicator(close=df['close'], window=50).ema_indicator()
-    df['RSI'] = RSIIndicator(close=df['close'], window=14).rsi()
-    atr = AverageTrueRange(high=df['high'], low=df['low'], close=df['close'], window=14)
-    df['ATR'] = atr.average_true_range()
+    df['EMA_20'] = indicators.ema(df['close'], 20)
+    df['EMA_50'] = indicators.ema(df['close'], 50)
+    df['RSI'] = indicators.rsi(df['close'], 14)
+    df['ATR'] = indicators.atr(df['high'], df['low'], df['close'], 14)
     return df
 
 # Backtest function
@@ -55,68 +58,30 @@ def backtest_strategy(df):
     Backtest the intraday strategy using historical data.
     """
     initial_balance = 10000  # Starting capital in USD
-    balance = initial_balance
-    positions = []
-    equity_curve = []  # To store the balance over time
-
-    for i in range(50, len(df)):  # Start after sufficient data for indicators
-        row = df.iloc[i]
-        atr = row['ATR']
-        if pd.isna(atr):  # Skip if ATR is not available
-            continue
-
-        # Close open positions by session end
-        current_time = row.name
-        if current_time.hour >= session_close_time and positions:
-            for position in positions:
-                entry_price, sl, tp, direction = position
-                if direction == "buy":
-                    balance += (row['close'] - entry_price) * 100000 * lot_size
-                elif direction == "sell":
-                    balance += (entry_price - row['close']) * 100000 * lot_size
-            positions = []  # Clear all positions
-            continue
-
-        # Close open positions with SL/TP
-        closed_positions = []
-        for position in positions:
-            entry_price, sl, tp, direction = position
-            if direction == "buy":
-                if row['low'] <= sl:  # Stop-loss hit
-                    balance -= (entry_price - sl) * 100000 * lot_size
-                    closed_positions.append(position)
-                elif row['high'] >= tp:  # Take-profit hit
-                    balance += (tp - entry_price) * 100000 * lot_size
-                    closed_positions.append(position)
-            elif direction == "sell":
-                if row['high'] >= sl:  # Stop-loss hit
-                    balance -= (sl - entry_price) * 100000 * lot_size
-                    closed_positions.append(position)
-                elif row['low'] <= tp:  # Take-profit hit
-                    balance += (entry_price - tp) * 100000 * lot_size
-                    closed_positions.append(position)
-
-        for position in closed_positions:
-            positions.remove(position)
-
-        # Entry signals
-        if row['EMA_20'] > row['EMA_50'] and row['RSI'] > 50:
-            # Buy signal
-            entry_price = row['close']
-            sl = entry_price - (atr * atr_multiplier_sl)
-            tp = entry_price + (atr * atr_multiplier_tp)
-            positions.append((entry_price, sl, tp, "buy"))
-        elif row['EMA_20'] < row['EMA_50'] and row['RSI'] < 50:
-            # Sell signal
-            entry_price = row['close']
-            sl = entry_price + (atr * atr_multiplier_sl)
-            tp = entry_price - (atr * atr_multiplier_tp)
-            positions.append((entry_price, sl, tp, "sell"))
-
-        # Track equity
-        equity_curve.append(balance)
-
-    return initial_balance, balance, equity_curve
+    close = df['close'].to_numpy()
+    atr = df['ATR'].to_numpy()
+    ema_20 = df['EMA_20'].to_numpy()
+    ema_50 = df['EMA_50'].to_numpy()
+    rsi = df['RSI'].to_numpy()
+
+    # Entry signals
+    buy_signal = (ema_20 > ema_50) & (rsi > 50)
+    sell_signal = (ema_20 < ema_50) & (rsi < 50)
+    stop_loss = np.where(buy_signal, close - (atr * atr_multiplier_sl), close + (atr * atr_multiplier_sl))
+    take_profit = np.where(buy_signal, close + (atr * atr_multiplier_tp), close - (atr * atr_multiplier_tp))
+
+    # Positions are closed by SL/TP (SL first) or at the close of the first
+    # bar at or after the session end, whichever comes first
+    result = backtest_engine.simulate(
+        df['high'].to_numpy(), df['low'].to_numpy(), close,
+        buy_signal, sell_signal, stop_loss, take_profit,
+        start=50,  # Start after sufficient data for indicators
+        valid=~np.isnan(atr),  # Skip bars where ATR is not available
+        session_close=df.index.hour >= session_close_time,
+        lot_size=lot_size,
+        initial_balance=initial_balance,
+    )
+    return initial_balance, result.final_balance, result.equity_curve
 
 # Main execution
 df = fetch_historical_data(symbol, timeframe, start_date, end_date)
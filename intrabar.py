@@ -0,0 +1,204 @@
+# Intrabar stop-loss/take-profit resolution from lower-timeframe data
+#
+# On H4 or W1 bars a position's stop-loss and take-profit are often both
+# inside one bar's range, and the backtests count such a bar as a
+# stop-loss (the loops checked SL first).  IntrabarResolver looks at what
+# actually happened first, for those ambiguous exits only: the exit bar is
+# mapped to its slice of M1 bars (bar open to bar close, from the bar
+# store) and the first M1 bar touching either level decides.  M1 bars that
+# touch both levels themselves can be resolved from stored ticks
+# (tick_store) with use_ticks=True; without lower-timeframe data an exit
+# stays a stop-loss.
+#
+#     resolver = IntrabarResolver(mt5, "EURUSD", df.index.to_numpy(), mt5.TIMEFRAME_H4)
+#     result = backtest_engine.simulate(..., intrabar=resolver)
+#     print(resolver.summary())
+#
+# Only the months holding ambiguous exit bars are read, and only their
+# slices are scanned, so the cost is proportional to the few ambiguous
+# bars rather than to the whole history.
+
+import numpy as np
+
+import bar_cache
+import tick_store
+from exit_kernel import first_exits
+from multi_timeframe import _seconds, bar_close
+from timeframes import TIMEFRAMES, timeframe_seconds
+from backtest_engine import STOP_LOSS, TAKE_PROFIT
+
+
+def both_touched(high, low, direction, stop_loss, take_profit):
+    """
+    Mask of bars whose range reaches both the stop-loss and the take-profit
+    of a position (direction 1 = buy, -1 = sell).
+    """
+    is_buy = np.asarray(direction) > 0
+    sl_hit = np.where(is_buy, low <= stop_loss, high >= stop_loss)
+    tp_hit = np.where(is_buy, high >= take_profit, low <= take_profit)
+    return sl_hit & tp_hit
+
+
+def slice_index(lower_times, opens, closes):
+    """
+    Index from higher-timeframe bars to the lower-timeframe bars inside them:
+    (lo, hi) such that lower bars lo[k]:hi[k] opened in [opens[k], closes[k]).
+    """
+    return (np.searchsorted(lower_times, opens, side="left"),
+            np.searchsorted(lower_times, closes, side="left"))
+
+
+def gather(lo, hi):
+    """
+    Concatenated indices of the ranges lo[k]:hi[k], and the offset of each range in them.
+    """
+    lengths = np.maximum(hi - lo, 0)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    index = np.repeat(lo - offsets[:-1], lengths) + np.arange(offsets[-1])
+    return index, offsets
+
+
+class IntrabarResolver:
+    """
+    Resolves exits on bars touching both SL and TP from lower-timeframe bars.
+
+    times: open times of the bars the backtest indexes (e.g. df.index).
+    timeframe: timeframe of those bars.
+    lower_timeframe: timeframe drilled into (default M1); None resolves
+        straight from ticks (for backtests on M1 bars).
+    use_ticks: resolve lower-timeframe bars that are ambiguous themselves
+        from the tick store.
+    mt5: terminal (or mt5_offline) that missing lower-timeframe months are
+        fetched from; None reads the local stores only.
+    """
+
+    def __init__(self, mt5, symbol, times, timeframe, lower_timeframe=TIMEFRAMES["M1"], use_ticks=False,
+                 cache_dir=None):
+        self.mt5 = mt5
+        self.symbol = symbol
+        self.opens = _seconds(times)
+        self.closes = bar_close(self.opens, timeframe)
+        self.lower_timeframe = lower_timeframe
+        self.use_ticks = use_ticks or lower_timeframe is None
+        self.cache_dir = cache_dir
+        self.months = {}  # Lower-timeframe bars of each month read so far
+        self.days = {}  # Ticks of each day read so far
+        self.ambiguous = 0  # Exits on bars touching both levels
+        self.resolved = 0  # ... whose order the lower-timeframe data decided
+        self.take_profits = 0  # ... that turned out to be take-profits
+
+    def lower_bars(self, bars):
+        """
+        Lower-timeframe bars of the months the given bars fall in (only
+        those), read one month partition at a time and kept for later calls.
+        """
+        keys = {}
+        for first, last in zip(self.opens[bars], self.closes[bars] - 1):
+            keys.update((key, (month_first, month_last))
+                        for key, month_first, month_last in bar_cache.month_keys(int(first), int(last)))
+        parts = []
+        for key in sorted(keys):
+            if key not in self.months:
+                rates = bar_cache.load_month(self.mt5, self.symbol, self.lower_timeframe, key, *keys[key],
+                                             self.cache_dir)
+                self.months[key] = rates if rates is not None else np.empty(0, dtype=bar_cache.RATES_DTYPE)
+            parts.append(self.months[key])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=bar_cache.RATES_DTYPE)
+
+    def _ticks(self, first, last):
+        # Ticks in [first, last] epoch seconds, read one day partition at a time
+        parts = []
+        for key, day_first, day_last in tick_store.day_keys(first, last):
+            if key not in self.days:
+                ticks = tick_store.load_day(self.mt5, self.symbol, key, day_first, day_last, self.cache_dir)
+                self.days[key] = ticks if ticks is not None else np.empty(0, dtype=tick_store.TICKS_DTYPE)
+            parts.append(self.days[key])
+        ticks = np.concatenate(parts)
+        lo = np.searchsorted(ticks["time_msc"], first * 1000, side="left")
+        hi = np.searchsorted(ticks["time_msc"], last * 1000 + 999, side="right")
+        return ticks[lo:hi]
+
+    def _first_touch(self, high, low, lo, hi, direction, stop_loss, take_profit):
+        # First bar of each range lo:hi touching a level: found, price, reason, whether that
+        # bar touches both levels, and its index
+        index, offsets = gather(lo, hi)
+        exit_at, price, reason = first_exits(high[index], low[index], direction, stop_loss, take_profit,
+                                             offsets[:-1], scan_to=offsets[1:])
+        found = exit_at >= 0
+        at = np.full(len(found), -1, dtype=np.int64)
+        at[found] = index[exit_at[found]]
+        both = np.zeros(len(found), dtype=bool)
+        both[found] = both_touched(high[at[found]], low[at[found]], direction[found], stop_loss[found],
+                                   take_profit[found])
+        return found, price, reason, both, at
+
+    def _resolve_ticks(self, starts, ends, direction, stop_loss, take_profit):
+        # First tick touching a level in each [starts[k], ends[k]) second range, by bid
+        found = np.zeros(len(starts), dtype=bool)
+        price = np.full(len(starts), np.nan)
+        reason = np.zeros(len(starts), dtype=np.int8)
+        for k, (first, end) in enumerate(zip(starts, ends)):
+            bid = self._ticks(int(first), int(end) - 1)["bid"]
+            bid = bid[bid > 0]
+            if len(bid) == 0:
+                continue
+            hit, level, why = first_exits(bid, bid, direction[k:k + 1], stop_loss[k:k + 1], take_profit[k:k + 1], [0])
+            found[k], price[k], reason[k] = hit[0] >= 0, level[0], why[0]
+        return found, price, reason
+
+    def resolve(self, exit_index, direction, stop_loss, take_profit, high, low, exit_price, reason,
+                entry_index=None):
+        """
+        Re-decide the exits of positions whose exit bar touched both levels.
+
+        exit_index, direction, stop_loss, take_profit, exit_price, reason:
+            one value per position, as from exit_kernel.first_exits().
+        high, low: the bars exit_index points into.
+        entry_index: bar of each entry.  An exit on the entry bar itself
+            (check_entry_bar) stays SL first: the entry is made at that bar's
+            close, after all of its lower-timeframe bars.
+        Returns (exit_price, reason) with the resolved exits changed.
+        """
+        exit_index = np.asarray(exit_index)
+        direction = np.asarray(direction)
+        stop_loss = np.asarray(stop_loss, dtype=np.float64)
+        take_profit = np.asarray(take_profit, dtype=np.float64)
+        exit_price, reason = np.array(exit_price, dtype=np.float64), np.array(reason)
+        closed = (exit_index >= 0) & np.isin(reason, (STOP_LOSS, TAKE_PROFIT))
+        if entry_index is not None:
+            closed &= exit_index != np.asarray(entry_index)
+        closed = np.flatnonzero(closed)
+        bars = exit_index[closed]
+        ambiguous = closed[both_touched(np.asarray(high)[bars], np.asarray(low)[bars], direction[closed],
+                                        stop_loss[closed], take_profit[closed])]
+        self.ambiguous += len(ambiguous)
+        if len(ambiguous) == 0:
+            return exit_price, reason
+
+        bars = exit_index[ambiguous]
+        dirs, sls, tps = direction[ambiguous], stop_loss[ambiguous], take_profit[ambiguous]
+        if self.lower_timeframe is None:
+            found, price, why = self._resolve_ticks(self.opens[bars], self.closes[bars], dirs, sls, tps)
+        else:
+            lower = self.lower_bars(bars)
+            lo, hi = slice_index(lower["time"], self.opens[bars], self.closes[bars])
+            found, price, why, both, at = self._first_touch(lower["high"], lower["low"], lo, hi, dirs, sls, tps)
+            # The first lower bar touching a level can touch both itself: SL first unless ticks say otherwise
+            found &= ~both
+            if self.use_ticks and both.any():
+                again = np.flatnonzero(both)
+                starts = lower["time"][at[again]]
+                ticks_found, ticks_price, ticks_why = self._resolve_ticks(
+                    starts, starts + timeframe_seconds(self.lower_timeframe), dirs[again], sls[again], tps[again])
+                found[again], price[again], why[again] = ticks_found, ticks_price, ticks_why
+
+        resolved = ambiguous[found]
+        exit_price[resolved] = price[found]
+        reason[resolved] = why[found]
+        self.resolved += len(resolved)
+        self.take_profits += int((why[found] == TAKE_PROFIT).sum())
+        return exit_price, reason
+
+    def summary(self):
+        return (f"{self.symbol}: {self.ambiguous} exits on bars touching SL and TP, {self.resolved} resolved "
+                f"from lower-timeframe data ({self.take_profits} take-profits)")
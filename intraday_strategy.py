@@ -1,7 +1,13 @@
-import MetaTrader5 as mt5
+try:
+    import MetaTrader5 as mt5
+except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+    import mt5_offline as mt5
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
+import bar_cache
+import backtest_engine
 
 # Initialize MetaTrader 5 connection
 if not mt5.initialize():
@@ -18,7 +24,7 @@ start_time = datetime(today.year, today.month, today.day, 0, 0)  # Start of day
 end_time = datetime(today.year, today.month, today.day, 23, 59)  # End of day
 
 # Fetch historical data for the day
-rates = mt5.copy_rates_range(symbol, timeframe, start_time, end_time)
+rates = bar_cache.copy_rates_range(mt5, symbol, timeframe, start_time, end_time)
 if rates is None:
     print("Failed to fetch historical data")
     mt5.shutdown()
@@ -36,63 +42,42 @@ df['SMA_30'] = df['close'].rolling(window=30).mean()
 # Define trading parameters
 lot_size = 0.1  # Lot size per trade
 initial_balance = 10000  # Initial capital in USD
-balance = initial_balance
 stop_loss_pips = 10  # Stop-loss in pips
 take_profit_pips = 20  # Take-profit in pips
-positions = []  # Track open positions
-equity_curve = []  # Track balance over time
 
 # Backtest intraday strategy
-for i in range(30, len(df)):
-    # Check for buy signal
-    if df['SMA_10'][i] > df['SMA_30'][i] and df['SMA_10'][i - 1] <= df['SMA_30'][i - 1]:
-        entry_price = df['close'][i]
-        stop_loss = entry_price - stop_loss_pips * 0.0001  # Convert pips to price
-        take_profit = entry_price + take_profit_pips * 0.0001
-        positions.append((entry_price, stop_loss, take_profit, "buy"))
-        print(f"Buy Signal at {df.index[i]} - Price: {entry_price}, SL: {stop_loss}, TP: {take_profit}")
+close = df['close'].to_numpy()
+sma_10 = df['SMA_10'].to_numpy()
+sma_30 = df['SMA_30'].to_numpy()
 
-    # Check for sell signal
-    elif df['SMA_10'][i] < df['SMA_30'][i] and df['SMA_10'][i - 1] >= df['SMA_30'][i - 1]:
-        entry_price = df['close'][i]
-        stop_loss = entry_price + stop_loss_pips * 0.0001
-        take_profit = entry_price - take_profit_pips * 0.0001
-        positions.append((entry_price, stop_loss, take_profit, "sell"))
-        print(f"Sell Signal at {df.index[i]} - Price: {entry_price}, SL: {stop_loss}, TP: {take_profit}")
+# Buy signal: SMA 10 crosses above SMA 30; sell signal: crosses below
+buy_signal = np.zeros(len(df), dtype=bool)
+sell_signal = np.zeros(len(df), dtype=bool)
+buy_signal[1:] = (sma_10[1:] > sma_30[1:]) & (sma_10[:-1] <= sma_30[:-1])
+sell_signal[1:] = (sma_10[1:] < sma_30[1:]) & (sma_10[:-1] >= sma_30[:-1])
+stop_loss = np.where(buy_signal, close - stop_loss_pips * 0.0001, close + stop_loss_pips * 0.0001)  # Convert pips to price
+take_profit = np.where(buy_signal, close + take_profit_pips * 0.0001, close - take_profit_pips * 0.0001)
 
-    # Check existing positions for stop-loss/take-profit
-    closed_positions = []
-    for position in positions:
-        entry_price, stop_loss, take_profit, direction = position
-        if direction == "buy":
-            if df['low'][i] <= stop_loss:  # Stop-loss hit
-                profit = (stop_loss - entry_price) * 100000 * lot_size
-                balance += profit
-                print(f"Stop-Loss Hit (Buy) at {df.index[i]} - Price: {stop_loss}, Profit: {profit:.2f}")
-                closed_positions.append(position)
-            elif df['high'][i] >= take_profit:  # Take-profit hit
-                profit = (take_profit - entry_price) * 100000 * lot_size
-                balance += profit
-                print(f"Take-Profit Hit (Buy) at {df.index[i]} - Price: {take_profit}, Profit: {profit:.2f}")
-                closed_positions.append(position)
-        elif direction == "sell":
-            if df['high'][i] >= stop_loss:  # Stop-loss hit
-                profit = (entry_price - stop_loss) * 100000 * lot_size
-                balance += profit
-                print(f"Stop-Loss Hit (Sell) at {df.index[i]} - Price: {stop_loss}, Profit: {profit:.2f}")
-                closed_positions.append(position)
-            elif df['low'][i] <= take_profit:  # Take-profit hit
-                profit = (entry_price - take_profit) * 100000 * lot_size
-                balance += profit
-                print(f"Take-Profit Hit (Sell) at {df.index[i]} - Price: {take_profit}, Profit: {profit:.2f}")
-                closed_positions.append(position)
+# Open positions are checked against SL/TP from the entry bar on
+result = backtest_engine.simulate(
+    df['high'].to_numpy(), df['low'].to_numpy(), close,
+    buy_signal, sell_signal, stop_loss, take_profit,
+    start=30,
+    check_entry_bar=True,
+    lot_size=lot_size,
+    initial_balance=initial_balance,
+)
+balance = result.final_balance
+equity_curve = result.equity_curve
 
-    # Remove closed positions
-    for position in closed_positions:
-        positions.remove(position)
-
-    # Track equity over time
-    equity_curve.append(balance)
+# Trade log
+for trade in result.trades:
+    side = "Buy" if trade['direction'] > 0 else "Sell"
+    print(f"{side} Signal at {df.index[trade['entry_index']]} - Price: {trade['entry_price']}, SL: {trade['stop_loss']}, TP: {trade['take_profit']}")
+    if trade['reason'] == backtest_engine.STOP_LOSS:
+        print(f"Stop-Loss Hit ({side}) at {df.index[trade['exit_index']]} - Price: {trade['exit_price']}, Profit: {trade['profit']:.2f}")
+    elif trade['reason'] == backtest_engine.TAKE_PROFIT:
+        print(f"Take-Profit Hit ({side}) at {df.index[trade['exit_index']]} - Price: {trade['exit_price']}, Profit: {trade['profit']:.2f}")
 
 # Plot the equity curve
 plt.figure(figsize=(12, 6))
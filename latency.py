@@ -0,0 +1,224 @@
+# Per-stage latency histograms for the live strategies
+#
+# The time between a bar closing and mt5.order_send() returning is spent
+# fetching the new bars, updating the indicators, evaluating the signal,
+# reading the tick for the order price and the order round-trip.
+# LatencyRecorder times each stage per symbol into a log-linear histogram
+# (16 buckets per power of two, ~6% resolution, from 1 ns to hours) that
+# costs an integer bucket computation and a list increment per sample:
+#
+#     latency = LatencyRecorder(path="latency.prom", interval=60)
+#     with latency.time(symbol, "fetch"):
+#         added = bars.poll(mt5)
+#     ...
+#     latency.record_since(symbol, "bar_to_order", started)
+#     latency.maybe_dump()
+#
+# The histograms are written as text metrics (Prometheus exposition format,
+# with p50/p90/p99 summaries) to path every interval seconds, and can also
+# be scraped over HTTP with serve(port).
+
+import os
+import threading
+import time
+
+SUB_BUCKETS = 16  # Buckets per power of two
+SUB_BITS = 4
+QUANTILES = (0.5, 0.9, 0.99)
+
+# Stages of the live loop, in pipeline order
+STAGES = ("fetch", "indicators", "signal", "tick", "order_send", "bar_to_order")
+
+
+def bucket_index(ns):
+    """
+    Histogram bucket of a duration in nanoseconds.
+    """
+    if ns < SUB_BUCKETS:
+        return max(ns, 0)
+    shift = ns.bit_length() - SUB_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (ns >> shift) - SUB_BUCKETS
+
+
+def bucket_bounds(index):
+    """
+    [lower, upper) nanoseconds of a bucket.
+    """
+    if index < SUB_BUCKETS:
+        return index, index + 1
+    shift = index // SUB_BUCKETS - 1
+    mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+    return mantissa << shift, (mantissa + 1) << shift
+
+
+class Histogram:
+    """
+    Counts of durations per log-linear bucket, with count, sum and max.
+    """
+
+    def __init__(self):
+        self.counts = []
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns):
+        index = bucket_index(ns)
+        if index >= len(self.counts):
+            self.counts.extend([0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def quantile(self, q):
+        """
+        Duration in seconds below which a fraction q of the samples fall
+        (bucket midpoint, capped at the maximum seen).
+        """
+        if self.count == 0:
+            return float("nan")
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                lower, upper = bucket_bounds(index)
+                return min((lower + upper) / 2, self.max_ns) / 1e9
+        return self.max_ns / 1e9
+
+
+class _StageTimer:
+    # Context manager recording the duration of its block
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter_ns() - self.started)
+
+
+class LatencyRecorder:
+    """
+    Latency histograms per (symbol, stage), dumped as text metrics.
+
+    path, interval: file rewritten by maybe_dump() at most every interval
+        seconds (no file when path is None).
+    """
+
+    def __init__(self, path=None, interval=60.0, prefix="algo_stage_latency"):
+        self.path = path
+        self.interval = interval
+        self.prefix = prefix
+        self.histograms = {}
+        self.lock = threading.RLock()  # Guards creating, listing and dumping histograms
+        self.last_dump = time.monotonic()
+        self.server = None
+
+    def histogram(self, symbol, stage):
+        key = (symbol, stage)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        return histogram
+
+    def record(self, symbol, stage, seconds):
+        self.histogram(symbol, stage).record(int(seconds * 1e9))
+
+    def record_since(self, symbol, stage, started_ns):
+        """
+        Record the time since started_ns (a time.perf_counter_ns() value).
+        """
+        self.histogram(symbol, stage).record(time.perf_counter_ns() - started_ns)
+
+    def time(self, symbol, stage):
+        """
+        Time the body of a with block as one sample of symbol/stage.
+        """
+        return _StageTimer(self.histogram(symbol, stage))
+
+    def _sorted(self):
+        # By symbol, then stages in pipeline order
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        with self.lock:
+            items = list(self.histograms.items())
+        return sorted(items, key=lambda item: (item[0][0], order.get(item[0][1], len(order)), item[0][1]))
+
+    def text(self):
+        """
+        All histograms as Prometheus text metrics: a summary per symbol and
+        stage (p50/p90/p99 quantiles in seconds, _sum, _count) and the max.
+        """
+        lines = [f"# HELP {self.prefix}_seconds Live loop stage latency per symbol.",
+                 f"# TYPE {self.prefix}_seconds summary"]
+        maxima = []
+        for (symbol, stage), histogram in self._sorted():
+            labels = f'symbol="{symbol}",stage="{stage}"'
+            for q in QUANTILES:
+                lines.append(f'{self.prefix}_seconds{{{labels},quantile="{q}"}} {histogram.quantile(q):.9f}')
+            lines.append(f"{self.prefix}_seconds_sum{{{labels}}} {histogram.total_ns / 1e9:.9f}")
+            lines.append(f"{self.prefix}_seconds_count{{{labels}}} {histogram.count}")
+            maxima.append(f"{self.prefix}_max_seconds{{{labels}}} {histogram.max_ns / 1e9:.9f}")
+        lines += [f"# TYPE {self.prefix}_max_seconds gauge"] + maxima
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path=None):
+        """
+        Write text() to path (default: self.path), replacing the file atomically.
+        """
+        path = path or self.path
+        if path is None:
+            return
+        with self.lock:
+            temporary = f"{path}.tmp"
+            with open(temporary, "w") as f:
+                f.write(self.text())
+            os.replace(temporary, path)
+            self.last_dump = time.monotonic()
+
+    def maybe_dump(self):
+        """
+        dump() if interval seconds have passed since the last one.
+        """
+        if self.path is not None and time.monotonic() - self.last_dump >= self.interval:
+            self.dump()
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve text() over HTTP on host:port from a daemon thread.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        recorder = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = recorder.text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def summary(self):
+        """
+        Human-readable p50/p99 table of every symbol and stage.
+        """
+        rows = [f"{'symbol':<10}{'stage':<14}{'count':>8}{'p50 (ms)':>12}{'p99 (ms)':>12}{'max (ms)':>12}"]
+        for (symbol, stage), histogram in self._sorted():
+            rows.append(f"{symbol:<10}{stage:<14}{histogram.count:>8}{histogram.quantile(0.5) * 1e3:>12.3f}"
+                        f"{histogram.quantile(0.99) * 1e3:>12.3f}{histogram.max_ns / 1e6:>12.3f}")
+        return "\n".join(rows)
@@ -0,0 +1,156 @@
+# Monte Carlo resampling of backtest trades
+#
+# A backtest gives one path: one final balance and one drawdown for one
+# particular order of trades.  Here the closed trades of any backtest
+# (backtest_engine, streaming_backtest or portfolio_backtest trades) are
+# resampled into thousands of alternative paths, drawn with replacement
+# (bootstrap) or as random orders of the same trades (shuffle), to get the
+# distribution of final balances, maximum drawdowns and the probability of
+# ruin:
+#
+#     result = run_monte_carlo(backtest.trades, initial_balance=10000, paths=10000)
+#     print(summarize(result))
+#
+# Paths are built as (paths x trades) matrices in batches of batch_paths,
+# so memory stays bounded, and the batches run on a process pool.  Every
+# batch has its own seed derived from seed, so the result does not depend
+# on the number of workers.
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
+
+MonteCarloResult = namedtuple(
+    "MonteCarloResult", "initial_balance final_balance max_drawdown max_drawdown_pct min_balance"
+)
+
+
+def trade_profits(trades):
+    """
+    Profits of the closed trades of a trades array, in the order they closed.
+    """
+    closed = trades[trades["exit_index"] >= 0]
+    order = np.lexsort((closed["entry_index"], closed["exit_index"]))
+    return np.ascontiguousarray(closed["profit"][order], dtype=np.float64)
+
+
+def resample(profits, paths, method="bootstrap", rng=None):
+    """
+    (paths x trades) matrix of resampled trade profits: drawn with
+    replacement ("bootstrap") or permuted ("shuffle").
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    if method == "bootstrap":
+        return profits[rng.integers(0, len(profits), size=(paths, len(profits)))]
+    if method == "shuffle":
+        return rng.permuted(np.broadcast_to(profits, (paths, len(profits))), axis=1)
+    raise ValueError(f"Unknown resampling method: {method}")
+
+
+def path_statistics(matrix, initial_balance):
+    """
+    Final balance, maximum drawdown (absolute and as a fraction of the
+    peak) and lowest balance of each row of a (paths x trades) profit matrix.
+    """
+    if matrix.shape[1] == 0:
+        flat = np.full(len(matrix), float(initial_balance))
+        return flat, np.zeros(len(matrix)), np.zeros(len(matrix)), flat
+    equity = np.cumsum(matrix, axis=1)
+    equity += initial_balance
+    peak = np.maximum.accumulate(equity, axis=1)
+    np.maximum(peak, initial_balance, out=peak)
+    drawdown = peak - equity
+    # The largest absolute and relative drawdowns can come from different peaks
+    return (
+        equity[:, -1],
+        drawdown.max(axis=1),
+        (drawdown / peak).max(axis=1),
+        np.minimum(equity.min(axis=1), initial_balance),
+    )
+
+
+def _run_batch(profits, paths, method, initial_balance, seed):
+    matrix = resample(profits, paths, method, np.random.default_rng(seed))
+    return path_statistics(matrix, initial_balance)
+
+
+def run_monte_carlo(trades, initial_balance=10000, paths=10000, method="bootstrap", seed=None,
+                    batch_paths=500, workers=None):
+    """
+    Resample the closed trades of a backtest into paths equity paths.
+
+    trades: a trades array (entry_index, exit_index, profit fields) or a 1-D
+        array of trade profits in order.
+    workers: pool size (default: CPU count); 1 runs in this process.
+
+    Returns a MonteCarloResult with one value per path.
+    """
+    if paths < 1:
+        raise ValueError(f"paths must be at least 1, got {paths}")
+    if getattr(trades, "dtype", None) is not None and trades.dtype.names:
+        profits = trade_profits(trades)
+    else:
+        profits = np.asarray(trades, dtype=np.float64)
+    sizes = [min(batch_paths, paths - lo) for lo in range(0, paths, batch_paths)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(profits, size, method, initial_balance, batch_seed) for size, batch_seed in zip(sizes, seeds)]
+
+    workers = min(workers or os.cpu_count() or 1, len(sizes)) or 1
+    if workers == 1:
+        batches = [_run_batch(*batch) for batch in args]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            batches = list(pool.map(_run_batch, *zip(*args)))
+    return MonteCarloResult(initial_balance, *(np.concatenate(values) for values in zip(*batches)))
+
+
+def ruin_probability(result, level):
+    """
+    Share of paths whose balance fell to level or below.
+    """
+    return float((result.min_balance <= level).mean())
+
+
+def summarize(result, percentiles=(5, 25, 50, 75, 95), ruin_levels=(0.75, 0.5, 0.25)):
+    """
+    Percentiles of the final balance and drawdowns, and the probability of
+    the balance falling to each fraction of the initial balance in ruin_levels.
+    """
+    summary = {"paths": len(result.final_balance)}
+    for name in ("final_balance", "max_drawdown", "max_drawdown_pct"):
+        values = getattr(result, name)
+        for q, value in zip(percentiles, np.percentile(values, percentiles)):
+            summary[f"{name}_p{q}"] = float(value)
+    for level in ruin_levels:
+        summary[f"ruin_{int(level * 100)}pct"] = ruin_probability(result, result.initial_balance * level)
+    return summary
+
+
+if __name__ == "__main__":
+    try:
+        import MetaTrader5 as mt5
+    except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+        import mt5_offline as mt5
+    import time
+    from datetime import datetime
+    import param_sweep
+
+    # Initialize MetaTrader 5 connection
+    if not mt5.initialize():
+        print("Failed to initialize MT5!")
+        quit()
+
+    bars = param_sweep.load_bars(mt5, "EURUSD", mt5.TIMEFRAME_H4, datetime(2024, 1, 1), datetime(2024, 12, 31, 23, 59))
+    mt5.shutdown()
+    if bars is not None:
+        strategy = param_sweep.STRATEGIES["ema_rsi_bb"]
+        params = dict(strategy.defaults)
+        result = strategy.backtest(param_sweep.prepare_columns(strategy, bars, [params]), params)
+        print(f"Backtest: {len(result.trades)} trades, final balance ${result.final_balance:.2f}")
+
+        started = time.perf_counter()
+        simulation = run_monte_carlo(result.trades, initial_balance=result.initial_balance, paths=10000, seed=1)
+        print(f"10000 paths in {time.perf_counter() - started:.2f}s")
+        for name, value in summarize(simulation).items():
+            print(f"{name}: {value:.4f}" if isinstance(value, float) else f"{name}: {value}")
@@ -0,0 +1,439 @@
+# Offline stand-in for the MetaTrader5 package
+#
+# Exposes the subset of the MetaTrader5 API the strategy scripts use, backed
+# by the local bar store (bar_cache) and a simulated fill engine, so
+# backtests can run on Linux machines without a terminal:
+#
+#     try:
+#         import MetaTrader5 as mt5
+#     except ImportError:
+#         import mt5_offline as mt5
+#
+# Ticks (copy_ticks_range) come from the tick store (tick_store).
+#
+# Market data is served as of a simulated clock.  By default the clock
+# follows the wall clock; call set_time() (or set ALGO_OFFLINE_CLOCK to an
+# ISO timestamp) to replay a historical session.  Only what had happened by
+# the clock is visible: the bar still forming is built from the M1 bars
+# closed so far and the current tick is the close of the last closed M1
+# bar.  Advancing the clock checks open positions against the M1 bars that
+# closed in between and closes them at their stop-loss or take-profit,
+# stop-loss first when a bar touches both.
+# clock() and sleep() let the bar scheduler step a replay bar by bar.
+
+import os
+import math
+import time
+import itertools
+from collections import namedtuple
+from datetime import datetime, timezone
+import numpy as np
+
+import bar_cache
+import tick_store
+from timeframes import TIMEFRAMES, timeframe_name, timeframe_seconds
+
+OFFLINE = True
+
+# Timeframes (TIMEFRAME_M1, TIMEFRAME_H4, ...)
+for _name, _value in TIMEFRAMES.items():
+    globals()[f"TIMEFRAME_{_name}"] = _value
+
+# Trading constants (same values as the MetaTrader5 package)
+ORDER_TYPE_BUY = 0
+ORDER_TYPE_SELL = 1
+TRADE_ACTION_DEAL = 1
+ORDER_TIME_GTC = 0
+ORDER_FILLING_FOK = 0
+ORDER_FILLING_IOC = 1
+ORDER_FILLING_RETURN = 2
+POSITION_TYPE_BUY = 0
+POSITION_TYPE_SELL = 1
+TRADE_RETCODE_REQUOTE = 10004
+TRADE_RETCODE_DONE = 10009
+TRADE_RETCODE_INVALID = 10013
+TRADE_RETCODE_INVALID_VOLUME = 10014
+TRADE_RETCODE_MARKET_CLOSED = 10018
+TRADE_RETCODE_NO_MONEY = 10019
+TRADE_RETCODE_INVALID_STOPS = 10016
+
+# copy_ticks_* flags
+COPY_TICKS_ALL = tick_store.COPY_TICKS_ALL
+COPY_TICKS_INFO = tick_store.COPY_TICKS_INFO
+COPY_TICKS_TRADE = tick_store.COPY_TICKS_TRADE
+
+# last_error() codes
+RES_S_OK = 1
+RES_E_FAIL = -1
+RES_E_INVALID_PARAMS = -2
+RES_E_NOT_FOUND = -4
+RES_E_NO_HISTORY = -6
+
+CONTRACT_SIZE = 100000  # Units per lot, as assumed by the backtests
+
+Tick = namedtuple("Tick", "time bid ask last volume time_msc flags volume_real")
+AccountInfo = namedtuple(
+    "AccountInfo", "login balance equity profit margin margin_free currency leverage server name"
+)
+TradePosition = namedtuple(
+    "TradePosition", "ticket time type magic volume price_open sl tp price_current profit symbol comment"
+)
+OrderSendResult = namedtuple(
+    "OrderSendResult", "retcode deal order volume price bid ask comment request_id retcode_external request"
+)
+
+_state = {
+    "initialized": False,
+    "clock": None,
+    "balance": float(os.environ.get("ALGO_OFFLINE_BALANCE", 10000)),
+    "login": 0,
+    "server": "Offline",
+    "last_error": (RES_S_OK, "Success"),
+    "positions": {},
+    "history": [],
+    "selected": set(),
+}
+_tickets = itertools.count(1)
+
+
+def _set_error(code, message):
+    _state["last_error"] = (code, message)
+
+
+def _now():
+    if _state["clock"] is not None:
+        return _state["clock"]
+    return int(datetime.now(timezone.utc).timestamp())
+
+
+def _point(symbol):
+    return 0.001 if "JPY" in symbol else 0.00001
+
+
+def _available_months(symbol, timeframe):
+    folder = os.path.join(bar_cache.CACHE_DIR, symbol, timeframe_name(timeframe))
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name[:-4] for name in os.listdir(folder) if name.endswith(".npz"))
+
+
+def _bar_close(timeframe, opened):
+    if timeframe == TIMEFRAMES["MN1"]:
+        return bar_cache.next_month_start(opened)
+    return opened + timeframe_seconds(timeframe)
+
+
+def _stored_bars_before(symbol, timeframe, timestamp, count):
+    # Up to count stored bars opened at or before timestamp, oldest first, as they finally closed
+    parts, total = [], 0
+    for key in reversed(_available_months(symbol, timeframe)):
+        if key > datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m"):
+            continue
+        rates = bar_cache.read_partition(bar_cache.partition_path(symbol, timeframe, key))
+        rates = rates[:np.searchsorted(rates["time"], timestamp, side="right")]
+        parts.append(rates)
+        total += len(rates)
+        if total >= count:
+            break
+    if not parts:
+        return np.empty(0, dtype=bar_cache.RATES_DTYPE)
+    rates = np.concatenate(parts[::-1])
+    return rates[-count:] if count > 0 else rates[:0]
+
+
+def _closed_bars(symbol, timeframe, timestamp, count):
+    """
+    Return up to count bars closed at or before timestamp, oldest first.
+    """
+    rates = _stored_bars_before(symbol, timeframe, timestamp, count + 1)
+    if len(rates) and _bar_close(timeframe, int(rates["time"][-1])) > timestamp:
+        rates = rates[:-1]
+    return rates[-count:] if count > 0 else rates[:0]
+
+
+def _bars_before(symbol, timeframe, timestamp, count):
+    """
+    Return up to count bars opened at or before timestamp, oldest first.
+
+    A bar still forming at the simulated clock holds only its open and the
+    M1 bars closed by then, never its final high, low and close.
+    """
+    rates = _stored_bars_before(symbol, timeframe, timestamp, count)
+    now = _now()
+    if len(rates) == 0 or _bar_close(timeframe, int(rates["time"][-1])) <= now:
+        return rates
+    rates = rates.copy()
+    forming = rates[-1]
+    minutes = _closed_bars(symbol, TIMEFRAME_M1, now, (now - int(forming["time"])) // 60)
+    minutes = minutes[minutes["time"] >= forming["time"]]
+    forming["high"] = max(forming["open"], minutes["high"].max()) if len(minutes) else forming["open"]
+    forming["low"] = min(forming["open"], minutes["low"].min()) if len(minutes) else forming["open"]
+    forming["close"] = minutes["close"][-1] if len(minutes) else forming["open"]
+    forming["tick_volume"] = minutes["tick_volume"].sum()
+    forming["real_volume"] = minutes["real_volume"].sum()
+    return rates
+
+
+def initialize(path=None, login=None, password=None, server=None, timeout=None, portable=False):
+    """
+    Start the offline session; the bar store takes the place of the terminal.
+    """
+    clock = os.environ.get("ALGO_OFFLINE_CLOCK")
+    if clock and _state["clock"] is None:
+        _state["clock"] = bar_cache.to_timestamp(clock)
+    if login is not None:
+        _state["login"] = login
+    if server is not None:
+        _state["server"] = server
+    _state["initialized"] = True
+    _set_error(RES_S_OK, "Success")
+    return True
+
+
+def login(login, password=None, server=None, timeout=None):
+    """
+    Accept any credentials; there is no trade server to authenticate against.
+    """
+    _state["login"] = login
+    if server is not None:
+        _state["server"] = server
+    return True
+
+
+def shutdown():
+    """
+    End the offline session.
+    """
+    _state["initialized"] = False
+    return True
+
+
+def last_error():
+    """
+    Return the (code, message) of the last failed call.
+    """
+    return _state["last_error"]
+
+
+def set_time(value):
+    """
+    Move the simulated clock forward, closing positions whose SL/TP was hit on the way.
+    """
+    target = bar_cache.to_timestamp(value)
+    previous = _now()
+    _state["clock"] = target
+    if _state["positions"] and target > previous:
+        _check_stops(previous, target)
+
+
+def clock():
+    """
+    Current time of the simulated clock in epoch seconds (not part of the MetaTrader5 API).
+    """
+    if _state["clock"] is None:
+        return time.time()
+    return float(_state["clock"])
+
+
+def sleep(seconds):
+    """
+    Advance the simulated clock when replaying a session, otherwise really sleep
+    (not part of the MetaTrader5 API).
+    """
+    if _state["clock"] is None:
+        time.sleep(seconds)
+    else:
+        set_time(_state["clock"] + max(1, math.ceil(seconds)))
+
+
+def copy_rates_range(symbol, timeframe, date_from, date_to):
+    """
+    Return bars with open time in [date_from, date_to] from the local store.
+    """
+    rates = bar_cache.copy_rates_range(None, symbol, timeframe, date_from, date_to)
+    if len(rates) == 0:
+        _set_error(RES_E_NO_HISTORY, f"No history for {symbol} {timeframe_name(timeframe)}")
+        return None
+    _set_error(RES_S_OK, "Success")
+    return rates
+
+
+def copy_rates_from(symbol, timeframe, date_from, count):
+    """
+    Return the count bars opened at or before date_from.
+    """
+    rates = _bars_before(symbol, timeframe, min(bar_cache.to_timestamp(date_from), _now()), count)
+    if len(rates) == 0:
+        _set_error(RES_E_NO_HISTORY, f"No history for {symbol} {timeframe_name(timeframe)}")
+        return None
+    _set_error(RES_S_OK, "Success")
+    return rates
+
+
+def copy_rates_from_pos(symbol, timeframe, start_pos, count):
+    """
+    Return count bars starting start_pos bars back from the current (simulated) bar.
+    """
+    rates = _bars_before(symbol, timeframe, _now(), start_pos + count)
+    rates = rates[:len(rates) - start_pos] if start_pos else rates
+    if len(rates) == 0:
+        _set_error(RES_E_NO_HISTORY, f"No history for {symbol} {timeframe_name(timeframe)}")
+        return None
+    _set_error(RES_S_OK, "Success")
+    return rates[-count:]
+
+
+def copy_ticks_range(symbol, date_from, date_to, flags):
+    """
+    Return ticks with time in [date_from, date_to] from the local tick store.
+    """
+    ticks = tick_store.copy_ticks_range(None, symbol, date_from, date_to, flags)
+    if len(ticks) == 0:
+        _set_error(RES_E_NO_HISTORY, f"No tick history for {symbol}")
+        return None
+    _set_error(RES_S_OK, "Success")
+    return ticks
+
+
+def symbol_select(symbol, enable=True):
+    """
+    Succeed if the bar store holds any data for the symbol.
+    """
+    if not os.path.isdir(os.path.join(bar_cache.CACHE_DIR, symbol)):
+        _set_error(RES_E_NOT_FOUND, f"Symbol {symbol} not found in the bar store")
+        return False
+    if enable:
+        _state["selected"].add(symbol)
+    else:
+        _state["selected"].discard(symbol)
+    return True
+
+
+def symbol_info_tick(symbol):
+    """
+    Return a tick built from the close and spread of the last closed M1 bar, at its close time.
+    """
+    bars = _closed_bars(symbol, TIMEFRAME_M1, _now(), 1)
+    if len(bars) == 0:
+        _set_error(RES_E_NOT_FOUND, f"No prices for {symbol}")
+        return None
+    bar = bars[-1]
+    bid = float(bar["close"])
+    ask = bid + int(bar["spread"]) * _point(symbol)
+    tick_time = int(bar["time"]) + 60
+    return Tick(tick_time, bid, ask, 0.0, 0, tick_time * 1000, 0, 0.0)
+
+
+def order_send(request):
+    """
+    Fill a market order at the current simulated tick and open a position.
+    """
+    symbol = request.get("symbol")
+    order_type = request.get("type")
+    volume = request.get("volume", 0)
+    if request.get("action") != TRADE_ACTION_DEAL or order_type not in (ORDER_TYPE_BUY, ORDER_TYPE_SELL):
+        return _order_result(TRADE_RETCODE_INVALID, request, comment="Unsupported request")
+    if not volume or volume <= 0:
+        return _order_result(TRADE_RETCODE_INVALID_VOLUME, request, comment="Invalid volume")
+    tick = symbol_info_tick(symbol)
+    if tick is None:
+        return _order_result(TRADE_RETCODE_MARKET_CLOSED, request, comment="No prices")
+
+    price = tick.ask if order_type == ORDER_TYPE_BUY else tick.bid
+    requested = request.get("price")
+    deviation = request.get("deviation", 0) * _point(symbol)
+    if requested and abs(price - requested) > deviation + 1e-12:
+        return _order_result(TRADE_RETCODE_REQUOTE, request, tick=tick, comment="Requote")
+
+    sl, tp = request.get("sl", 0.0) or 0.0, request.get("tp", 0.0) or 0.0
+    if order_type == ORDER_TYPE_BUY and ((sl and sl >= price) or (tp and tp <= price)):
+        return _order_result(TRADE_RETCODE_INVALID_STOPS, request, tick=tick, comment="Invalid stops")
+    if order_type == ORDER_TYPE_SELL and ((sl and sl <= price) or (tp and tp >= price)):
+        return _order_result(TRADE_RETCODE_INVALID_STOPS, request, tick=tick, comment="Invalid stops")
+
+    ticket = next(_tickets)
+    _state["positions"][ticket] = {
+        "ticket": ticket,
+        "time": tick.time,
+        "type": POSITION_TYPE_BUY if order_type == ORDER_TYPE_BUY else POSITION_TYPE_SELL,
+        "magic": request.get("magic", 0),
+        "volume": volume,
+        "price_open": price,
+        "sl": sl,
+        "tp": tp,
+        "symbol": symbol,
+        "comment": request.get("comment", ""),
+    }
+    return _order_result(TRADE_RETCODE_DONE, request, tick=tick, price=price, ticket=ticket)
+
+
+def _order_result(retcode, request, tick=None, price=0.0, ticket=0, comment="Request executed"):
+    if retcode != TRADE_RETCODE_DONE:
+        _set_error(RES_E_FAIL, comment)
+    bid, ask = (tick.bid, tick.ask) if tick else (0.0, 0.0)
+    volume = request.get("volume", 0.0) if retcode == TRADE_RETCODE_DONE else 0.0
+    return OrderSendResult(retcode, ticket, ticket, volume, price, bid, ask, comment, 0, 0, request)
+
+
+def _position_profit(position, price):
+    direction = 1 if position["type"] == POSITION_TYPE_BUY else -1
+    return direction * (price - position["price_open"]) * CONTRACT_SIZE * position["volume"]
+
+
+def _check_stops(previous, target):
+    """
+    Close positions whose SL/TP was touched by M1 bars closed in (previous, target]
+    and opened at or after the position.
+    """
+    for ticket, position in list(_state["positions"].items()):
+        first = max(previous - 59, position["time"])
+        if first > target - 60:
+            continue
+        bars = bar_cache.copy_rates_range(None, position["symbol"], TIMEFRAME_M1, first, target - 60)
+        is_buy = position["type"] == POSITION_TYPE_BUY
+        sl, tp = position["sl"], position["tp"]
+        for bar in bars:
+            if sl and (bar["low"] <= sl if is_buy else bar["high"] >= sl):
+                _close_position(ticket, sl, int(bar["time"]), "sl")
+                break
+            if tp and (bar["high"] >= tp if is_buy else bar["low"] <= tp):
+                _close_position(ticket, tp, int(bar["time"]), "tp")
+                break
+
+
+def _close_position(ticket, price, timestamp, reason):
+    position = _state["positions"].pop(ticket)
+    profit = _position_profit(position, price)
+    _state["balance"] += profit
+    _state["history"].append(dict(position, price_close=price, time_close=timestamp, profit=profit, reason=reason))
+
+
+def positions_get(symbol=None):
+    """
+    Return the open simulated positions, optionally for one symbol.
+    """
+    positions = []
+    for position in _state["positions"].values():
+        if symbol is not None and position["symbol"] != symbol:
+            continue
+        tick = symbol_info_tick(position["symbol"])
+        is_buy = position["type"] == POSITION_TYPE_BUY
+        current = (tick.bid if is_buy else tick.ask) if tick else position["price_open"]
+        positions.append(TradePosition(
+            position["ticket"], position["time"], position["type"], position["magic"],
+            position["volume"], position["price_open"], position["sl"], position["tp"],
+            current, _position_profit(position, current), position["symbol"], position["comment"],
+        ))
+    return tuple(positions)
+
+
+def account_info():
+    """
+    Return the simulated account: balance plus floating profit of open positions.
+    """
+    profit = sum(position.profit for position in positions_get())
+    balance = _state["balance"]
+    return AccountInfo(
+        _state["login"], balance, balance + profit, profit, 0.0, balance + profit,
+        "USD", 100, _state["server"], "Offline account",
+    )
@@ -1,15 +1,19 @@
-import MetaTrader5 as mt5
+try:
+    import MetaTrader5 as mt5
+except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+    import mt5_offline as mt5
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import util
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from ta.trend import EMAIndicator
-from ta.momentum import RSIIndicator
-from ta.volatility import BollingerBands, AverageTrueRange
 import matplotlib.pyplot as plt
-
-# Initialize MetaTrader 5 connection
-if not mt5.initialize():
-    print("Failed to initialize MT5!")
-    quit()
+import bar_cache
+import indicators
+import backtest_engine
+import portfolio_backtest
+from intrabar import IntrabarResolver
 
 # Define symbols and timeframe
 symbols = ["EURUSD", "GBPUSD", "USDJPY"]  # List of symbols to backtest
@@ -22,9 +26,18 @@ lot_size = 0.1  # Lot size per trade
 atr_multiplier_sl = 1  # Stop-loss = 1 ATR
 atr_multiplier_tp = 1.5  # Take-profit = 1.5 ATR
 
+# True: exits on bars touching both SL and TP are resolved from lower-timeframe data (False: always SL first)
+intrabar = False
+intrabar_timeframe = None  # The bars are M1 already: resolve from stored ticks
+
+# Parallel mode: with workers > 1 each symbol is backtested in its own worker process
+workers = 1  # 1: one symbol after the other in this process
+save_plots = workers > 1  # Write the plots to <plot_prefix>_<name>.png instead of showing them
+plot_prefix = os.path.splitext(os.path.basename(__file__))[0]
+
 # Fetch historical data
 def fetch_historical_data(symbol, timeframe, start_date, end_date):
-    rates = mt5.copy_rates_range(symbol, timeframe, start_date, end_date)
+    rates = bar_cache.copy_rates_range(mt5, symbol, timeframe, start_date, end_date)
     if rates is None or len(rates) == 0:
         print(f"No data available for {symbol} in the given date range.")
         return None
@@ -35,104 +48,175 @@ def fetch_historical_data(symbol, timeframe, start_date, end_date):
 
 # Calculate indicators
 def calculate_indicators(df):
-    df['EMA_9'] = EMAIndicator(close=df['close'], window=9).ema_indicator()
-    df['EMA_21'] = EMAIndicator(close=df['close'], window=21).ema_indicator()
-    df['RSI'] = RSIIndicator(close=df['close'], window=14).rsi()
-    bb = BollingerBands(close=df['close'], window=20, window_dev=2)
-    df['bb_high'] = bb.bollinger_hband()
-    df['bb_low'] = bb.bollinger_lband()
-    atr = AverageTrueRange(high=df['high'], low=df['low'], close=df['close'], window=14)
-    df['ATR'] = atr.average_true_range()
+    df['EMA_9'] = indicators.ema(df['close'], 9)
+    df['EMA_21'] = indicators.ema(df['close'], 21)
+    df['RSI'] = indicators.rsi(df['close'], 14)
+    _, df['bb_high'], df['bb_low'] = indicators.bollinger_bands(df['close'], window=20, window_dev=2)
+    df['ATR'] = indicators.atr(df['high'], df['low'], df['close'], 14)
     return df
 
+# Entry signals with their stop-loss and take-profit levels
+def strategy_signals(df):
+    close = df['close'].to_numpy()
+    atr = df['ATR'].to_numpy()
+    ema_9 = df['EMA_9'].to_numpy()
+    ema_21 = df['EMA_21'].to_numpy()
+    rsi = df['RSI'].to_numpy()
+
+    # Entry signals
+    buy_signal = (ema_9 > ema_21) & (rsi > 30) & (close <= df['bb_low'].to_numpy())
+    sell_signal = (ema_9 < ema_21) & (rsi < 70) & (close >= df['bb_high'].to_numpy())
+    stop_loss = np.where(buy_signal, close - (atr * atr_multiplier_sl), close + (atr * atr_multiplier_sl))
+    take_profit = np.where(buy_signal, close + (atr * atr_multiplier_tp), close - (atr * atr_multiplier_tp))
+    return buy_signal, sell_signal, stop_loss, take_profit
+
 # Backtest function
-def backtest_strategy(df):
+def backtest_strategy(df, symbol):
     initial_balance = 10000  # Starting capital in USD
-    balance = initial_balance
-    positions = []
-    equity_curve = []  # To store the balance over time
-
-    for i in range(21, len(df)):  # Start after sufficient data for indicators
-        row = df.iloc[i]
-        atr = row['ATR']
-        if pd.isna(atr):  # Skip if ATR is not available
-            continue
-
-        # Close open positions
-        closed_positions = []
-        for position in positions:
-            entry_price, sl, tp, direction = position
-            if direction == "buy":
-                if row['low'] <= sl:  # Stop-loss hit
-                    balance -= (entry_price - sl) * 100000 * lot_size
-                    closed_positions.append(position)
-                elif row['high'] >= tp:  # Take-profit hit
-                    balance += (tp - entry_price) * 100000 * lot_size
-                    closed_positions.append(position)
-            elif direction == "sell":
-                if row['high'] >= sl:  # Stop-loss hit
-                    balance -= (sl - entry_price) * 100000 * lot_size
-                    closed_positions.append(position)
-                elif row['low'] <= tp:  # Take-profit hit
-                    balance += (entry_price - tp) * 100000 * lot_size
-                    closed_positions.append(position)
-
-        for position in closed_positions:
-            positions.remove(position)
-
-        # Entry signals
-        if row['EMA_9'] > row['EMA_21'] and row['RSI'] > 30 and row['close'] <= row['bb_low']:
-            # Buy signal
-            entry_price = row['close']
-            sl = entry_price - (atr * atr_multiplier_sl)
-            tp = entry_price + (atr * atr_multiplier_tp)
-            positions.append((entry_price, sl, tp, "buy"))
-        elif row['EMA_9'] < row['EMA_21'] and row['RSI'] < 70 and row['close'] >= row['bb_high']:
-            # Sell signal
-            entry_price = row['close']
-            sl = entry_price + (atr * atr_multiplier_sl)
-            tp = entry_price - (atr * atr_multiplier_tp)
-            positions.append((entry_price, sl, tp, "sell"))
-
-        # Track equity
-        equity_curve.append(balance)
-
-    return initial_balance, balance, equity_curve
-
-# Main execution
-results = []  # To store results for each symbol
-for symbol in symbols:
+    close = df['close'].to_numpy()
+    atr = df['ATR'].to_numpy()
+    buy_signal, sell_signal, stop_loss, take_profit = strategy_signals(df)
+    resolver = IntrabarResolver(mt5, symbol, df.index.to_numpy(), timeframe, intrabar_timeframe) if intrabar else None
+
+    # Positions are closed at the first later bar touching SL or TP
+    result = backtest_engine.simulate(
+        df['high'].to_numpy(), df['low'].to_numpy(), close,
+        buy_signal, sell_signal, stop_loss, take_profit,
+        start=21,  # Start after sufficient data for indicators
+        valid=~np.isnan(atr),  # Skip bars where ATR is not available
+        intrabar=resolver,  # SL or TP first on bars touching both
+        lot_size=lot_size,
+        initial_balance=initial_balance,
+    )
+    if resolver is not None:
+        print(resolver.summary())
+    return initial_balance, result.final_balance, result.equity_curve
+
+# Initialize MetaTrader 5 connection (in every worker process)
+def init_worker():
+    if not mt5.initialize():
+        raise RuntimeError("Failed to initialize MT5!")
+
+# Worker process of the parallel mode: connect, and disconnect when the worker exits
+def init_pool_worker():
+    init_worker()
+    util.Finalize(None, mt5.shutdown, exitpriority=0)  # Unlike atexit hooks, also runs in forked workers
+
+# Fetch, indicators and backtest of one symbol
+def run_symbol(symbol):
     print(f"Backtesting {symbol}...")
     df = fetch_historical_data(symbol, timeframe, start_date, end_date)
     if df is None:
-        continue
+        return None
     df = calculate_indicators(df)
-    initial_balance, final_balance, equity_curve = backtest_strategy(df)
-
-    # Store results
-    results.append({
-        "Symbol": symbol,
-        "Initial Balance": initial_balance,
-        "Final Balance": final_balance,
-        "Net Profit": final_balance - initial_balance
-    })
-
-    # Plot equity curve for each symbol
-    plt.figure(figsize=(12, 6))
-    plt.plot(df.index[-len(equity_curve):], equity_curve, label=f"Equity Curve ({symbol})")
-    plt.title(f"Equity Curve for {symbol}")
-    plt.xlabel("Date")
-    plt.ylabel("Balance (USD)")
-    plt.legend()
-    plt.grid()
-    plt.show()
-
-# Print summary results
-print("\nSummary Results:")
-for result in results:
-    print(f"Symbol: {result['Symbol']}, Initial Balance: ${result['Initial Balance']:.2f}, "
-          f"Final Balance: ${result['Final Balance']:.2f}, "
-          f"Net Profit: ${result['Net Profit']:.2f}")
-
-# Shutdown MetaTrader 5 connection
-mt5.shutdown()
+    initial_balance, final_balance, equity_curve = backtest_strategy(df, symbol)
+    return symbol, df, initial_balance, final_balance, equity_curve
+
+# Main execution
+if __name__ == "__main__":
+    if save_plots:
+        plt.switch_backend("Agg")  # Files only: no display needed
+    if workers > 1:
+        with ProcessPoolExecutor(min(workers, len(symbols)), initializer=init_pool_worker) as pool:
+            outcomes = list(pool.map(run_symbol, symbols))
+    else:
+        init_worker()
+        outcomes = [run_symbol(symbol) for symbol in symbols]
+        mt5.shutdown()
+
+    results = []  # To store results for each symbol
+    frames = {}  # Bars with indicators of each symbol, for the portfolio backtest
+    for outcome in outcomes:
+        if outcome is None:
+            continue
+        symbol, df, initial_balance, final_balance, equity_curve = outcome
+        frames[symbol] = df
+
+        # Store results
+        results.append({
+            "Symbol": symbol,
+            "Initial Balance": initial_balance,
+            "Final Balance": final_balance,
+            "Net Profit": final_balance - initial_balance
+        })
+
+        # Plot equity curve for each symbol
+        plt.figure(figsize=(12, 6))
+        plt.plot(df.index[-len(equity_curve):], equity_curve, label=f"Equity Curve ({symbol})")
+        plt.title(f"Equity Curve for {symbol}")
+        plt.xlabel("Date")
+        plt.ylabel("Balance (USD)")
+        plt.legend()
+        plt.grid()
+        if save_plots:
+            plt.savefig(f"{plot_prefix}_{symbol}.png")
+            plt.close()
+        else:
+            plt.show()
+
+    # Print summary results
+    print("\nSummary Results:")
+    for result in results:
+        print(f"Symbol: {result['Symbol']}, Initial Balance: ${result['Initial Balance']:.2f}, "
+              f"Final Balance: ${result['Final Balance']:.2f}, "
+              f"Net Profit: ${result['Net Profit']:.2f}")
+
+    # Portfolio backtest: all symbols on their common time axis against one shared account
+    portfolio_balance = 10000  # Starting capital of the shared account in USD
+    columns_by_symbol = {}
+    for symbol, df in frames.items():
+        buy_signal, sell_signal, stop_loss, take_profit = strategy_signals(df)
+        columns_by_symbol[symbol] = {
+            "time": df.index.to_numpy(), "high": df['high'].to_numpy(), "low": df['low'].to_numpy(),
+            "close": df['close'].to_numpy(), "buy": buy_signal, "sell": sell_signal,
+            "stop_loss": stop_loss, "take_profit": take_profit, "valid": ~np.isnan(df['ATR'].to_numpy()),
+        }
+
+    if columns_by_symbol:
+        times, present, arrays = portfolio_backtest.align(
+            columns_by_symbol, ["high", "low", "close", "buy", "sell", "stop_loss", "take_profit", "valid"])
+        resolvers = None
+        if intrabar:
+            init_worker()  # Lower-timeframe data of the ambiguous exits comes from the terminal
+            resolvers = [IntrabarResolver(mt5, symbol, times, timeframe, intrabar_timeframe)
+                         for symbol in columns_by_symbol]
+        portfolio = portfolio_backtest.simulate(
+            arrays["high"], arrays["low"], arrays["close"], arrays["buy"], arrays["sell"],
+            arrays["stop_loss"], arrays["take_profit"], present=present,
+            start=21,  # Start after sufficient data for indicators
+            valid=arrays["valid"],  # Skip bars where ATR is not available
+            intrabar=resolvers,  # SL or TP first on bars touching both
+            lot_size=lot_size,
+            initial_balance=portfolio_balance,
+        )
+        if intrabar:
+            mt5.shutdown()
+
+        print("\nPortfolio Results (shared account):")
+        for row, symbol in enumerate(columns_by_symbol):
+            print(f"Symbol: {symbol}, Net Profit: ${portfolio.symbol_equity[row, -1]:.2f}, "
+                  f"Max Open Positions: {portfolio.exposure[row].max()}")
+        print(f"Initial Balance: ${portfolio_balance:.2f}, Final Balance: ${portfolio.final_balance:.2f}, "
+              f"Net Profit: ${portfolio.final_balance - portfolio_balance:.2f}, "
+              f"Max Open Positions: {portfolio.exposure.sum(axis=0).max()}")
+
+        # Plot the combined equity curve and each symbol's contribution
+        fig, (ax_equity, ax_symbols) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
+        ax_equity.plot(times, portfolio.equity, label="Portfolio Equity")
+        ax_equity.set_title("Portfolio Equity Curve (shared account)")
+        ax_equity.set_ylabel("Balance (USD)")
+        ax_equity.legend()
+        ax_equity.grid()
+        for row, symbol in enumerate(columns_by_symbol):
+            ax_symbols.plot(times, portfolio.symbol_equity[row], label=symbol)
+        ax_symbols.set_title("Profit by Symbol")
+        ax_symbols.set_xlabel("Date")
+        ax_symbols.set_ylabel("Profit (USD)")
+        ax_symbols.legend()
+        ax_symbols.grid()
+        if save_plots:
+            plt.savefig(f"{plot_prefix}_portfolio.png")
+            plt.close(fig)
+        else:
+            plt.show()
+
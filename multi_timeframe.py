@@ -0,0 +1,125 @@
+# Multi-timeframe bars derived from one base series, joined as of closed bars
+#
+# A strategy filtering M1 entries with an H1 trend used to download the H1
+# bars separately and then compare against their latest value, which looks
+# into the future for every earlier bar.  Here higher-timeframe bars are
+# resampled locally from the base bars (M1 -> M5/M15/H1/H4/D1/W1/MN1, with
+# the same bar boundaries as MT5), and higher-timeframe values are aligned
+# to the base bars with an as-of join that only uses higher bars which had
+# fully closed when the base bar closed:
+#
+#     mtf = MultiTimeframe(rates, mt5.TIMEFRAME_M1)
+#     h1 = mtf.bars(mt5.TIMEFRAME_H1)
+#     trend = mtf.align(mt5.TIMEFRAME_H1, indicators.sma(h1["close"], 200))
+#
+# One base download therefore feeds every timeframe a strategy needs.
+# Bars are dicts of NumPy columns with times in epoch seconds.
+
+import numpy as np
+
+from timeframes import TIMEFRAMES, timeframe_seconds
+
+WEEK_OFFSET = 3 * 86400  # 1970-01-01 was a Thursday; weekly bars open on Sunday
+
+
+def _seconds(times):
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        return times.astype("datetime64[s]").astype(np.int64)
+    return times.astype(np.int64)
+
+
+def bar_open(times, timeframe):
+    """
+    Open time of the timeframe bar containing each time (epoch seconds).
+    """
+    times = _seconds(times)
+    if timeframe == TIMEFRAMES["MN1"]:
+        return times.astype("datetime64[s]").astype("datetime64[M]").astype("datetime64[s]").astype(np.int64)
+    period = timeframe_seconds(timeframe)
+    if timeframe == TIMEFRAMES["W1"]:
+        return (times - WEEK_OFFSET) // period * period + WEEK_OFFSET
+    return times - times % period
+
+
+def bar_close(opens, timeframe):
+    """
+    Close time (open time of the next bar) of bars opened at opens.
+    """
+    opens = _seconds(opens)
+    if timeframe == TIMEFRAMES["MN1"]:
+        months = opens.astype("datetime64[s]").astype("datetime64[M]") + 1
+        return months.astype("datetime64[s]").astype(np.int64)
+    return opens + timeframe_seconds(timeframe)
+
+
+def resample(bars, timeframe):
+    """
+    Aggregate base bars (MT5 rates array or dict of columns, sorted by time)
+    into timeframe bars: first open, highest high, lowest low, last close,
+    summed tick volume.  Returns a dict of columns with time = bar open and
+    close_time = bar close.
+    """
+    opens = bar_open(bars["time"], timeframe)
+    if len(opens) == 0:
+        empty = {name: np.empty(0) for name in ("open", "high", "low", "close", "tick_volume")}
+        return dict(empty, time=np.empty(0, dtype=np.int64), close_time=np.empty(0, dtype=np.int64))
+    starts = np.flatnonzero(np.concatenate(([True], opens[1:] != opens[:-1])))
+    ends = np.concatenate((starts[1:], [len(opens)])) - 1
+    result = {
+        "time": opens[starts],
+        "open": np.asarray(bars["open"], dtype=np.float64)[starts],
+        "high": np.maximum.reduceat(np.asarray(bars["high"], dtype=np.float64), starts),
+        "low": np.minimum.reduceat(np.asarray(bars["low"], dtype=np.float64), starts),
+        "close": np.asarray(bars["close"], dtype=np.float64)[ends],
+    }
+    if "tick_volume" in (bars.dtype.names if hasattr(bars, "dtype") else bars):
+        result["tick_volume"] = np.add.reduceat(np.asarray(bars["tick_volume"], dtype=np.float64), starts)
+    result["close_time"] = bar_close(result["time"], timeframe)
+    return result
+
+
+def closed_index(base_close_times, higher_close_times):
+    """
+    For each base bar, the index of the last higher bar closed by the base
+    bar's close (-1 when none has closed yet).
+    """
+    return np.searchsorted(higher_close_times, base_close_times, side="right") - 1
+
+
+def align(base_close_times, higher_close_times, values, fill=np.nan):
+    """
+    Higher-timeframe values as seen at each base bar's close: the value of the
+    last fully closed higher bar, fill before the first one.
+    """
+    index = closed_index(base_close_times, higher_close_times)
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(index >= 0, values[np.maximum(index, 0)], fill)
+
+
+class MultiTimeframe:
+    """
+    All timeframes of one symbol derived from a single base series.
+    """
+
+    def __init__(self, bars, base_timeframe):
+        self.base = bars
+        self.base_timeframe = base_timeframe
+        self.base_close = bar_close(bar_open(bars["time"], base_timeframe), base_timeframe)
+        self._bars = {}
+
+    def bars(self, timeframe):
+        """
+        Bars of timeframe resampled from the base (cached); the base timeframe itself is allowed.
+        """
+        if timeframe not in self._bars:
+            if timeframe != self.base_timeframe and timeframe_seconds(timeframe) <= timeframe_seconds(self.base_timeframe):
+                raise ValueError("Only higher timeframes can be derived from the base bars")
+            self._bars[timeframe] = resample(self.base, timeframe)
+        return self._bars[timeframe]
+
+    def align(self, timeframe, values, fill=np.nan):
+        """
+        Values computed on bars(timeframe), aligned to the base bars using only closed bars.
+        """
+        return align(self.base_close, self.bars(timeframe)["close_time"], values, fill)
@@ -0,0 +1,405 @@
+# Parallel parameter sweeps over the backtest strategies
+#
+# backtest_strategy(df) in the backtest scripts reads its ATR multipliers,
+# EMA windows and RSI thresholds from module globals, so every combination
+# meant a script edit and a full re-run.  Here the strategies take their
+# parameters as a dict, the bars and every indicator column the grid needs
+# are computed once (each indicator family in one batched call, see
+# indicators), and the parameter sets are evaluated on a process pool.
+# The columns are published once in shared memory (shared_columns) and
+# attached zero-copy by the workers, which then only receive small
+# parameter chunks, so the sweep scales with cores and memory stays flat
+# as workers are added.
+#
+#     bars = load_bars(mt5, "EURUSD", mt5.TIMEFRAME_H4, datetime(2024, 1, 1), datetime(2024, 12, 31))
+#     table = run_sweep("ema_rsi_bb", bars, {"atr_multiplier_sl": [1, 1.5, 2], "ema_fast": [5, 9, 13]})
+#
+# The result is a DataFrame with one row per parameter set: the parameters,
+# net profit, trade count, win rate and maximum drawdown.
+#
+# For grids too large to backtest in full, run_halving() evaluates every
+# set on a short slice of history and only extends the best fraction of
+# them to longer slices (successive halving), at a small fraction of the
+# full-grid cost.
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+import bar_cache
+import backtest_engine
+import indicators
+from shared_columns import SharedColumns, attach
+
+
+# Load bars
+def load_bars(mt5, symbol, timeframe, start_date, end_date):
+    """
+    Return the bars of a date range as a dict of NumPy columns, or None.
+    """
+    rates = bar_cache.copy_rates_range(mt5, symbol, timeframe, start_date, end_date)
+    if rates is None or len(rates) == 0:
+        print(f"No data available for {symbol} in the given date range.")
+        return None
+    bars = {name: np.ascontiguousarray(rates[name]) for name in ("open", "high", "low", "close")}
+    bars["time"] = rates["time"].astype("datetime64[s]")
+    return bars
+
+
+class EmaRsiBollinger:
+    """
+    backtest_multi_currency.py / multi_boomer.py: EMA trend, RSI filter,
+    entries at the opposite Bollinger band, ATR stop-loss and take-profit.
+    """
+
+    defaults = {
+        "atr_multiplier_sl": 1, "atr_multiplier_tp": 1.5, "ema_fast": 9, "ema_slow": 21,
+        "rsi_window": 14, "rsi_buy": 30, "rsi_sell": 70, "bb_window": 20, "bb_dev": 2,
+        "atr_window": 14, "start": 21, "lot_size": 0.1, "initial_balance": 10000,
+    }
+
+    def indicators(self, p):
+        return [("EMA", p["ema_fast"]), ("EMA", p["ema_slow"]), ("RSI", p["rsi_window"]),
+                ("ATR", p["atr_window"]), ("BB", p["bb_window"], p["bb_dev"])]
+
+    def signals(self, columns, p):
+        close = columns["close"]
+        ema_fast, ema_slow = columns[f"EMA_{p['ema_fast']}"], columns[f"EMA_{p['ema_slow']}"]
+        rsi = columns[f"RSI_{p['rsi_window']}"]
+        buy_signal = (ema_fast > ema_slow) & (rsi > p["rsi_buy"]) & (close <= columns[f"bb_low_{p['bb_window']}_{p['bb_dev']}"])
+        sell_signal = (ema_fast < ema_slow) & (rsi < p["rsi_sell"]) & (close >= columns[f"bb_high_{p['bb_window']}_{p['bb_dev']}"])
+        return buy_signal, sell_signal
+
+    def backtest(self, columns, p):
+        close = columns["close"]
+        atr = columns[f"ATR_{p['atr_window']}"]
+        buy_signal, sell_signal = self.signals(columns, p)
+        stop_loss = np.where(buy_signal, close - (atr * p["atr_multiplier_sl"]), close + (atr * p["atr_multiplier_sl"]))
+        take_profit = np.where(buy_signal, close + (atr * p["atr_multiplier_tp"]), close - (atr * p["atr_multiplier_tp"]))
+        return backtest_engine.simulate(
+            columns["high"], columns["low"], close, buy_signal, sell_signal, stop_loss, take_profit,
+            start=p["start"], valid=~np.isnan(atr), session_close=self.session_close(columns, p),
+            lot_size=p["lot_size"], initial_balance=p["initial_balance"],
+        )
+
+    def session_close(self, columns, p):
+        return None
+
+
+class EmaRsiSession(EmaRsiBollinger):
+    """
+    intra_backtest.py: EMA trend with an RSI filter, ATR stops and all
+    positions closed at the session end.
+    """
+
+    defaults = {
+        "atr_multiplier_sl": 1.5, "atr_multiplier_tp": 2, "ema_fast": 20, "ema_slow": 50,
+        "rsi_window": 14, "rsi_buy": 50, "rsi_sell": 50, "atr_window": 14,
+        "session_close_time": 16, "start": 50, "lot_size": 0.1, "initial_balance": 10000,
+    }
+
+    def indicators(self, p):
+        return [("EMA", p["ema_fast"]), ("EMA", p["ema_slow"]), ("RSI", p["rsi_window"]), ("ATR", p["atr_window"])]
+
+    def signals(self, columns, p):
+        ema_fast, ema_slow = columns[f"EMA_{p['ema_fast']}"], columns[f"EMA_{p['ema_slow']}"]
+        rsi = columns[f"RSI_{p['rsi_window']}"]
+        return (ema_fast > ema_slow) & (rsi > p["rsi_buy"]), (ema_fast < ema_slow) & (rsi < p["rsi_sell"])
+
+    def session_close(self, columns, p):
+        hour = columns["time"].astype("datetime64[h]").astype(np.int64) % 24
+        return hour >= p["session_close_time"]
+
+
+class SmaCrossBollinger(EmaRsiBollinger):
+    """
+    refined_strategy_backtest.py: SMA crossover confirmed by RSI and a close
+    outside the Bollinger bands, ATR stops and a cooldown between entries.
+    """
+
+    defaults = {
+        "atr_multiplier_sl": 1, "atr_multiplier_tp": 2, "sma_fast": 10, "sma_slow": 30,
+        "rsi_window": 14, "rsi_level": 50, "bb_window": 20, "bb_dev": 2, "atr_window": 14,
+        "cooldown_minutes": 15, "start": 30, "lot_size": 0.1, "initial_balance": 10000,
+    }
+
+    def indicators(self, p):
+        return [("SMA", p["sma_fast"]), ("SMA", p["sma_slow"]), ("RSI", p["rsi_window"]),
+                ("ATR", p["atr_window"]), ("BB", p["bb_window"], p["bb_dev"])]
+
+    def signals(self, columns, p):
+        close = columns["close"]
+        fast, slow = columns[f"SMA_{p['sma_fast']}"], columns[f"SMA_{p['sma_slow']}"]
+        rsi = columns[f"RSI_{p['rsi_window']}"]
+        cross_up = np.zeros(len(close), dtype=bool)
+        cross_down = np.zeros(len(close), dtype=bool)
+        cross_up[1:] = (fast[1:] > slow[1:]) & (fast[:-1] <= slow[:-1])
+        cross_down[1:] = (fast[1:] < slow[1:]) & (fast[:-1] >= slow[:-1])
+        buy_signal = cross_up & (rsi > p["rsi_level"]) & (close > columns[f"bb_high_{p['bb_window']}_{p['bb_dev']}"])
+        sell_signal = cross_down & (rsi < p["rsi_level"]) & (close < columns[f"bb_low_{p['bb_window']}_{p['bb_dev']}"])
+        return buy_signal, sell_signal
+
+    def backtest(self, columns, p):
+        close = columns["close"]
+        atr = columns[f"ATR_{p['atr_window']}"]
+        buy_signal, sell_signal = self.signals(columns, p)
+        stop_loss = np.where(buy_signal, close - (atr * p["atr_multiplier_sl"]), close + (atr * p["atr_multiplier_sl"]))
+        take_profit = np.where(buy_signal, close + (atr * p["atr_multiplier_tp"]), close - (atr * p["atr_multiplier_tp"]))
+        return backtest_engine.simulate(
+            columns["high"], columns["low"], close, buy_signal, sell_signal, stop_loss, take_profit,
+            start=p["start"], times=columns["time"], cooldown=timedelta(minutes=p["cooldown_minutes"]),
+            check_entry_bar=True, lot_size=p["lot_size"], initial_balance=p["initial_balance"],
+        )
+
+
+STRATEGIES = {
+    "ema_rsi_bb": EmaRsiBollinger(),
+    "ema_rsi_session": EmaRsiSession(),
+    "sma_cross_bb": SmaCrossBollinger(),
+}
+
+
+def expand_grid(grid):
+    """
+    Turn {"name": [values], ...} into the list of all combinations; a list of
+    dicts is returned unchanged.
+    """
+    if not isinstance(grid, dict):
+        return [dict(params) for params in grid]
+    names = list(grid)
+    values = [grid[name] if isinstance(grid[name], (list, tuple, np.ndarray)) else [grid[name]] for name in names]
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+
+def prepare_columns(strategy, bars, param_sets, cache=None, cache_key=None):
+    """
+    Bars plus every indicator column any of the parameter sets needs, named
+    after its parameters (EMA_9, RSI_14, ATR_14, bb_high_20_2, ...).
+
+    Indicator keys are ("EMA", window), ("SMA", window), ("RSI", window),
+    ("ATR", window) and ("BB", window, window_dev).  The windows of each kind are computed as one
+    family; with a cache and a (symbol, timeframe, date_range) cache_key,
+    rows computed by earlier sweeps are reused.  A cache without a
+    cache_key raises ValueError, as its rows could belong to other bars.
+    """
+    if cache is None:
+        cache = indicators.IndicatorCache()  # Private to this call: the key only has to be consistent
+        cache_key = cache_key or (None, None, None)
+    elif cache_key is None:
+        raise ValueError("An IndicatorCache needs the (symbol, timeframe, date_range) cache_key of the bars")
+    symbol, timeframe, date_range = cache_key
+    columns = dict(bars)
+    keys = {key for params in param_sets for key in strategy.indicators(params)}
+
+    families = {
+        "EMA": (indicators.ema_family, (bars["close"],)),
+        "SMA": (indicators.sma_family, (bars["close"],)),
+        "RSI": (indicators.rsi_family, (bars["close"],)),
+        "ATR": (indicators.atr_family, (bars["high"], bars["low"], bars["close"])),
+    }
+    for kind, (compute, inputs) in families.items():
+        windows = sorted(key[1] for key in keys if key[0] == kind)
+        if windows:
+            rows = cache.family(symbol, timeframe, date_range, kind, windows, compute, *inputs)
+            columns.update({f"{kind}_{window}": row for window, row in zip(windows, rows)})
+
+    for _, window, window_dev in sorted(key for key in keys if key[0] == "BB"):
+        _, hband, lband = cache.get(
+            (symbol, timeframe, date_range, "BB", (window, window_dev)),
+            lambda: [row[0] for row in indicators.bollinger_family(bars["close"], [window], window_dev)],
+        )
+        columns[f"bb_high_{window}_{window_dev}"] = hband
+        columns[f"bb_low_{window}_{window_dev}"] = lband
+    return columns
+
+
+def summarize(result):
+    """
+    Net profit, trade count, win rate and maximum drawdown of a BacktestResult.
+    """
+    trades = result.trades
+    closed = trades[trades["exit_index"] >= 0]
+    equity = np.concatenate(([float(result.initial_balance)], result.equity_curve))
+    drawdown = np.maximum.accumulate(equity) - equity
+    return {
+        "net_profit": result.final_balance - result.initial_balance,
+        "trades": len(trades),
+        "win_rate": float((closed["profit"] > 0).mean()) if len(closed) else float("nan"),
+        "max_drawdown": float(drawdown.max()),
+        "final_balance": result.final_balance,
+    }
+
+
+def window_columns(columns, params, window):
+    """
+    Columns and parameters for a backtest of bars [lo, hi) only.
+
+    The slices are views; indicators computed over the whole history are
+    already warmed up at lo, so the warm-up start only applies before it.
+    """
+    if window is None:
+        return columns, params
+    lo, hi = window
+    return ({name: values[lo:hi] for name, values in columns.items()},
+            dict(params, start=max(params["start"] - lo, 0)))
+
+
+def evaluate(strategy, columns, params, window=None):
+    """
+    Backtest params on the columns (bars [lo, hi) of them with a window) and
+    return the parameters with the summary.
+    """
+    window_cols, window_params = window_columns(columns, params, window)
+    result = strategy.backtest(window_cols, window_params)
+    return dict(params, **summarize(result))
+
+
+# Process pool workers keep the attached columns of the current sweep
+_worker = {}
+
+
+def _init_worker(strategy_name, handle):
+    _worker["strategy"] = STRATEGIES[strategy_name]
+    _worker["segment"], _worker["columns"] = attach(handle)
+
+
+def _evaluate_chunk(param_sets, window=None):
+    return [evaluate(_worker["strategy"], _worker["columns"], params, window) for params in param_sets]
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class SweepPool:
+    """
+    Evaluates parameter sets of one strategy on one set of columns.
+
+    With more than one worker the columns are published once in shared
+    memory and a process pool attaches them, so any number of evaluate()
+    calls (e.g. one per walk-forward window) reuse the same workers.
+    """
+
+    def __init__(self, strategy_name, columns, workers=None, chunk_size=None):
+        self.strategy = STRATEGIES[strategy_name]
+        self.columns = columns
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.shared = None
+        self.pool = None
+        if self.workers > 1:
+            self.shared = SharedColumns(columns)
+            self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                            initargs=(strategy_name, self.shared.handle()))
+
+    def evaluate(self, param_sets, window=None):
+        """
+        Summary rows of param_sets, on bars [lo, hi) only with a window.
+        """
+        if self.pool is None or len(param_sets) < 2:
+            return [evaluate(self.strategy, self.columns, params, window) for params in param_sets]
+        chunk_size = self.chunk_size or max(1, len(param_sets) // (self.workers * 4))
+        chunks = _chunks(param_sets, chunk_size)
+        return [row for chunk in self.pool.map(_evaluate_chunk, chunks, [window] * len(chunks)) for row in chunk]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.shared.close()
+            self.pool = self.shared = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_sweep(strategy_name, bars, grid, workers=None, chunk_size=None, cache=None, cache_key=None):
+    """
+    Backtest every parameter set of grid on the same bars and return the results table.
+
+    grid: dict of parameter lists (all combinations) or a list of parameter
+        dicts; parameters not given keep the strategy defaults.
+    workers: pool size (default: CPU count); 1 evaluates in this process.
+    cache, cache_key: optional indicators.IndicatorCache and (symbol,
+        timeframe, date_range) of the bars, to reuse indicators across sweeps;
+        a cache requires its cache_key.
+    """
+    strategy = STRATEGIES[strategy_name]
+    param_sets = [dict(strategy.defaults, **params) for params in expand_grid(grid)]
+    columns = prepare_columns(strategy, bars, param_sets, cache, cache_key)
+    workers = min(workers or os.cpu_count() or 1, len(param_sets)) or 1
+    with SweepPool(strategy_name, columns, workers, chunk_size) as pool:
+        rows = pool.evaluate(param_sets)
+    return pd.DataFrame(rows)
+
+
+def run_halving(strategy_name, bars, grid, eta=3, min_bars=2000, metric="net_profit", workers=None,
+                chunk_size=None, cache=None, cache_key=None):
+    """
+    Successive-halving search: evaluate every parameter set of grid on a
+    short first slice of the bars, keep the best 1/eta, evaluate those on a
+    eta times longer slice, and so on until the survivors run on all bars.
+
+    Slices start at the first bar and are at least min_bars long.  Returns
+    one row per parameter set with its summary on the longest slice it
+    reached ("bars" and "rung" columns), best full-history rows first.
+    """
+    strategy = STRATEGIES[strategy_name]
+    param_sets = [dict(strategy.defaults, **params) for params in expand_grid(grid)]
+    columns = prepare_columns(strategy, bars, param_sets, cache, cache_key)
+    n = len(bars["close"])
+    rungs = 0
+    while eta ** (rungs + 1) < len(param_sets) and n // eta ** (rungs + 1) >= min_bars:
+        rungs += 1
+
+    rows = []
+    candidates = param_sets
+    with SweepPool(strategy_name, columns, workers, chunk_size) as pool:
+        for rung in range(rungs + 1):
+            length = n // eta ** (rungs - rung)
+            results = pool.evaluate(candidates, (0, length))
+            for row in results:
+                row.update(bars=length, rung=rung)
+            scores = np.array([row[metric] for row in results], dtype=np.float64)
+            order = np.argsort(-np.nan_to_num(scores, nan=-np.inf), kind="stable")
+            keep = order[:max(1, -(-len(candidates) // eta))] if rung < rungs else order
+            dropped = np.setdiff1d(order, keep) if rung < rungs else []
+            rows.extend(results[i] for i in dropped)
+            if rung == rungs:
+                rows.extend(results[i] for i in keep)
+            candidates = [candidates[i] for i in keep]
+
+    table = pd.DataFrame(rows)
+    return table.sort_values(["rung", metric], ascending=False, kind="stable").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    try:
+        import MetaTrader5 as mt5
+    except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+        import mt5_offline as mt5
+    from datetime import datetime
+
+    # Initialize MetaTrader 5 connection
+    if not mt5.initialize():
+        print("Failed to initialize MT5!")
+        quit()
+
+    bars = load_bars(mt5, "EURUSD", mt5.TIMEFRAME_H4, datetime(2024, 1, 1), datetime(2024, 12, 31, 23, 59))
+    mt5.shutdown()
+    if bars is not None:
+        grid = {
+            "atr_multiplier_sl": [0.75, 1, 1.5, 2],
+            "atr_multiplier_tp": [1, 1.5, 2, 3],
+            "ema_fast": [5, 9, 13],
+            "ema_slow": [21, 34, 50],
+            "rsi_buy": [30, 40],
+            "rsi_sell": [60, 70],
+        }
+        table = run_sweep("ema_rsi_bb", bars, grid)
+        print(table.sort_values("net_profit", ascending=False).head(10).to_string(index=False))
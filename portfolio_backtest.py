@@ -0,0 +1,144 @@
+# Portfolio backtest of several symbols against one shared account
+#
+# backtest_multi_currency.py and multi_boomer.py backtest EURUSD, GBPUSD and
+# USDJPY one after the other, each with its own $10,000 balance, so the
+# combined exposure and equity of running them together is never seen.
+# Here the symbols are laid out on their common time axis as 2-D
+# (symbol x bar) arrays and simulated in one vectorized pass: the
+# stop-loss/take-profit exits of every symbol's positions come from a
+# single first_exits() call over the flattened rows (each position's scan
+# ends with its own row), and all closed trades are booked against one
+# balance in time order.
+#
+#     times, present, arrays = align(columns_by_symbol, ["high", "low", "close", "buy", "sell", "sl", "tp"])
+#     result = simulate(arrays["high"], arrays["low"], arrays["close"], arrays["buy"], arrays["sell"],
+#                       arrays["sl"], arrays["tp"], present=present, start=21)
+#
+# result.equity is the combined balance, result.symbol_equity the profit of
+# each symbol and result.exposure the open positions of each symbol, all
+# per bar of the common axis.  With fixed lot sizes each symbol's trades
+# are the ones backtest_engine.simulate() gives for it alone.
+
+from collections import namedtuple
+import numpy as np
+
+import backtest_engine
+from exit_kernel import first_exits
+
+# Trades of a portfolio run: backtest_engine trades plus the symbol row;
+# entry_index/exit_index are bars of the common time axis
+TRADE_DTYPE = np.dtype([("symbol", "<i8")] + backtest_engine.TRADE_DTYPE.descr)
+
+PortfolioResult = namedtuple(
+    "PortfolioResult", "trades equity symbol_equity exposure initial_balance final_balance"
+)
+
+
+def align(columns_by_symbol, names):
+    """
+    Lay out each symbol's columns on the sorted union of their bar times.
+
+    columns_by_symbol: {symbol: {"time": ..., name: values, ...}} in symbol order.
+    Returns (times, present, arrays): present[s, t] is True where symbol s has a
+    bar at times[t], and arrays[name] is (symbols x bars), NaN (False for
+    boolean columns) where a symbol has no bar.
+    """
+    symbol_times = [np.asarray(columns["time"]) for columns in columns_by_symbol.values()]
+    times = np.unique(np.concatenate(symbol_times)) if symbol_times else np.empty(0)
+    shape = (len(symbol_times), len(times))
+    present = np.zeros(shape, dtype=bool)
+    positions = [np.searchsorted(times, row_times) for row_times in symbol_times]
+    for row, position in enumerate(positions):
+        present[row, position] = True
+
+    arrays = {}
+    for name in names:
+        rows = [np.asarray(columns[name]) for columns in columns_by_symbol.values()]
+        is_bool = all(row.dtype == bool for row in rows)
+        values = np.zeros(shape, dtype=bool) if is_bool else np.full(shape, np.nan)
+        for row, (position, row_values) in enumerate(zip(positions, rows)):
+            values[row, position] = row_values
+        arrays[name] = values
+    return times, present, arrays
+
+
+def simulate(high, low, close, long_entries, short_entries, stop_loss, take_profit, present=None,
+             start=0, valid=None, intrabar=None, lot_size=0.1, initial_balance=10000, contract_size=100000):
+    """
+    Backtest market entries at the bar close with fixed SL/TP exits for every
+    symbol row of (symbols x bars) arrays, against one balance.
+
+    present: bars each symbol actually has (default: all).
+    start: first bar processed, counted in each symbol's own bars.
+    valid: optional mask of bars to process at all (e.g. ATR not NaN).
+    intrabar: optional intrabar.IntrabarResolver per symbol (None for none),
+        built on the common time axis, resolving exits on bars touching both
+        SL and TP.
+    lot_size, contract_size: a scalar or one value per symbol.
+
+    Returns a PortfolioResult: trades in (symbol, entry) order, the combined
+    balance and each symbol's realized profit after every bar of the axis,
+    the open positions of each symbol per bar and the final balance.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    stop_loss = np.asarray(stop_loss, dtype=np.float64)
+    take_profit = np.asarray(take_profit, dtype=np.float64)
+    symbols, n = close.shape
+    present = np.ones((symbols, n), dtype=bool) if present is None else np.asarray(present, dtype=bool)
+
+    # Bars each symbol processes: its own bars from its start-th on
+    active = present & (np.cumsum(present, axis=1) > start)
+    if valid is not None:
+        active &= np.asarray(valid, dtype=bool)
+    long_entries = np.asarray(long_entries, dtype=bool) & active
+    short_entries = np.asarray(short_entries, dtype=bool) & active & ~long_entries
+    entry_symbol, entry_bar = np.nonzero(long_entries | short_entries)
+
+    # One exit scan over the flattened rows, each position stopping at the end of its row
+    direction = np.where(long_entries[entry_symbol, entry_bar], 1, -1).astype(np.int8)
+    flat = entry_symbol * n + entry_bar
+    exit_flat, exit_price, reason = first_exits(
+        np.where(active, high, -np.inf).ravel(), np.where(active, low, np.inf).ravel(),
+        direction, stop_loss.ravel()[flat], take_profit.ravel()[flat], flat + 1,
+        scan_to=(entry_symbol + 1) * n,
+    )
+    for row, resolver in enumerate(intrabar or ()):
+        mine = np.flatnonzero(entry_symbol == row)
+        if resolver is not None and len(mine):
+            exit_bar = np.where(exit_flat[mine] >= 0, exit_flat[mine] - row * n, -1)
+            exit_price[mine], reason[mine] = resolver.resolve(
+                exit_bar, direction[mine], stop_loss.ravel()[flat[mine]], take_profit.ravel()[flat[mine]],
+                high[row], low[row], exit_price[mine], reason[mine], entry_bar[mine])
+
+    lot_size = np.broadcast_to(np.asarray(lot_size, dtype=np.float64), (symbols,))
+    contract_size = np.broadcast_to(np.asarray(contract_size, dtype=np.float64), (symbols,))
+    trades = np.zeros(len(flat), dtype=TRADE_DTYPE)
+    trades["symbol"] = entry_symbol
+    trades["entry_index"] = entry_bar
+    trades["exit_index"] = np.where(exit_flat >= 0, exit_flat - entry_symbol * n, -1)
+    trades["direction"] = direction
+    trades["entry_price"] = close[entry_symbol, entry_bar]
+    trades["stop_loss"] = stop_loss[entry_symbol, entry_bar]
+    trades["take_profit"] = take_profit[entry_symbol, entry_bar]
+    trades["exit_price"] = exit_price
+    trades["reason"] = reason
+    move = np.where(direction > 0, exit_price - trades["entry_price"], trades["entry_price"] - exit_price)
+    closed = exit_flat >= 0
+    trades["profit"] = np.where(closed, move * contract_size[entry_symbol] * lot_size[entry_symbol], 0.0)
+
+    # Realized profit per symbol and bar, then the shared balance
+    booked = np.zeros((symbols, n))
+    np.add.at(booked, (entry_symbol[closed], trades["exit_index"][closed]), trades["profit"][closed])
+    symbol_equity = np.cumsum(booked, axis=1)
+    equity = initial_balance + np.cumsum(booked.sum(axis=0))
+
+    # Open positions: from the entry bar through the exit bar (or the end)
+    changes = np.zeros((symbols, n + 1), dtype=np.int64)
+    np.add.at(changes, (entry_symbol, entry_bar), 1)
+    np.add.at(changes, (entry_symbol, np.where(closed, trades["exit_index"] + 1, n)), -1)
+    exposure = np.cumsum(changes[:, :n], axis=1)
+
+    final_balance = equity[-1] if n else float(initial_balance)
+    return PortfolioResult(trades, equity, symbol_equity, exposure, initial_balance, final_balance)
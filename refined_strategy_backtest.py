@@ -1,9 +1,14 @@
-import MetaTrader5 as mt5
+try:
+    import MetaTrader5 as mt5
+except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+    import mt5_offline as mt5
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
-from ta.volatility import AverageTrueRange, BollingerBands
-from ta.momentum import RSIIndicator
+import bar_cache
+import indicators
+import backtest_engine
 
 # Initialize MetaTrader 5 connection
 if not mt5.initialize():
@@ -20,7 +25,7 @@ start_time = datetime(today.year, today.month, today.day - 5, 6, 0)  # Start fet
 end_time = datetime(today.year, today.month, today.day, 17, 0)  # End trading at 5:00 PM UTC
 
 # Fetch historical data for the day
-rates = mt5.copy_rates_range(symbol, timeframe, start_time, end_time)
+rates = bar_cache.copy_rates_range(mt5, symbol, timeframe, start_time, end_time)
 if rates is None or len(rates) < 30:  # Ensure at least 30 rows for calculations
     print(f"Insufficient historical data for backtesting. Rows fetched: {len(rates) if rates else 0}")
     mt5.shutdown()
@@ -33,7 +38,7 @@ df.set_index('time', inplace=True)
 
 # Ensure there are enough rows for ATR calculation
 if len(df) >= 14:  # ATR requires at least 14 rows
-    df['ATR'] = AverageTrueRange(high=df['high'], low=df['low'], close=df['close'], window=14).average_true_range()
+    df['ATR'] = indicators.atr(df['high'], df['low'], df['close'], 14)
 else:
     print("Not enough data to calculate ATR")
     mt5.shutdown()
@@ -42,78 +47,55 @@ else:
 # Calculate Moving Averages, RSI, and Bollinger Bands
 df['SMA_10'] = df['close'].rolling(window=10).mean()
 df['SMA_30'] = df['close'].rolling(window=30).mean()
-df['RSI'] = RSIIndicator(close=df['close'], window=14).rsi()
-bb = BollingerBands(close=df['close'], window=20, window_dev=2)
-df['bb_high'] = bb.bollinger_hband()
-df['bb_low'] = bb.bollinger_lband()
+df['RSI'] = indicators.rsi(df['close'], 14)
+_, df['bb_high'], df['bb_low'] = indicators.bollinger_bands(df['close'], window=20, window_dev=2)
 
 # Define trading parameters
 initial_balance = 10000  # Initial capital in USD
-balance = initial_balance
 lot_size = 0.1  # Lot size per trade (fixed)
-positions = []  # Track open positions
-equity_curve = []  # Track balance over time
 cooldown_period = timedelta(minutes=15)  # Cooldown between trades
-last_trade_time = None  # Track the time of the last trade
 
 # Backtest intraday strategy
-for i in range(30, len(df)):
-    # Ensure cooldown period is respected
-    if last_trade_time is not None and (df.index[i] - last_trade_time) < cooldown_period:
-        equity_curve.append(balance)
-        continue
-
-    # Check for buy signal
-    if df['SMA_10'][i] > df['SMA_30'][i] and df['SMA_10'][i - 1] <= df['SMA_30'][i - 1] and df['RSI'][i] > 50 and df['close'][i] > df['bb_high'][i]:
-        entry_price = df['close'][i]
-        stop_loss = entry_price - (df['ATR'][i] * 1)  # 1 ATR below entry price
-        take_profit = entry_price + (df['ATR'][i] * 2)  # 2 ATR above entry price
-        positions.append((entry_price, stop_loss, take_profit, "buy"))
-        last_trade_time = df.index[i]
-        print(f"Buy Signal at {df.index[i]} - Price: {entry_price}, SL: {stop_loss}, TP: {take_profit}")
-
-    # Check for sell signal
-    elif df['SMA_10'][i] < df['SMA_30'][i] and df['SMA_10'][i - 1] >= df['SMA_30'][i - 1] and df['RSI'][i] < 50 and df['close'][i] < df['bb_low'][i]:
-        entry_price = df['close'][i]
-        stop_loss = entry_price + (df['ATR'][i] * 1)  # 1 ATR above entry price
-        take_profit = entry_price - (df['ATR'][i] * 2)  # 2 ATR below entry price
-        positions.append((entry_price, stop_loss, take_profit, "sell"))
-        last_trade_time = df.index[i]
-        print(f"Sell Signal at {df.index[i]} - Price: {entry_price}, SL: {stop_loss}, TP: {take_profit}")
-
-    # Check existing positions for stop-loss/take-profit
-    closed_positions = []
-    for position in positions:
-        entry_price, stop_loss, take_profit, direction = position
-        if direction == "buy":
-            if df['low'][i] <= stop_loss:  # Stop-loss hit
-                profit = (stop_loss - entry_price) * 100000 * lot_size
-                balance += profit
-                print(f"Stop-Loss Hit (Buy) at {df.index[i]} - Price: {stop_loss}, Profit: {profit:.2f}")
-                closed_positions.append(position)
-            elif df['high'][i] >= take_profit:  # Take-profit hit
-                profit = (take_profit - entry_price) * 100000 * lot_size
-                balance += profit
-                print(f"Take-Profit Hit (Buy) at {df.index[i]} - Price: {take_profit}, Profit: {profit:.2f}")
-                closed_positions.append(position)
-        elif direction == "sell":
-            if df['high'][i] >= stop_loss:  # Stop-loss hit
-                profit = (entry_price - stop_loss) * 100000 * lot_size
-                balance += profit
-                print(f"Stop-Loss Hit (Sell) at {df.index[i]} - Price: {stop_loss}, Profit: {profit:.2f}")
-                closed_positions.append(position)
-            elif df['low'][i] <= take_profit:  # Take-profit hit
-                profit = (entry_price - take_profit) * 100000 * lot_size
-                balance += profit
-                print(f"Take-Profit Hit (Sell) at {df.index[i]} - Price: {take_profit}, Profit: {profit:.2f}")
-                closed_positions.append(position)
-
-    # Remove closed positions
-    for position in closed_positions:
-        positions.remove(position)
-
-    # Track equity over time
-    equity_curve.append(balance)
+close = df['close'].to_numpy()
+atr = df['ATR'].to_numpy()
+sma_10 = df['SMA_10'].to_numpy()
+sma_30 = df['SMA_30'].to_numpy()
+rsi = df['RSI'].to_numpy()
+cross_up = np.zeros(len(df), dtype=bool)
+cross_down = np.zeros(len(df), dtype=bool)
+cross_up[1:] = (sma_10[1:] > sma_30[1:]) & (sma_10[:-1] <= sma_30[:-1])
+cross_down[1:] = (sma_10[1:] < sma_30[1:]) & (sma_10[:-1] >= sma_30[:-1])
+
+# Buy signal: SMA 10 crosses above SMA 30, RSI > 50, close above upper band
+buy_signal = cross_up & (rsi > 50) & (close > df['bb_high'].to_numpy())
+# Sell signal: SMA 10 crosses below SMA 30, RSI < 50, close below lower band
+sell_signal = cross_down & (rsi < 50) & (close < df['bb_low'].to_numpy())
+stop_loss = np.where(buy_signal, close - (atr * 1), close + (atr * 1))  # 1 ATR from entry price
+take_profit = np.where(buy_signal, close + (atr * 2), close - (atr * 2))  # 2 ATR from entry price
+
+# Entries respect the cooldown period; open positions are checked against
+# SL/TP from the entry bar on, except on bars inside a cooldown
+result = backtest_engine.simulate(
+    df['high'].to_numpy(), df['low'].to_numpy(), close,
+    buy_signal, sell_signal, stop_loss, take_profit,
+    start=30,
+    times=df.index.to_numpy(),
+    cooldown=cooldown_period,
+    check_entry_bar=True,
+    lot_size=lot_size,
+    initial_balance=initial_balance,
+)
+balance = result.final_balance
+equity_curve = result.equity_curve
+
+# Trade log
+for trade in result.trades:
+    side = "Buy" if trade['direction'] > 0 else "Sell"
+    print(f"{side} Signal at {df.index[trade['entry_index']]} - Price: {trade['entry_price']}, SL: {trade['stop_loss']}, TP: {trade['take_profit']}")
+    if trade['reason'] == backtest_engine.STOP_LOSS:
+        print(f"Stop-Loss Hit ({side}) at {df.index[trade['exit_index']]} - Price: {trade['exit_price']}, Profit: {trade['profit']:.2f}")
+    elif trade['reason'] == backtest_engine.TAKE_PROFIT:
+        print(f"Take-Profit Hit ({side}) at {df.index[trade['exit_index']]} - Price: {trade['exit_price']}, Profit: {trade['profit']:.2f}")
 
 # Plot the equity curve
 plt.figure(figsize=(12, 6))
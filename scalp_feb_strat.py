@@ -1,10 +1,14 @@
-import MetaTrader5 as mt5
+try:
+    import MetaTrader5 as mt5
+except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+    import mt5_offline as mt5
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
-from ta.trend import EMAIndicator
-from ta.momentum import RSIIndicator
-from ta.volatility import BollingerBands, AverageTrueRange
+import bar_cache
+import indicators
+import backtest_engine
 
 # Initialize MetaTrader 5 connection
 if not mt5.initialize():
@@ -25,10 +29,9 @@ lot_size = 0.1  # Fixed lot size
 atr_multiplier_sl = 1  # Stop-loss = 1 ATR
 atr_multiplier_tp = 1.5  # Take-profit = 1.5 ATR
 cooldown_period = timedelta(minutes=2)  # Minimum time between trades
-last_trade_time = None  # Track last trade time
 
 # Fetch historical data
-rates = mt5.copy_rates_range(symbol, timeframe, start_date, end_date)
+rates = bar_cache.copy_rates_range(mt5, symbol, timeframe, start_date, end_date)
 if rates is None or len(rates) == 0:
     print(f"No data available for {symbol}. Exiting...")
     mt5.shutdown()
@@ -50,86 +53,54 @@ if len(df) < 14:  # ATR requires at least 14 rows
     quit()
 
 # Calculate indicators
-df['EMA_9'] = EMAIndicator(close=df['close'], window=9).ema_indicator()
-df['EMA_21'] = EMAIndicator(close=df['close'], window=21).ema_indicator()
-df['RSI'] = RSIIndicator(close=df['close'], window=14).rsi()
-bb = BollingerBands(close=df['close'], window=20, window_dev=2)
-df['bb_high'] = bb.bollinger_hband()
-df['bb_low'] = bb.bollinger_lband()
-atr = AverageTrueRange(high=df['high'], low=df['low'], close=df['close'], window=14)
-df['ATR'] = atr.average_true_range()
+df['EMA_9'] = indicators.ema(df['close'], 9)
+df['EMA_21'] = indicators.ema(df['close'], 21)
+df['RSI'] = indicators.rsi(df['close'], 14)
+_, df['bb_high'], df['bb_low'] = indicators.bollinger_bands(df['close'], window=20, window_dev=2)
+df['ATR'] = indicators.atr(df['high'], df['low'], df['close'], 14)
 
 # Debugging: Print the calculated indicators
 print("Indicators calculated successfully.")
 print(df[['EMA_9', 'EMA_21', 'RSI', 'bb_high', 'bb_low', 'ATR']].head())
 
 # Backtesting logic
-balance = initial_balance
-positions = []  # Track open positions
-equity_curve = []  # Track balance over time
-
-for i in range(21, len(df)):  # Start after enough data for EMA and ATR
-    atr_value = df['ATR'][i]
-    if pd.isna(atr_value):  # Skip if ATR is not available
-        continue
-
-    current_price = df['close'][i]
-    ema_9 = df['EMA_9'][i]
-    ema_21 = df['EMA_21'][i]
-    rsi = df['RSI'][i]
-
-    # Ensure cooldown period is respected
-    if last_trade_time is not None and (df.index[i] - last_trade_time) < cooldown_period:
-        equity_curve.append(balance)
-        continue
-
-    # Buy signal: EMA 9 > EMA 21, RSI > 30, and price near lower Bollinger Band
-    if ema_9 > ema_21 and rsi > 30 and current_price <= df['bb_low'][i]:
-        entry_price = current_price
-        stop_loss = entry_price - (atr_value * atr_multiplier_sl)
-        take_profit = entry_price + (atr_value * atr_multiplier_tp)
-        positions.append((entry_price, stop_loss, take_profit, "buy"))
-        last_trade_time = df.index[i]
-        print(f"Buy signal on {df.index[i]} at {entry_price:.4f}")
-
-    # Sell signal: EMA 9 < EMA 21, RSI < 70, and price near upper Bollinger Band
-    elif ema_9 < ema_21 and rsi < 70 and current_price >= df['bb_high'][i]:
-        entry_price = current_price
-        stop_loss = entry_price + (atr_value * atr_multiplier_sl)
-        take_profit = entry_price - (atr_value * atr_multiplier_tp)
-        positions.append((entry_price, stop_loss, take_profit, "sell"))
-        last_trade_time = df.index[i]
-        print(f"Sell signal on {df.index[i]} at {entry_price:.4f}")
-
-    # Check open positions
-    closed_positions = []
-    for position in positions:
-        entry_price, stop_loss, take_profit, direction = position
-        if direction == "buy":
-            if df['low'][i] <= stop_loss:  # Stop-loss hit
-                balance -= (entry_price - stop_loss) * 100000 * lot_size
-                print(f"Stop-loss hit (Buy) on {df.index[i]}: {stop_loss:.4f}")
-                closed_positions.append(position)
-            elif df['high'][i] >= take_profit:  # Take-profit hit
-                balance += (take_profit - entry_price) * 100000 * lot_size
-                print(f"Take-profit hit (Buy) on {df.index[i]}: {take_profit:.4f}")
-                closed_positions.append(position)
-        elif direction == "sell":
-            if df['high'][i] >= stop_loss:  # Stop-loss hit
-                balance -= (stop_loss - entry_price) * 100000 * lot_size
-                print(f"Stop-loss hit (Sell) on {df.index[i]}: {stop_loss:.4f}")
-                closed_positions.append(position)
-            elif df['low'][i] <= take_profit:  # Take-profit hit
-                balance += (entry_price - take_profit) * 100000 * lot_size
-                print(f"Take-profit hit (Sell) on {df.index[i]}: {take_profit:.4f}")
-                closed_positions.append(position)
-
-    # Remove closed positions
-    for position in closed_positions:
-        positions.remove(position)
-
-    # Track equity
-    equity_curve.append(balance)
+close = df['close'].to_numpy()
+atr_values = df['ATR'].to_numpy()
+ema_9 = df['EMA_9'].to_numpy()
+ema_21 = df['EMA_21'].to_numpy()
+rsi = df['RSI'].to_numpy()
+
+# Buy signal: EMA 9 > EMA 21, RSI > 30, and price near lower Bollinger Band
+buy_signal = (ema_9 > ema_21) & (rsi > 30) & (close <= df['bb_low'].to_numpy())
+# Sell signal: EMA 9 < EMA 21, RSI < 70, and price near upper Bollinger Band
+sell_signal = (ema_9 < ema_21) & (rsi < 70) & (close >= df['bb_high'].to_numpy())
+stop_loss = np.where(buy_signal, close - (atr_values * atr_multiplier_sl), close + (atr_values * atr_multiplier_sl))
+take_profit = np.where(buy_signal, close + (atr_values * atr_multiplier_tp), close - (atr_values * atr_multiplier_tp))
+
+# Entries respect the cooldown period; open positions are checked against
+# SL/TP from the entry bar on, except on bars inside a cooldown
+result = backtest_engine.simulate(
+    df['high'].to_numpy(), df['low'].to_numpy(), close,
+    buy_signal, sell_signal, stop_loss, take_profit,
+    start=21,  # Start after enough data for EMA and ATR
+    valid=~np.isnan(atr_values),  # Skip if ATR is not available
+    times=df.index.to_numpy(),
+    cooldown=cooldown_period,
+    check_entry_bar=True,
+    lot_size=lot_size,
+    initial_balance=initial_balance,
+)
+balance = result.final_balance
+equity_curve = result.equity_curve
+
+# Trade log
+for trade in result.trades:
+    side = "Buy" if trade['direction'] > 0 else "Sell"
+    print(f"{side} signal on {df.index[trade['entry_index']]} at {trade['entry_price']:.4f}")
+    if trade['reason'] == backtest_engine.STOP_LOSS:
+        print(f"Stop-loss hit ({side}) on {df.index[trade['exit_index']]}: {trade['exit_price']:.4f}")
+    elif trade['reason'] == backtest_engine.TAKE_PROFIT:
+        print(f"Take-profit hit ({side}) on {df.index[trade['exit_index']]}: {trade['exit_price']:.4f}")
 
 # Plot the equity curve
 plt.figure(figsize=(12, 6))
@@ -0,0 +1,95 @@
+# Bar and indicator columns in shared memory for process-pool workers
+#
+# Handing the column dict of a backtest to pool workers pickles a full copy
+# into every worker, so with a year of M1 bars for several symbols the
+# worker count is limited by RAM rather than CPUs.  SharedColumns copies the
+# columns once into a single shared-memory block; workers attach to it by
+# name and get read-only NumPy views on the same pages, so memory stays flat
+# however many workers there are.
+#
+#     with SharedColumns(columns) as shared:
+#         pool = ProcessPoolExecutor(initializer=init, initargs=(shared.handle(),))
+#         ...
+#
+#     def init(handle):
+#         segment, columns = attach(handle)  # keep segment referenced
+
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+
+ALIGNMENT = 64  # Cache-line aligned columns
+
+
+class SharedColumns:
+    """
+    A dict of NumPy arrays published in one shared-memory block.
+
+    The creating process owns the block: close() releases and unlinks it.
+    """
+
+    def __init__(self, columns):
+        self.layout = []
+        offset = 0
+        for name, values in columns.items():
+            values = np.asarray(values)
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            self.layout.append((name, values.dtype.str, values.shape, offset))
+            offset += values.nbytes
+        self.segment = SharedMemory(create=True, size=max(offset, 1))
+        self.columns = _views(self.segment, self.layout)
+        for name, values in columns.items():
+            self.columns[name][...] = values
+            self.columns[name].flags.writeable = False
+        self.nbytes = offset
+
+    def handle(self):
+        """
+        Small picklable description for attach().
+        """
+        return self.segment.name, self.layout
+
+    def close(self):
+        if self.segment is not None:
+            self.columns = {}
+            self.segment.close()
+            self.segment.unlink()
+            self.segment = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _views(segment, layout):
+    return {
+        name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf, offset=offset)
+        for name, dtype, shape, offset in layout
+    }
+
+
+def attach(handle):
+    """
+    Attach to published columns; returns (segment, read-only column views).
+
+    The segment must stay referenced as long as the views are used.  The
+    attaching process never unlinks the block: that is left to its owner.
+    """
+    name, layout = handle
+    try:
+        segment = SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers every attached block with the resource
+        # tracker, which would unlink it when the first worker exits
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            segment = SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+    columns = _views(segment, layout)
+    for values in columns.values():
+        values.flags.writeable = False
+    return segment, columns
@@ -0,0 +1,308 @@
+# Single-process host for many live strategy instances
+#
+# gbpusd_thur.py, usdjpy_thur.py and monday_27_strat.py are the same
+# strategy with a different symbol and cooldown, each running as its own
+# process with its own terminal session and polling loop.  The host loads
+# any number of instances from a JSON config and runs them in one process
+# with one terminal connection, one market-data cache (a ring buffer per
+# symbol/timeframe, shared indicator states) and one bar scheduler:
+#
+#     python strategy_host.py [strategies.json]
+#
+# Config format (defaults in STRATEGY_DEFAULTS):
+#
+#     {"max_workers": 1,
+#      "strategies": [
+#          {"name": "gbpusd_thur", "type": "ema_rsi", "symbol": "GBPUSD", "timeframe": "M1",
+#           "atr_multiplier_sl": 1.5, "atr_multiplier_tp": 2, "cooldown_minutes": 1}]}
+#
+# With max_workers > 1 the symbols are processed concurrently (AsyncBarRunner).
+# Stage latencies per symbol (latency.LatencyRecorder) are written as text
+# metrics to "latency_path" every "latency_interval" seconds and, with
+# "metrics_port", served over HTTP.
+
+try:
+    import MetaTrader5 as mt5
+except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+    import mt5_offline as mt5
+import json
+import math
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from async_runner import AsyncBarRunner
+from bar_buffer import BarRingBuffer
+from bar_scheduler import BarScheduler
+from latency import LatencyRecorder
+from streaming_indicators import IndicatorState
+from timeframes import TIMEFRAMES
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "strategies.json")
+
+# Stage latency histograms of every strategy in the process
+latency = LatencyRecorder()
+
+STRATEGY_DEFAULTS = {
+    "type": "ema_rsi",
+    "timeframe": "M1",
+    "lot_size": 0.1,
+    "atr_multiplier_sl": 1.5,
+    "atr_multiplier_tp": 2,
+    "cooldown_minutes": 1,
+    "ema_fast": 9,
+    "ema_slow": 21,
+    "rsi_window": 14,
+    "atr_window": 14,
+    "deviation": 10,
+    "magic": 123456,
+    "comment": "Live Trading Strategy",
+}
+
+
+class MarketData:
+    """
+    Closed bars and indicator states shared by all strategies of the host.
+
+    One ring buffer per symbol/timeframe is polled once per closed bar, and
+    strategies asking for the same indicator set share one IndicatorState.
+    """
+
+    def __init__(self, mt5, capacity=200):
+        self.mt5 = mt5
+        self.capacity = capacity
+        self.buffers = {}
+        self.states = {}  # (symbol, timeframe) -> {indicator params: IndicatorState}
+
+    def indicators(self, symbol, timeframe, **params):
+        """
+        Return the shared IndicatorState of symbol/timeframe for these parameters.
+        """
+        key = (symbol, timeframe)
+        if key not in self.buffers:
+            self.buffers[key] = BarRingBuffer(symbol, timeframe, self.capacity)
+            self.states[key] = {}
+        params_key = tuple(sorted(params.items()))
+        if params_key not in self.states[key]:
+            self.states[key][params_key] = IndicatorState(**params)
+        return self.states[key][params_key]
+
+    def update(self, symbol, timeframe):
+        """
+        Fetch the bars closed since the last update and feed every indicator state.
+        """
+        bars = self.buffers[(symbol, timeframe)]
+        with latency.time(symbol, "fetch"):
+            added = bars.poll(self.mt5)
+        if added is None:
+            print(f"Failed to fetch data for {symbol}.")
+            return False
+        with latency.time(symbol, "indicators"):
+            for state in self.states[(symbol, timeframe)].values():
+                # One bar the state has seen as overlap; None: bars were missed, warm up again
+                if state.update_rates(bars.view(added + 1)) is None:
+                    state.update_rates(bars.view())
+        return True
+
+
+# Place order
+def place_order(symbol, action, lot, sl_price, tp_price, deviation=10, magic=123456,
+                comment="Live Trading Strategy"):
+    """
+    Place a market order with the given parameters.
+    """
+    order_type = mt5.ORDER_TYPE_BUY if action == "buy" else mt5.ORDER_TYPE_SELL
+    with latency.time(symbol, "tick"):
+        tick = mt5.symbol_info_tick(symbol)
+    if tick is None:
+        print(f"No price for {symbol}.")
+        return False
+    price = tick.ask if action == "buy" else tick.bid
+
+    request = {
+        "action": mt5.TRADE_ACTION_DEAL,
+        "symbol": symbol,
+        "volume": lot,
+        "type": order_type,
+        "price": price,
+        "sl": sl_price,
+        "tp": tp_price,
+        "deviation": deviation,
+        "magic": magic,
+        "comment": comment,
+        "type_time": mt5.ORDER_TIME_GTC,
+        "type_filling": mt5.ORDER_FILLING_IOC,
+    }
+
+    with latency.time(symbol, "order_send"):
+        result = mt5.order_send(request)
+    if result.retcode != mt5.TRADE_RETCODE_DONE:
+        print(f"Order failed for {symbol}. Error code: {result.retcode}")
+        return False
+    print(f"Order placed: {symbol}, {action}, Volume: {lot}, SL: {sl_price}, TP: {tp_price}")
+    return True
+
+
+class EmaRsiStrategy:
+    """
+    EMA crossover with an RSI filter and ATR stops (gbpusd_thur.py and friends).
+    """
+
+    def __init__(self, market, name, symbol, timeframe, lot_size, atr_multiplier_sl,
+                 atr_multiplier_tp, cooldown_minutes, ema_fast, ema_slow, rsi_window,
+                 atr_window, deviation, magic, comment, **params):
+        self.name = name
+        self.symbol = symbol
+        self.timeframe = TIMEFRAMES[timeframe] if isinstance(timeframe, str) else timeframe
+        self.lot_size = lot_size
+        self.atr_multiplier_sl = atr_multiplier_sl
+        self.atr_multiplier_tp = atr_multiplier_tp
+        self.cooldown_period = timedelta(minutes=cooldown_minutes)
+        self.ema_fast = f"EMA_{ema_fast}"
+        self.ema_slow = f"EMA_{ema_slow}"
+        self.warmup = max(ema_fast, ema_slow, rsi_window, atr_window)
+        self.order_options = {"deviation": deviation, "magic": magic, "comment": comment}
+        self.params = params
+        self.last_trade_time = None
+        self.indicators = market.indicators(symbol, self.timeframe, **self.indicator_params(
+            ema_windows=tuple(sorted({ema_fast, ema_slow})), rsi_window=rsi_window, atr_window=atr_window))
+
+    def indicator_params(self, **params):
+        return params
+
+    def signal(self, latest):
+        """
+        Return "buy", "sell" or None for the latest closed bar.
+        """
+        if latest[self.ema_fast] > latest[self.ema_slow] and latest['RSI'] > 50:
+            return "buy"
+        if latest[self.ema_fast] < latest[self.ema_slow] and latest['RSI'] < 50:
+            return "sell"
+        return None
+
+    def on_bar(self, now, started=None):
+        """
+        Trade on the signal of the bar that just closed (closed at started,
+        a time.perf_counter_ns() value).
+        """
+        started = started if started is not None else time.perf_counter_ns()
+        if self.indicators.count < self.warmup:
+            print(f"Not enough data for {self.symbol}.")
+            return
+        latest = self.indicators.latest
+        atr = latest['ATR']
+        if math.isnan(atr):
+            return
+
+        # Avoid overtrading (cooldown)
+        if self.last_trade_time and (now - self.last_trade_time) < self.cooldown_period:
+            return
+
+        with latency.time(self.symbol, "signal"):
+            action = self.signal(latest)
+        if action is None:
+            return
+        direction = 1 if action == "buy" else -1
+        sl_price = latest['close'] - direction * (atr * self.atr_multiplier_sl)
+        tp_price = latest['close'] + direction * (atr * self.atr_multiplier_tp)
+        placed = place_order(self.symbol, action, self.lot_size, sl_price, tp_price, **self.order_options)
+        latency.record_since(self.symbol, "bar_to_order", started)  # Bar close to order_send returning
+        if placed:
+            self.last_trade_time = now
+
+
+class EmaRsiBollingerStrategy(EmaRsiStrategy):
+    """
+    Bollinger band scalper of automated_scalping.py: EMA trend, RSI filter,
+    entries at the opposite band.
+    """
+
+    def indicator_params(self, **params):
+        return dict(params, bb_window=self.params.get("bb_window", 20), bb_dev=self.params.get("bb_dev", 2))
+
+    def signal(self, latest):
+        if (latest[self.ema_fast] > latest[self.ema_slow] and latest['RSI'] > 30
+                and latest['close'] <= latest['bb_low']):
+            return "buy"
+        if (latest[self.ema_fast] < latest[self.ema_slow] and latest['RSI'] < 70
+                and latest['close'] >= latest['bb_high']):
+            return "sell"
+        return None
+
+
+STRATEGY_TYPES = {
+    "ema_rsi": EmaRsiStrategy,
+    "ema_rsi_bb": EmaRsiBollingerStrategy,
+}
+
+
+class StrategyHost:
+    """
+    Runs the strategy instances of a config on one terminal connection.
+    """
+
+    def __init__(self, config, mt5=mt5):
+        self.mt5 = mt5
+        self.market = MarketData(mt5, capacity=config.get("capacity", 200))
+        max_workers = config.get("max_workers", 1)
+        self.scheduler = AsyncBarRunner(mt5, max_workers) if max_workers > 1 else BarScheduler(mt5)
+        latency.path = config.get("latency_path")
+        latency.interval = config.get("latency_interval", 60)
+        if config.get("metrics_port"):
+            latency.serve(config["metrics_port"])
+        self.strategies = {}  # (symbol, timeframe) -> [strategy]
+        for entry in config["strategies"]:
+            options = dict(STRATEGY_DEFAULTS, **entry)
+            options.setdefault("name", f"{options['symbol']}_{options['timeframe']}")
+            strategy = STRATEGY_TYPES[options.pop("type")](self.market, **options)
+            key = (strategy.symbol, strategy.timeframe)
+            if key not in self.strategies:
+                self.strategies[key] = []
+                self.scheduler.subscribe(strategy.symbol, strategy.timeframe, self.on_bar)
+            self.strategies[key].append(strategy)
+
+    def on_bar(self, symbol, timeframe):
+        """
+        Update the shared market data once, then run every strategy on this bar.
+        """
+        started = self.scheduler.bar_close_ns(symbol, timeframe)
+        now = datetime.fromtimestamp(self.scheduler.clock())
+        latency.maybe_dump()
+        if not self.market.update(symbol, timeframe):
+            return
+        for strategy in self.strategies[(symbol, timeframe)]:
+            strategy.on_bar(now, started)
+
+    def run(self):
+        self.scheduler.run()
+
+
+def load_config(path=DEFAULT_CONFIG):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    config = load_config(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CONFIG)
+
+    # Initialize MetaTrader 5 connection
+    if not mt5.initialize():
+        print("Failed to initialize MT5!")
+        quit()
+
+    host = StrategyHost(config)
+    print(f"Hosting {sum(len(group) for group in host.strategies.values())} strategies "
+          f"on {len(host.strategies)} symbol/timeframe feeds.")
+    try:
+        host.run()
+
+    except KeyboardInterrupt:
+        print("Terminating the host...")
+
+    finally:
+        latency.dump()
+        print(latency.summary())
+
+        # Shutdown MetaTrader 5 connection
+        mt5.shutdown()
@@ -0,0 +1,255 @@
+# Chunked streaming backtests for multi-year histories
+#
+# btc_strat.py and scalping_strategy.py load the whole copy_rates_range()
+# result into one DataFrame and attach every indicator column, which is
+# fine for a month of M1 bars but not for several years of them.  Here the
+# range is processed chunk by chunk (a month partition of the bar store, or
+# less): ChunkIndicators carries the indicator warm-up state from one chunk
+# to the next and StreamingBacktest carries the open positions, the
+# cooldown and the balance, so peak memory depends on the chunk size, not
+# on the length of the history:
+#
+#     indicators = ChunkIndicators(ema_windows=(9, 21), bb_window=20)
+#     backtest = StreamingBacktest(start=21, cooldown=timedelta(minutes=2), check_entry_bar=True)
+#     for rates in iter_chunks(mt5, "BTCUSD", mt5.TIMEFRAME_M1, start_date, end_date):
+#         columns = indicators.update(rates)
+#         backtest.process(columns, buy_signal, sell_signal, stop_loss, take_profit)
+#     trades = backtest.trades()
+#
+# The chunks give the same trades and balance as one run over the whole
+# range: EMA, RSI and ATR use the sequential loops of indicators (the same
+# values however the series is split), the Bollinger window sums use a fixed
+# anchor, and positions still open at the end of a chunk are scanned for
+# their exit in the next one, exactly as backtest_engine.simulate() does.
+
+from datetime import timedelta
+import numpy as np
+
+import bar_cache
+import backtest_engine
+import indicators
+from exit_kernel import first_exits
+
+# Trades of a streaming run also carry their bar times (epoch seconds), as
+# the bars they index into are gone by the end of the run
+TRADE_DTYPE = np.dtype(backtest_engine.TRADE_DTYPE.descr + [("entry_time", "<i8"), ("exit_time", "<i8")])
+
+
+def iter_chunks(mt5, symbol, timeframe, start_date, end_date, chunk_bars=None, cache_dir=None):
+    """
+    Yield the bars of [start_date, end_date] in consecutive chunks: one month
+    partition at a time, split further into chunk_bars bars when given.
+    """
+    for rates in bar_cache.iter_months(mt5, symbol, timeframe, start_date, end_date, cache_dir):
+        step = chunk_bars or max(len(rates), 1)
+        for lo in range(0, len(rates), step):
+            yield rates[lo:lo + step]
+
+
+class ChunkIndicators:
+    """
+    Indicator columns of consecutive bar chunks, as indicators.ema/rsi/atr/
+    bollinger_bands would give over the whole series.
+
+    update() returns the chunk as a dict of columns (time, open, high, low,
+    close, EMA_<window>, RSI, ATR, bb_mavg, bb_high, bb_low), with the same
+    names as streaming_indicators.IndicatorState.
+    """
+
+    def __init__(self, ema_windows=(9, 21), rsi_window=14, atr_window=14, bb_window=None, bb_dev=2):
+        self.ema_windows = tuple(ema_windows)
+        self.rsi_window = rsi_window
+        self.atr_window = atr_window
+        self.bb_window = bb_window
+        self.bb_dev = bb_dev
+        self.count = 0  # Bars seen before the current chunk
+        self.previous_close = None
+        self.ema = {}  # window -> last EMA value
+        self.up = self.down = None  # Last Wilder averages of the RSI
+        self.true_ranges = np.empty(0)  # ATR warm-up
+        self.atr = None
+        self.anchor = None  # Fixed shift of the Bollinger window sums
+        self.tail = np.empty(0)  # Last bb_window - 1 closes
+
+    def _ewm(self, x, alpha, mean, window):
+        # Continue the ewm from mean; NaN while fewer than window values are seen
+        values = indicators.loop_kernels()["ewm"](x, alpha, x[0] if mean is None else mean)
+        values_before = max(window - 1 - self.count, 0)
+        mean = values[-1]
+        values[:values_before] = np.nan
+        return values, mean
+
+    def update(self, rates):
+        """
+        Compute the indicators of the next chunk of bars (MT5 rates array or dict of columns).
+        """
+        columns = {name: np.asarray(rates[name], dtype=np.float64) for name in ("open", "high", "low", "close")}
+        columns["time"] = np.asarray(rates["time"]).astype(np.int64)
+        n = len(columns["close"])
+        if n == 0:
+            return columns
+        close = columns["close"]
+        previous = np.concatenate(([np.nan if self.previous_close is None else self.previous_close], close[:-1]))
+
+        for window in self.ema_windows:
+            columns[f"EMA_{window}"], self.ema[window] = self._ewm(close, 2.0 / (window + 1), self.ema.get(window), window)
+
+        if self.rsi_window:
+            diff = close - np.where(np.isnan(previous), close[0], previous)
+            alpha = 1.0 / self.rsi_window
+            up, self.up = self._ewm(np.where(diff > 0, diff, 0.0), alpha, self.up, self.rsi_window)
+            down, self.down = self._ewm(np.where(diff < 0, -diff, 0.0), alpha, self.down, self.rsi_window)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rsi = 100 - 100 / (1 + up / down)
+            columns["RSI"] = np.where(down == 0, 100.0, rsi)
+
+        if self.atr_window:
+            columns["ATR"] = self._update_atr(columns["high"], columns["low"], previous)
+
+        if self.bb_window:
+            if self.anchor is None:
+                self.anchor = close[0]
+            window_closes = np.concatenate((self.tail, close))
+            bands = indicators.bollinger_family(window_closes, [self.bb_window], self.bb_dev, self.anchor)
+            columns["bb_mavg"], columns["bb_high"], columns["bb_low"] = (band[0, -n:] for band in bands)
+            self.tail = window_closes[-(self.bb_window - 1):] if self.bb_window > 1 else np.empty(0)
+
+        self.previous_close = close[-1]
+        self.count += n
+        return columns
+
+    def _update_atr(self, high, low, previous_close):
+        # 0.0 during warm-up, the mean of the first window true ranges, then Wilder smoothing
+        window = self.atr_window
+        ranges = np.fmax(high - low, np.fmax(np.abs(high - previous_close), np.abs(low - previous_close)))
+        values = np.zeros(len(ranges))
+        first = window - 1 - self.count  # Chunk index of the first ATR value
+        if first >= len(ranges):
+            self.true_ranges = np.concatenate((self.true_ranges, ranges))
+            return values
+        if first >= 0:
+            self.atr = np.mean(np.concatenate((self.true_ranges, ranges[:first + 1])))
+            self.true_ranges = np.empty(0)
+            values[first] = self.atr
+        resume = max(first + 1, 0)
+        if resume < len(ranges):
+            values[resume:] = indicators.loop_kernels()["wilder"](ranges[resume:], window, self.atr)
+            self.atr = values[-1]
+        return values
+
+
+class StreamingBacktest:
+    """
+    backtest_engine.simulate() over consecutive chunks of bars.
+
+    Supports the options of the scalping scripts (start, valid, cooldown,
+    check_entry_bar); the balance, the open positions and the last entry
+    time are carried from chunk to chunk.
+    """
+
+    def __init__(self, start=0, cooldown=None, check_entry_bar=False, lot_size=0.1,
+                 initial_balance=10000, contract_size=100000):
+        self.start = start
+        if isinstance(cooldown, timedelta):
+            cooldown = int(cooldown.total_seconds())
+        self.gap = cooldown  # Seconds, like the bar times
+        self.check_entry_bar = check_entry_bar
+        self.lot_size = lot_size
+        self.initial_balance = initial_balance
+        self.contract_size = contract_size
+        self.balance = float(initial_balance)
+        self.count = 0  # Bars processed before the current chunk
+        self.next_allowed = None  # Earliest time of the next entry
+        self.last_entry_time = None
+        self.open = np.zeros(0, dtype=TRADE_DTYPE)  # Positions still open
+        self.closed = []  # Arrays of closed trades, one per chunk
+
+    def process(self, columns, long_entries, short_entries, stop_loss, take_profit, valid=None):
+        """
+        Run the next chunk (columns with time, high, low, close) and return
+        (times, equity) of its recorded bars: the balance after each of them.
+        """
+        times = np.asarray(columns["time"]).astype(np.int64)
+        high = np.asarray(columns["high"], dtype=np.float64)
+        low = np.asarray(columns["low"], dtype=np.float64)
+        close = np.asarray(columns["close"], dtype=np.float64)
+        stop_loss = np.asarray(stop_loss, dtype=np.float64)
+        take_profit = np.asarray(take_profit, dtype=np.float64)
+        n = len(close)
+        base = self.count
+        self.count += n
+
+        active = np.zeros(n, dtype=bool)
+        active[max(self.start - base, 0):] = True
+        if valid is not None:
+            active &= np.asarray(valid, dtype=bool)
+        long_entries = np.asarray(long_entries, dtype=bool) & active
+        short_entries = np.asarray(short_entries, dtype=bool) & active & ~long_entries
+        entries = np.flatnonzero(long_entries | short_entries)
+        checkable = active.copy()
+
+        if self.gap is not None:
+            accepted = []
+            for i in entries:
+                if self.next_allowed is None or times[i] >= self.next_allowed:
+                    accepted.append(i)
+                    self.next_allowed = times[i] + self.gap
+            entries = np.asarray(accepted, dtype=np.int64)
+            # Bars inside a cooldown window (of an entry before them) only record equity
+            entry_times = times[entries]
+            if self.last_entry_time is not None:
+                entry_times = np.concatenate(([self.last_entry_time], entry_times))
+            if len(entry_times):
+                offset = 1 if self.last_entry_time is not None else 0
+                last = np.searchsorted(entries, np.arange(n), side="left") - 1 + offset
+                blocked = (last >= 0) & (times - entry_times[np.maximum(last, 0)] < self.gap)
+                checkable &= ~blocked
+                self.last_entry_time = entry_times[-1]
+
+        new = np.zeros(len(entries), dtype=TRADE_DTYPE)
+        new["entry_index"] = base + entries
+        new["direction"] = np.where(long_entries[entries], 1, -1)
+        new["entry_price"] = close[entries]
+        new["stop_loss"] = stop_loss[entries]
+        new["take_profit"] = take_profit[entries]
+        new["entry_time"] = times[entries]
+        positions = np.concatenate((self.open, new))
+
+        # Carried positions scan the chunk from its first bar, new ones from their entry
+        scan_from = np.concatenate((np.zeros(len(self.open), dtype=np.int64),
+                                    entries if self.check_entry_bar else entries + 1))
+        exit_index, exit_price, reason = first_exits(
+            np.where(checkable, high, -np.inf), np.where(checkable, low, np.inf),
+            positions["direction"], positions["stop_loss"], positions["take_profit"], scan_from,
+        )
+        done = exit_index >= 0
+        closed = positions[done]
+        closed["exit_index"] = base + exit_index[done]
+        closed["exit_price"] = exit_price[done]
+        closed["reason"] = reason[done]
+        closed["exit_time"] = times[exit_index[done]]
+        move = np.where(closed["direction"] > 0, closed["exit_price"] - closed["entry_price"],
+                        closed["entry_price"] - closed["exit_price"])
+        closed["profit"] = move * self.contract_size * self.lot_size
+        self.open = positions[~done]
+
+        # Equity: closed trades added in (exit bar, entry order), as simulate() does
+        order = np.lexsort((closed["entry_index"], closed["exit_index"]))
+        closed = closed[order]
+        balances = np.cumsum(np.concatenate(([self.balance], closed["profit"])))
+        self.balance = balances[-1]
+        self.closed.append(closed)
+        recorded = np.flatnonzero(active)
+        equity = balances[np.searchsorted(closed["exit_index"] - base, recorded, side="right")]
+        return times[recorded], equity
+
+    def trades(self):
+        """
+        All trades so far in entry order; open ones have exit_index -1 and profit 0.
+        """
+        still_open = self.open.copy()
+        still_open["exit_index"] = -1
+        still_open["exit_price"] = np.nan
+        still_open["exit_time"] = -1
+        trades = np.concatenate(self.closed + [still_open])
+        return trades[np.argsort(trades["entry_index"], kind="stable")]
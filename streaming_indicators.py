@@ -0,0 +1,249 @@
+# Incremental indicators for the live polling loops
+#
+# Each indicator keeps just enough state to fold in one new closed bar in
+# constant time, instead of recomputing the whole lookback through the ta
+# library on every poll.  The formulas follow ta (and the pandas calls it
+# wraps) so the values match calculate_indicators():
+#
+#   EMA       ewm(span=window, adjust=False, min_periods=window)
+#   RSI       Wilder smoothing, ewm(alpha=1/window, adjust=False, min_periods=window)
+#   ATR       first value = mean of the first window true ranges, then Wilder
+#   SMA / BB  rolling(window) mean and population std (ddof=0)
+
+import math
+import numpy as np
+
+NAN = float("nan")
+
+
+class EMA:
+    """
+    Exponential moving average, as ta.trend.EMAIndicator.
+    """
+
+    def __init__(self, window, alpha=None):
+        self.window = window
+        self.alpha = alpha if alpha is not None else 2.0 / (window + 1)
+        self.count = 0
+        self.mean = NAN
+
+    def update(self, x):
+        if self.count == 0:
+            self.mean = x
+        elif self.mean != x:
+            # Same arithmetic as pandas' adjust=False recursion
+            old_weight = 1.0 - self.alpha
+            self.mean = (old_weight * self.mean + self.alpha * x) / (old_weight + self.alpha)
+        self.count += 1
+        return self.value
+
+    @property
+    def value(self):
+        return self.mean if self.count >= self.window else NAN
+
+
+class RSI:
+    """
+    Relative strength index with Wilder smoothing, as ta.momentum.RSIIndicator.
+    """
+
+    def __init__(self, window=14):
+        self.window = window
+        self.up = EMA(window, alpha=1.0 / window)
+        self.down = EMA(window, alpha=1.0 / window)
+        self.previous = None
+
+    def update(self, close):
+        diff = 0.0 if self.previous is None else close - self.previous
+        self.previous = close
+        self.up.update(diff if diff > 0 else 0.0)
+        self.down.update(-diff if diff < 0 else 0.0)
+        return self.value
+
+    @property
+    def value(self):
+        up, down = self.up.value, self.down.value
+        if math.isnan(down):
+            return NAN
+        if down == 0:
+            return 100.0
+        return 100 - (100 / (1 + up / down))
+
+
+class ATR:
+    """
+    Average true range, as ta.volatility.AverageTrueRange (0.0 during warm-up).
+    """
+
+    def __init__(self, window=14):
+        self.window = window
+        self.previous_close = None
+        self.warmup = []
+        self.atr = 0.0
+        self.count = 0
+
+    def update(self, high, low, close):
+        true_range = high - low
+        if self.previous_close is not None:
+            true_range = max(true_range, abs(high - self.previous_close), abs(low - self.previous_close))
+        self.previous_close = close
+        self.count += 1
+        if self.count < self.window:
+            self.warmup.append(true_range)
+        elif self.count == self.window:
+            self.warmup.append(true_range)
+            self.atr = float(np.mean(self.warmup))
+            self.warmup = []
+        else:
+            self.atr = (self.atr * (self.window - 1) + true_range) / float(self.window)
+        return self.atr
+
+    @property
+    def value(self):
+        return self.atr
+
+
+class RollingWindow:
+    """
+    Rolling mean and population standard deviation over the last window values.
+
+    Sums are kept relative to an anchor value (shifted data) so the variance
+    does not lose precision on prices far from zero, and are rebuilt from
+    the window every `window` updates to stop rounding drift.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = np.zeros(window)
+        self.count = 0
+        self.anchor = 0.0
+        self.sum = 0.0
+        self.sum_sq = 0.0
+
+    def update(self, x):
+        slot = self.count % self.window
+        if self.count == 0:
+            self.anchor = x
+        if self.count >= self.window:
+            old = self.values[slot] - self.anchor
+            self.sum -= old
+            self.sum_sq -= old * old
+        self.values[slot] = x
+        self.count += 1
+        if self.count % self.window == 0:
+            self._rebuild()
+        else:
+            shifted = x - self.anchor
+            self.sum += shifted
+            self.sum_sq += shifted * shifted
+        return self.mean
+
+    def _rebuild(self):
+        self.anchor = float(self.values.mean())
+        shifted = self.values - self.anchor
+        self.sum = float(shifted.sum())
+        self.sum_sq = float((shifted * shifted).sum())
+
+    @property
+    def mean(self):
+        if self.count < self.window:
+            return NAN
+        return self.anchor + self.sum / self.window
+
+    @property
+    def std(self):
+        if self.count < self.window:
+            return NAN
+        mean_shift = self.sum / self.window
+        return math.sqrt(max(self.sum_sq / self.window - mean_shift * mean_shift, 0.0))
+
+
+class BollingerBands:
+    """
+    Bollinger bands, as ta.volatility.BollingerBands.
+    """
+
+    def __init__(self, window=20, window_dev=2):
+        self.window_dev = window_dev
+        self.rolling = RollingWindow(window)
+
+    def update(self, close):
+        self.rolling.update(close)
+        return self.value
+
+    @property
+    def value(self):
+        mavg, mstd = self.rolling.mean, self.rolling.std
+        return mavg, mavg + self.window_dev * mstd, mavg - self.window_dev * mstd
+
+
+class IndicatorState:
+    """
+    The indicator set of a live strategy, updated one closed bar at a time.
+
+    latest exposes the same column names calculate_indicators() produced
+    (EMA_9, EMA_21, RSI, ATR, bb_high, bb_low, SMA_10, ...) plus the bar's
+    time, open, high, low and close.
+    """
+
+    def __init__(self, ema_windows=(9, 21), rsi_window=14, atr_window=14,
+                 bb_window=None, bb_dev=2, sma_windows=()):
+        self.ema = {window: EMA(window) for window in ema_windows}
+        self.sma = {window: RollingWindow(window) for window in sma_windows}
+        self.rsi = RSI(rsi_window) if rsi_window else None
+        self.atr = ATR(atr_window) if atr_window else None
+        self.bb = BollingerBands(bb_window, bb_dev) if bb_window else None
+        self.count = 0
+        self.last_time = None
+        self.latest = {}
+
+    def reset(self):
+        """
+        Forget all state; the next update_rates() call warms up from scratch.
+        """
+        self.__init__(
+            tuple(self.ema), self.rsi.window if self.rsi else None,
+            self.atr.window if self.atr else None,
+            self.bb.rolling.window if self.bb else None,
+            self.bb.window_dev if self.bb else 2, tuple(self.sma),
+        )
+
+    def update(self, time, open_, high, low, close):
+        """
+        Fold one closed bar into every indicator and refresh latest.
+        """
+        latest = {"time": time, "open": open_, "high": high, "low": low, "close": close}
+        for window, ema in self.ema.items():
+            latest[f"EMA_{window}"] = ema.update(close)
+        for window, sma in self.sma.items():
+            latest[f"SMA_{window}"] = sma.update(close)
+        if self.rsi:
+            latest["RSI"] = self.rsi.update(close)
+        if self.atr:
+            latest["ATR"] = self.atr.update(high, low, close)
+        if self.bb:
+            latest["bb_mavg"], latest["bb_high"], latest["bb_low"] = self.bb.update(close)
+        self.latest = latest
+        self.last_time = time
+        self.count += 1
+        return latest
+
+    def update_rates(self, rates):
+        """
+        Feed the bars of an MT5 rates array that are newer than the last one seen.
+
+        Returns the number of bars added, or None (after resetting the state)
+        when the rates do not overlap the bars already seen, i.e. some bars
+        were missed and the indicators must be warmed up again.
+        """
+        if rates is None or len(rates) == 0:
+            return 0
+        times = rates["time"]
+        if self.last_time is not None and times[0] > self.last_time:
+            self.reset()
+            return None
+        start = 0 if self.last_time is None else int(np.searchsorted(times, self.last_time, side="right"))
+        for bar in rates[start:]:
+            self.update(int(bar["time"]), float(bar["open"]), float(bar["high"]),
+                        float(bar["low"]), float(bar["close"]))
+        return len(rates) - start
@@ -0,0 +1,133 @@
+# Deterministic synthetic OHLC bars for benchmarks
+#
+# The backtests and indicators otherwise need a terminal or the local bar
+# store to run at all.  Here bars are generated from a seed: a log-price
+# random walk whose volatility switches between regimes (calm, normal,
+# volatile) after geometrically distributed stretches of bars, with price
+# gaps at every week open and at random holes in the data (missing bars),
+# in the same RATES_DTYPE layout as copy_rates_range():
+#
+#     rates = synthetic_rates(1_000_000, seed=1)                   # M1, EURUSD-like
+#     bars = synthetic_bars(100_000, timeframe=TIMEFRAMES["H1"])   # dict of columns
+#
+# The series is generated in fixed blocks of BLOCK_BARS bars, each from its
+# own seed derived from seed and the block number, so memory stays bounded
+# with iter_synthetic_rates() and the first n bars are the same whatever
+# count is asked for (the 10k-bar series is the start of the 10M-bar one).
+
+from datetime import datetime
+import numpy as np
+
+from bar_cache import RATES_DTYPE
+from timeframes import timeframe_seconds
+
+BLOCK_BARS = 1 << 16
+WEEK_SECONDS = 7 * 86400
+TRADING_SECONDS = 5 * 86400  # Sunday 22:00 to Friday 22:00
+
+
+def _trading_times(slots, start, bar_seconds, weekends):
+    # Trading slot k -> bar time, skipping the weekend closes after each five trading days
+    if not weekends or bar_seconds >= TRADING_SECONDS:
+        return start + slots * bar_seconds
+    per_week = TRADING_SECONDS // bar_seconds
+    return start + (slots // per_week) * WEEK_SECONDS + (slots % per_week) * bar_seconds
+
+
+def iter_synthetic_rates(count, timeframe=1, seed=0, start=datetime(2024, 1, 7, 22), price=1.1,
+                         volatility=None, regimes=(0.5, 1.0, 2.5), regime_bars=20000,
+                         gap_probability=1e-4, gap_bars=60, gap_scale=1.0, weekends=True, digits=5):
+    """
+    Yield count synthetic bars in blocks of at most BLOCK_BARS (RATES_DTYPE arrays).
+
+    timeframe: MT5 timeframe constant of the bars (default M1).
+    start: time of the first bar, the open of a trading week.
+    price: first open.
+    volatility: standard deviation of the log return per bar in the normal
+        regime (default: 1e-4 per minute of bar length, scaled by its square root).
+    regimes: volatility multipliers the walk switches between, starting in
+        the middle one; a switch happens with probability 1 / regime_bars per bar.
+    gap_probability: chance per bar of a hole of on average gap_bars missing bars.
+    gap_scale: the price jumps over a hole or a weekend by a log return of
+        gap_scale times the bar's volatility times the square root of the
+        bars missing, as if the walk had continued unseen.
+    weekends: leave out Friday 22:00 to Sunday 22:00, like FX quotes.
+    digits: decimals the prices are rounded to.
+    """
+    bar_seconds = timeframe_seconds(timeframe)
+    volatility = volatility if volatility is not None else 1e-4 * np.sqrt(bar_seconds / 60)
+    regimes = np.asarray(regimes, dtype=np.float64)
+    start = int(np.datetime64(start, "s").astype(np.int64))
+
+    log_close = np.log(price)
+    regime = len(regimes) // 2
+    slot = 0  # Trading slot of the next bar
+    last_time = start - bar_seconds
+    for block, lo in enumerate(range(0, count, BLOCK_BARS)):
+        # Always a full block of draws, so a shorter last block is a prefix of the full one
+        n = BLOCK_BARS
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(block,)))
+
+        # Volatility regime of every bar
+        switches = rng.random(n) < 1.0 / regime_bars
+        choices = np.concatenate(([regime], rng.integers(0, len(regimes), int(switches.sum()))))
+        bar_regime = choices[np.cumsum(switches)]
+        regime = bar_regime[-1]
+        sigma = volatility * regimes[bar_regime]
+
+        # Holes in the data, and the trading slot of every bar
+        holes = np.where(rng.random(n) < gap_probability, rng.geometric(1.0 / gap_bars, n), 0)
+        slots = slot + np.arange(n) + np.cumsum(holes)
+        slot = slots[-1] + 1
+        times = _trading_times(slots, start, bar_seconds, weekends)
+        missing = np.diff(times, prepend=last_time) // bar_seconds - 1
+        last_time = times[-1]
+        jumps = rng.normal(0, 1, n) * (gap_scale * sigma * np.sqrt(missing))
+
+        # Open = previous close + jump, close = open + the bar's return, wicks beyond both
+        returns = rng.normal(0, sigma)
+        log_closes = log_close + np.cumsum(jumps + returns)
+        log_open = log_closes - returns
+        log_close = log_closes[-1]
+
+        rates = np.zeros(n, dtype=RATES_DTYPE)
+        rates["time"] = times
+        rates["open"] = np.round(np.exp(log_open), digits)
+        rates["close"] = np.round(np.exp(log_closes), digits)
+        wick = np.abs(rng.normal(0, sigma, (2, n)))
+        rates["high"] = np.round(np.maximum(rates["open"], rates["close"]) * np.exp(wick[0]), digits)
+        rates["low"] = np.round(np.minimum(rates["open"], rates["close"]) * np.exp(-wick[1]), digits)
+        rates["tick_volume"] = rng.poisson(50 * regimes[bar_regime])
+        rates["spread"] = rng.integers(5, 20, n)
+        yield rates[:count - lo]
+
+
+def synthetic_rates(count, **options):
+    """
+    count synthetic bars as one RATES_DTYPE array (options as for iter_synthetic_rates).
+    """
+    blocks = list(iter_synthetic_rates(count, **options))
+    return np.concatenate(blocks) if blocks else np.zeros(0, dtype=RATES_DTYPE)
+
+
+def synthetic_bars(count, **options):
+    """
+    count synthetic bars as a dict of NumPy columns, like param_sweep.load_bars().
+    """
+    rates = synthetic_rates(count, **options)
+    bars = {name: np.ascontiguousarray(rates[name]) for name in ("open", "high", "low", "close")}
+    bars["time"] = rates["time"].astype("datetime64[s]")
+    return bars
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    started = time.perf_counter()
+    rates = synthetic_rates(count, seed=1)
+    elapsed = time.perf_counter() - started
+    print(f"{count} bars in {elapsed:.2f}s ({count / elapsed:,.0f} bars/s), {rates.nbytes / 2**20:.1f} MiB")
+    print(f"{rates['time'][0].astype('datetime64[s]')} .. {rates['time'][-1].astype('datetime64[s]')}, "
+          f"close {rates['close'].min():.5f} .. {rates['close'].max():.5f}")
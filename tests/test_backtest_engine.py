@@ -0,0 +1,30 @@
+import numpy as np
+
+import backtest_engine
+import param_sweep
+from synthetic_data import synthetic_bars
+from timeframes import TIMEFRAMES
+
+
+def _columns(n=500, seed=3):
+    bars = synthetic_bars(n, timeframe=TIMEFRAMES["H1"], seed=seed)
+    rng = np.random.default_rng(seed)
+    long_entries = rng.random(n) < 0.05
+    short_entries = rng.random(n) < 0.05
+    close = bars["close"]
+    return bars, long_entries, short_entries, close * 0.998, close * 1.002
+
+
+def test_sessions_without_session_end_bar():
+    bars, long_entries, short_entries, stop_loss, take_profit = _columns()
+    args = (bars["high"], bars["low"], bars["close"], long_entries, short_entries, stop_loss, take_profit)
+    plain = backtest_engine.simulate(*args, start=10)
+    sessions = backtest_engine.simulate(*args, start=10, session_close=np.zeros(len(bars["close"]), dtype=bool))
+    np.testing.assert_array_equal(sessions.trades, plain.trades)
+    assert sessions.final_balance == plain.final_balance
+
+
+def test_sweep_with_session_close_after_last_hour():
+    bars = synthetic_bars(2000, timeframe=TIMEFRAMES["M15"], seed=1)
+    results = param_sweep.run_sweep("ema_rsi_session", bars, {"session_close_time": [24]}, workers=1)
+    assert len(results) == 1
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+
+import bar_cache
+from bar_cache import RATES_DTYPE
+from synthetic_data import synthetic_rates
+from timeframes import TIMEFRAMES
+
+H1 = TIMEFRAMES["H1"]
+JANUARY = bar_cache.month_keys("2024-01-01", "2024-01-01")[0]
+NOW = "2024-06-01"
+
+
+class _Terminal:
+    # Serves the bars it has synced so far, like mt5.copy_rates_*
+    def __init__(self, rates):
+        self.rates = rates
+        self.calls = 0
+
+    def copy_rates_range(self, symbol, timeframe, date_from, date_to):
+        self.calls += 1
+        times = self.rates["time"]
+        return self.rates[(times >= bar_cache.to_timestamp(date_from)) & (times <= bar_cache.to_timestamp(date_to))]
+
+    def copy_rates_from(self, symbol, timeframe, date_from, count):
+        return self.rates[self.rates["time"] <= bar_cache.to_timestamp(date_from)][-count:]
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        return self.rates[len(self.rates) - start_pos - count:len(self.rates) - start_pos]
+
+
+def _load(terminal, cache_dir, month=JANUARY):
+    return bar_cache.load_month(terminal, "SYN", H1, *month, cache_dir=cache_dir, now=NOW)
+
+
+def test_partial_month_is_fetched_again(tmp_path):
+    rates = synthetic_rates(1500, timeframe=H1)
+    # History still downloading: only the first half of January is synced
+    terminal = _Terminal(rates[rates["time"] < bar_cache.to_timestamp("2024-01-16")])
+    key, first, last = JANUARY
+    assert not bar_cache.month_complete(terminal, "SYN", H1, _load(terminal, str(tmp_path)), first, last)
+    assert not os.path.exists(bar_cache.partition_path("SYN", H1, key, str(tmp_path)))
+
+    # The current month is never stored
+    terminal.rates = rates
+    current = bar_cache.month_keys(NOW, NOW)[0]
+    bar_cache.load_month(terminal, "SYN", H1, *current, cache_dir=str(tmp_path), now=NOW)
+    assert not os.path.exists(bar_cache.partition_path("SYN", H1, current[0], str(tmp_path)))
+
+
+def test_complete_month_is_served_locally(tmp_path):
+    rates = synthetic_rates(1500, timeframe=H1)
+    terminal = _Terminal(rates)
+    january = rates[(rates["time"] >= JANUARY[1]) & (rates["time"] <= JANUARY[2])]
+    np.testing.assert_array_equal(_load(terminal, str(tmp_path)), january)
+    np.testing.assert_array_equal(_load(terminal, str(tmp_path)), january)
+    assert terminal.calls == 1
+    np.testing.assert_array_equal(
+        bar_cache.copy_rates_range(None, "SYN", H1, "2024-01-01", "2024-01-31 23:59", str(tmp_path)), january
+    )
+
+
+def test_empty_closed_month_is_stored_once_bars_follow_it(tmp_path):
+    rates = synthetic_rates(1500, timeframe=H1)
+    february = bar_cache.month_keys("2024-02-01", "2024-02-01")[0]
+    outside = (rates["time"] < february[1]) | (rates["time"] > february[2])
+    # Nothing synced after February yet: it may still be downloading
+    terminal = _Terminal(rates[rates["time"] < february[1]])
+    assert len(_load(terminal, str(tmp_path), february)) == 0
+    assert not os.path.exists(bar_cache.partition_path("SYN", H1, february[0], str(tmp_path)))
+
+    terminal.rates = rates[outside]
+    for _ in range(2):
+        assert len(_load(terminal, str(tmp_path), february)) == 0
+    assert terminal.calls == 2
+    assert bar_cache.read_partition(bar_cache.partition_path("SYN", H1, february[0], str(tmp_path))).dtype == RATES_DTYPE
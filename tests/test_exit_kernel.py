@@ -0,0 +1,58 @@
+import numpy as np
+
+from exit_kernel import STOP_LOSS, TAKE_PROFIT, first_exits, first_touch
+
+
+def _loop_exits(high, low, direction, stop_loss, take_profit, scan_from, scan_to):
+    # The per-bar loop of the backtest scripts: SL checked before TP on every bar
+    exit_index = np.full(len(direction), -1)
+    exit_price = np.full(len(direction), np.nan)
+    reason = np.zeros(len(direction), dtype=np.int8)
+    for k in range(len(direction)):
+        for j in range(scan_from[k], min(scan_to[k], len(high))):
+            if direction[k] > 0:
+                sl_hit, tp_hit = low[j] <= stop_loss[k], high[j] >= take_profit[k]
+            else:
+                sl_hit, tp_hit = high[j] >= stop_loss[k], low[j] <= take_profit[k]
+            if sl_hit or tp_hit:
+                exit_index[k] = j
+                exit_price[k], reason[k] = (stop_loss[k], STOP_LOSS) if sl_hit else (take_profit[k], TAKE_PROFIT)
+                break
+    return exit_index, exit_price, reason
+
+
+def test_nan_levels_never_touch():
+    assert first_touch(np.ones(200), [np.nan], [5])[0] == 200
+    exit_index, exit_price, reason = first_exits(np.ones(200), np.ones(200), [1], [np.nan], [np.nan], [5])
+    assert exit_index[0] == -1 and np.isnan(exit_price[0]) and reason[0] == 0
+    # A NaN stop-loss leaves the take-profit working
+    high = np.ones(200)
+    high[150] = 2.0
+    exit_index, exit_price, reason = first_exits(high, np.ones(200), [1], [np.nan], [1.5], [5])
+    assert exit_index[0] == 150 and exit_price[0] == 1.5 and reason[0] == TAKE_PROFIT
+
+
+def test_first_exits_matches_per_bar_loop():
+    rng = np.random.default_rng(11)
+    for trial in range(30):
+        n = int(rng.integers(1, 400))
+        close = 1 + np.cumsum(rng.normal(0, 0.01, n))
+        high = close + rng.random(n) * 0.01
+        low = close - rng.random(n) * 0.01
+        high[rng.random(n) < 0.05] = np.nan
+        count = int(rng.integers(1, 60))
+        direction = np.where(rng.random(count) < 0.5, 1, -1)
+        entry = rng.integers(0, n, count)
+        width = rng.random((2, count)) * 0.05
+        stop_loss = close[entry] - direction * width[0]
+        take_profit = close[entry] + direction * width[1]
+        stop_loss[rng.random(count) < 0.1] = np.nan
+        take_profit[rng.random(count) < 0.1] = np.nan
+        scan_from = entry + rng.integers(0, 2, count)
+        scan_to = scan_from + rng.integers(0, n + 1, count)
+        block_size = int(rng.choice([1, 4, 16]))
+        got = first_exits(high, low, direction, stop_loss, take_profit, scan_from, scan_to, block_size)
+        expected = _loop_exits(high, low, direction, stop_loss, take_profit, scan_from, scan_to)
+        np.testing.assert_array_equal(got[0], expected[0])
+        np.testing.assert_array_equal(got[1], expected[1])
+        np.testing.assert_array_equal(got[2], expected[2])
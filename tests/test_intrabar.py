@@ -0,0 +1,71 @@
+import numpy as np
+
+import backtest_engine
+import bar_cache
+import multi_timeframe
+import portfolio_backtest
+from intrabar import IntrabarResolver
+from bar_cache import RATES_DTYPE
+from synthetic_data import synthetic_rates
+from timeframes import TIMEFRAMES
+
+
+def _store(cache_dir, rates):
+    for key, first, last in bar_cache.month_keys(int(rates["time"][0]), int(rates["time"][-1])):
+        part = rates[(rates["time"] >= first) & (rates["time"] <= last)]
+        bar_cache.write_partition(bar_cache.partition_path("SYN", TIMEFRAMES["M1"], key, cache_dir), part)
+
+
+def test_exits_on_the_entry_bar_stay_stop_loss_first(tmp_path):
+    m1 = synthetic_rates(60_000, seed=7)
+    _store(str(tmp_path), m1)
+    h4 = multi_timeframe.resample(m1, TIMEFRAMES["H4"])
+    rng = np.random.default_rng(1)
+    n = len(h4["close"])
+    buy = rng.random(n) < 0.3
+    sell = (rng.random(n) < 0.3) & ~buy
+    spread = h4["high"] - h4["low"]
+    stop_loss = np.where(buy, h4["close"] - 0.4 * spread, h4["close"] + 0.4 * spread)
+    take_profit = np.where(buy, h4["close"] + 0.5 * spread, h4["close"] - 0.5 * spread)
+    args = (h4["high"], h4["low"], h4["close"], buy, sell, stop_loss, take_profit)
+
+    plain = backtest_engine.simulate(*args, start=1, check_entry_bar=True)
+    resolver = IntrabarResolver(None, "SYN", h4["time"], TIMEFRAMES["H4"], cache_dir=str(tmp_path))
+    resolved = backtest_engine.simulate(*args, start=1, check_entry_bar=True, intrabar=resolver)
+
+    on_entry_bar = plain.trades["exit_index"] == plain.trades["entry_index"]
+    assert on_entry_bar.any()
+    np.testing.assert_array_equal(resolved.trades[on_entry_bar], plain.trades[on_entry_bar])
+
+
+def _ambiguous_h1(cache_dir):
+    # Three flat hours of M1 bars; in the third the TP (1.01) is touched at :10, the SL (0.99) at :30
+    m1 = np.zeros(180, dtype=RATES_DTYPE)
+    m1["time"] = 1704448800 + 60 * np.arange(180)  # 2024-01-05 10:00
+    m1["open"] = m1["high"] = m1["low"] = m1["close"] = 1.0
+    m1["high"][130] = 1.02
+    m1["low"][150] = 0.98
+    _store(cache_dir, m1)
+    return multi_timeframe.resample(m1, TIMEFRAMES["H1"])
+
+
+def test_simulate_flips_an_ambiguous_exit_to_take_profit(tmp_path):
+    h1 = _ambiguous_h1(str(tmp_path))
+    buy = np.array([False, True, False])
+    args = (h1["high"], h1["low"], h1["close"], buy, np.zeros(3, dtype=bool), np.full(3, 0.99), np.full(3, 1.01))
+
+    plain = backtest_engine.simulate(*args)
+    resolver = IntrabarResolver(None, "SYN", h1["time"], TIMEFRAMES["H1"], cache_dir=str(tmp_path))
+    resolved = backtest_engine.simulate(*args, intrabar=resolver)
+    assert plain.trades["reason"][0] == backtest_engine.STOP_LOSS
+    assert resolved.trades["reason"][0] == backtest_engine.TAKE_PROFIT
+    assert resolved.trades["exit_index"][0] == 2 and resolved.trades["exit_price"][0] == 1.01
+    assert resolved.final_balance == plain.initial_balance + resolved.trades["profit"][0]
+
+    # The same position in a portfolio row, next to a symbol without a resolver
+    stack = lambda column: np.stack((column, column))
+    portfolio = portfolio_backtest.simulate(
+        *(stack(column) for column in args),
+        intrabar=[IntrabarResolver(None, "SYN", h1["time"], TIMEFRAMES["H1"], cache_dir=str(tmp_path)), None])
+    reasons = portfolio.trades["reason"][np.argsort(portfolio.trades["symbol"])]
+    assert list(reasons) == [backtest_engine.TAKE_PROFIT, backtest_engine.STOP_LOSS]
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+import monte_carlo
+
+
+def test_drawdown_pct_is_the_largest_relative_fall():
+    # 10k -> 6k is -40% (4k), 6k -> 20k -> 15k is -25% (5k): different peaks
+    profits = np.array([[-4000.0, 14000.0, -5000.0]])
+    final, drawdown, drawdown_pct, lowest = monte_carlo.path_statistics(profits, 10000)
+    assert final[0] == 15000
+    assert drawdown[0] == 5000
+    assert drawdown_pct[0] == pytest.approx(0.4)
+    assert lowest[0] == 6000
+
+
+def test_paths_must_be_positive():
+    with pytest.raises(ValueError):
+        monte_carlo.run_monte_carlo(np.array([1.0, -1.0]), paths=0)
+
+
+def test_result_does_not_depend_on_workers():
+    profits = np.random.default_rng(3).normal(10, 100, 200)
+    one = monte_carlo.run_monte_carlo(profits, paths=1000, seed=7, batch_paths=100, workers=1)
+    many = monte_carlo.run_monte_carlo(profits, paths=1000, seed=7, batch_paths=100, workers=3)
+    for name in monte_carlo.MonteCarloResult._fields[1:]:
+        np.testing.assert_array_equal(getattr(one, name), getattr(many, name))
+
+
+def test_shuffle_keeps_the_final_balance():
+    profits = np.random.default_rng(4).normal(10, 100, 50)
+    result = monte_carlo.run_monte_carlo(profits, paths=300, method="shuffle", seed=1, workers=1)
+    np.testing.assert_allclose(result.final_balance, 10000 + profits.sum())
+    assert len(np.unique(result.max_drawdown)) > 1
+
+
+def test_ruin_probability():
+    # Bootstrapping a single trade gives the same path every time
+    result = monte_carlo.run_monte_carlo(np.array([-1000.0] * 6), paths=50, seed=2, workers=1)
+    np.testing.assert_allclose(result.min_balance, 4000)
+    assert monte_carlo.ruin_probability(result, 4000) == 1.0
+    assert monte_carlo.ruin_probability(result, 3999) == 0.0
+    summary = monte_carlo.summarize(result)
+    assert summary["ruin_50pct"] == 1.0 and summary["ruin_25pct"] == 0.0
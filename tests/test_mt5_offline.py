@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import bar_cache
+import mt5_offline as mt5
+from bar_cache import RATES_DTYPE
+
+START = 1704672000  # 2024-01-08 00:00 UTC, a Monday
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Flat M1 bars at 1.1 (1 pip spread) with a dip to 1.099 in the 00:30 bar
+    rates = np.zeros(120, dtype=RATES_DTYPE)
+    rates["time"] = START + 60 * np.arange(120)
+    rates["open"] = rates["high"] = rates["low"] = rates["close"] = 1.1
+    rates["low"][30] = 1.099
+    rates["spread"] = 10
+    monkeypatch.setattr(bar_cache, "CACHE_DIR", str(tmp_path))
+    bar_cache.write_partition(bar_cache.partition_path("SYN", mt5.TIMEFRAME_M1, "2024-01"), rates)
+    for key, value in (("clock", None), ("balance", 10000.0), ("positions", {}), ("history", [])):
+        monkeypatch.setitem(mt5._state, key, value)
+    mt5.initialize()
+    return rates
+
+
+def _buy(price=0.0, deviation=0, sl=1.0995, tp=1.101):
+    return mt5.order_send({
+        "action": mt5.TRADE_ACTION_DEAL, "symbol": "SYN", "volume": 0.1, "type": mt5.ORDER_TYPE_BUY,
+        "price": price, "deviation": deviation, "sl": sl, "tp": tp,
+    })
+
+
+def test_stop_loss_closes_at_the_stop_price_once_the_bar_closed(store):
+    mt5.set_time(START + 600)
+    result = _buy()
+    assert result.retcode == mt5.TRADE_RETCODE_DONE
+    assert result.price == pytest.approx(1.1001)
+
+    # The 00:30 bar is still forming: neither the tick nor the stops see its low yet
+    mt5.set_time(START + 30 * 60 + 59)
+    assert len(mt5.positions_get()) == 1
+    assert mt5.symbol_info_tick("SYN").bid == 1.1
+
+    mt5.set_time(START + 31 * 60)
+    assert mt5.positions_get() == ()
+    closed = mt5._state["history"][-1]
+    assert closed["reason"] == "sl"
+    assert closed["price_close"] == 1.0995
+    assert closed["time_close"] == START + 30 * 60
+    assert mt5.account_info().balance == pytest.approx(10000 + (1.0995 - 1.1001) * 100000 * 0.1)
+
+
+def test_bars_before_the_position_do_not_touch_its_stops(store):
+    mt5.set_time(START + 35 * 60)
+    assert _buy().retcode == mt5.TRADE_RETCODE_DONE
+    mt5.set_time(START + 100 * 60)
+    assert len(mt5.positions_get()) == 1
+
+
+def test_requote_outside_the_deviation(store):
+    mt5.set_time(START + 600)
+    result = _buy(price=1.10013, deviation=2)
+    assert result.retcode == mt5.TRADE_RETCODE_REQUOTE
+    assert result.ask == pytest.approx(1.1001)
+    assert mt5.positions_get() == ()
+    assert _buy(price=1.10013, deviation=3).retcode == mt5.TRADE_RETCODE_DONE
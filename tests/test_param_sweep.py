@@ -0,0 +1,17 @@
+import pytest
+
+import indicators
+import param_sweep
+from synthetic_data import synthetic_bars
+from timeframes import TIMEFRAMES
+
+
+def test_shared_cache_requires_cache_key():
+    bars = synthetic_bars(1000, timeframe=TIMEFRAMES["H1"], seed=4)
+    cache = indicators.IndicatorCache()
+    with pytest.raises(ValueError):
+        param_sweep.run_sweep("ema_rsi_bb", bars, {"ema_fast": [5, 9]}, workers=1, cache=cache)
+    key = ("EURUSD", TIMEFRAMES["H1"], "synthetic-4")
+    first = param_sweep.run_sweep("ema_rsi_bb", bars, {"ema_fast": [5, 9]}, workers=1, cache=cache, cache_key=key)
+    again = param_sweep.run_sweep("ema_rsi_bb", bars, {"ema_fast": [5, 9]}, workers=1, cache=cache, cache_key=key)
+    assert first.equals(again)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import backtest_engine
+import portfolio_backtest
+from synthetic_data import synthetic_bars
+from timeframes import TIMEFRAMES
+
+
+def _columns(seed, keep=None):
+    bars = synthetic_bars(3000, timeframe=TIMEFRAMES["H1"], seed=seed)
+    rng = np.random.default_rng(seed)
+    keep = np.ones(3000, dtype=bool) if keep is None else rng.random(3000) < keep
+    columns = {name: values[keep] for name, values in bars.items()}
+    columns["long"] = rng.random(keep.sum()) < 0.05
+    columns["short"] = rng.random(keep.sum()) < 0.05
+    step = 0.002 * columns["close"]
+    columns["sl"] = np.where(columns["long"], columns["close"] - step, columns["close"] + step)
+    columns["tp"] = np.where(columns["long"], columns["close"] + 2 * step, columns["close"] - 2 * step)
+    return columns
+
+
+def _single(columns, start):
+    return backtest_engine.simulate(
+        columns["high"], columns["low"], columns["close"], columns["long"], columns["short"],
+        columns["sl"], columns["tp"], start=start,
+    )
+
+
+def test_portfolio_is_the_sum_of_single_symbol_runs():
+    # The second symbol misses about a fifth of the bars of the first
+    by_symbol = {"A": _columns(1), "B": _columns(2, keep=0.8)}
+    names = ["high", "low", "close", "long", "short", "sl", "tp"]
+    times, present, arrays = portfolio_backtest.align(by_symbol, names)
+    assert not present[1].all()
+
+    result = portfolio_backtest.simulate(
+        arrays["high"], arrays["low"], arrays["close"], arrays["long"], arrays["short"],
+        arrays["sl"], arrays["tp"], present=present, start=50,
+    )
+    singles = [_single(columns, 50) for columns in by_symbol.values()]
+    profits = [single.final_balance - single.initial_balance for single in singles]
+    assert result.final_balance - result.initial_balance == pytest.approx(sum(profits))
+
+    for row, (columns, single) in enumerate(zip(by_symbol.values(), singles)):
+        trades = result.trades[result.trades["symbol"] == row]
+        assert len(trades) == len(single.trades) > 0
+        # Bars of the common axis map back to the symbol's own bars
+        axis = np.searchsorted(times, columns["time"])
+        np.testing.assert_array_equal(trades["entry_index"], axis[single.trades["entry_index"]])
+        closed = single.trades["exit_index"] >= 0
+        np.testing.assert_array_equal(trades["exit_index"][closed], axis[single.trades["exit_index"][closed]])
+        np.testing.assert_allclose(trades["profit"], single.trades["profit"])
+        assert result.symbol_equity[row, -1] == pytest.approx(profits[row])
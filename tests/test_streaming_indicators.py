@@ -0,0 +1,41 @@
+import numpy as np
+
+from bar_buffer import BarRingBuffer
+from streaming_indicators import IndicatorState
+from synthetic_data import synthetic_rates
+
+
+class _Terminal:
+    """
+    copy_rates_from_pos over a fixed history, with the bar at `forming` still forming.
+    """
+
+    def __init__(self, rates, forming):
+        self.rates = rates
+        self.forming = forming
+
+    def copy_rates_from_pos(self, symbol, timeframe, start_pos, count):
+        end = self.forming + 1 - start_pos
+        return self.rates[max(end - count, 0):end]
+
+
+def test_update_rates_on_consecutive_ring_buffer_views():
+    rates = synthetic_rates(400, seed=2)
+    terminal = _Terminal(rates, forming=250)
+    bars = BarRingBuffer("EURUSD", 1, capacity=200)
+    state = IndicatorState(bb_window=20, sma_windows=(10, 30))
+
+    added = bars.poll(terminal)
+    assert state.update_rates(bars.view(added + 1)) == 200
+    for forming in range(251, 400):
+        terminal.forming = forming
+        added = bars.poll(terminal)
+        assert state.update_rates(bars.view(added + 1)) == added == 1
+    # Every bar was folded in once, never re-warmed from the buffer
+    assert state.count == 200 + 149
+
+    fresh = IndicatorState(bb_window=20, sma_windows=(10, 30))
+    fresh.update_rates(rates[50:399])
+    assert state.latest["time"] == fresh.latest["time"]
+    for name, value in fresh.latest.items():
+        np.testing.assert_allclose(state.latest[name], value)
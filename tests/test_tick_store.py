@@ -0,0 +1,72 @@
+import os
+import numpy as np
+import pandas as pd
+
+import tick_store
+from tick_store import TICKS_DTYPE, TickAggregator
+
+
+def _ticks(count=20000, seed=5, start=1704672000):  # 2024-01-08, a Monday
+    rng = np.random.default_rng(seed)
+    ticks = np.zeros(count, dtype=TICKS_DTYPE)
+    ticks["time_msc"] = start * 1000 + np.sort(rng.integers(0, 86400 * 1000, count))
+    ticks["time"] = ticks["time_msc"] // 1000
+    ticks["bid"] = np.round(1.1 + np.cumsum(rng.normal(0, 2e-5, count)), 5)
+    ticks["ask"] = np.round(ticks["bid"] + rng.integers(1, 20, count) * 1e-5, 5)
+    ticks["volume"] = rng.integers(0, 5, count)
+    ticks["flags"] = tick_store.TICK_FLAG_BID | tick_store.TICK_FLAG_ASK
+    ticks["volume_real"] = rng.random(count)  # Not decimal: stored as raw doubles
+    return ticks
+
+
+class _Terminal:
+    def __init__(self, ticks):
+        self.ticks = ticks
+        self.calls = 0
+
+    def copy_ticks_range(self, symbol, date_from, date_to, flags):
+        self.calls += 1
+        return self.ticks
+
+
+def test_partition_round_trip_is_exact(tmp_path):
+    ticks = _ticks()
+    path = tick_store.partition_path("SYN", "2024-01-08", str(tmp_path))
+    tick_store.write_partition(path, ticks)
+    np.testing.assert_array_equal(tick_store.read_partition(path), ticks)
+
+
+def test_aggregation_is_independent_of_chunks_and_matches_pandas():
+    ticks = _ticks()
+    whole = TickAggregator(60, point=1e-5)
+    expected = np.concatenate((whole.update(ticks), whole.flush()))
+    for chunk in (1, 7, 1000, 4999):
+        aggregator = TickAggregator(60, point=1e-5)
+        parts = [aggregator.update(ticks[lo:lo + chunk]) for lo in range(0, len(ticks), chunk)]
+        np.testing.assert_array_equal(np.concatenate(parts + [aggregator.flush()]), expected)
+
+    frame = pd.DataFrame({"bid": ticks["bid"]}, index=pd.to_datetime(ticks["time_msc"], unit="ms"))
+    ohlc = frame["bid"].resample("60s").ohlc().dropna()
+    np.testing.assert_array_equal(expected["time"], ohlc.index.values.astype("datetime64[s]").astype(np.int64))
+    for name in ("open", "high", "low", "close"):
+        np.testing.assert_array_equal(expected[name], ohlc[name].to_numpy())
+    np.testing.assert_array_equal(expected["tick_volume"], frame["bid"].resample("60s").count()[lambda c: c > 0])
+
+
+def test_empty_weekday_is_fetched_again(tmp_path):
+    cache_dir = str(tmp_path)
+    weekday = tick_store.day_keys("2024-01-08", "2024-01-08")[0]
+    saturday = tick_store.day_keys("2024-01-13", "2024-01-13")[0]
+    terminal = _Terminal(np.zeros(0, dtype=TICKS_DTYPE))
+    for _ in range(2):
+        assert len(tick_store.load_day(terminal, "SYN", *weekday, cache_dir)) == 0
+    assert terminal.calls == 2
+    assert not os.path.exists(tick_store.partition_path("SYN", weekday[0], cache_dir))
+
+    # An empty weekend day and a weekday with ticks are stored and served locally
+    tick_store.load_day(terminal, "SYN", *saturday, cache_dir)
+    terminal.ticks = _ticks()
+    for _ in range(2):
+        assert len(tick_store.load_day(terminal, "SYN", *weekday, cache_dir)) == len(terminal.ticks)
+    assert terminal.calls == 4
+    assert os.path.exists(tick_store.partition_path("SYN", saturday[0], cache_dir))
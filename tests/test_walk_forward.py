@@ -0,0 +1,16 @@
+from datetime import timedelta
+import numpy as np
+
+from walk_forward import rolling_windows
+
+
+def test_rolling_windows_skip_empty_train_and_test_ranges():
+    # Daily bars for a week, nothing for two weeks, then another week
+    days = np.concatenate((np.arange(0, 7), np.arange(21, 28)))
+    times = np.datetime64("2024-01-01") + days.astype("timedelta64[D]")
+    windows = rolling_windows(times, train=timedelta(days=3), test=timedelta(days=2), step=timedelta(days=1))
+    assert windows
+    for train_lo, train_hi, test_lo, test_hi in windows:
+        assert train_lo < train_hi == test_lo < test_hi
+        # Train and test dates read from the window stay inside it
+        assert times[train_hi - 1] < times[test_lo] <= times[test_hi - 1]
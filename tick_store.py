@@ -0,0 +1,342 @@
+# Tick store in front of mt5.copy_ticks_range, and tick-to-bar aggregation
+#
+# The backtests only see copy_rates_* bars, so inside an M1 bar they cannot
+# tell whether the stop-loss or the take-profit was hit first.  Ticks are
+# stored next to the bars (bar_cache.CACHE_DIR) per symbol and day:
+#
+#     <cache_dir>/<SYMBOL>/TICKS/<YYYY-MM-DD>.npz
+#
+# Each partition holds one compressed column per tick field.  Times are
+# stored as differences of time_msc and prices, where they are exact
+# multiples of a decimal point size, as differences of integer points, which
+# compress several times better than the raw doubles.  Days that have
+# fully passed are fetched from the terminal once; the current day is always
+# fetched again.  A past weekday without any tick is not stored (its history
+# may not be synced yet) and is asked for again on the next run.
+#
+# TickAggregator turns ticks into bars of any whole number of seconds
+# (5-second bars as well as M1 or H4), chunk by chunk: the bar still open at
+# the end of a chunk is carried into the next one, so a month of ticks is
+# aggregated one day at a time and never held in memory at once:
+#
+#     bars = aggregate_range(mt5, "EURUSD", datetime(2024, 1, 1), datetime(2024, 1, 31, 23, 59), interval=10)
+
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+import bar_cache
+from bar_cache import RATES_DTYPE, to_timestamp
+
+# Same layout as the structured array returned by mt5.copy_ticks_*
+TICKS_DTYPE = np.dtype([
+    ("time", "<i8"),
+    ("bid", "<f8"),
+    ("ask", "<f8"),
+    ("last", "<f8"),
+    ("volume", "<u8"),
+    ("time_msc", "<i8"),
+    ("flags", "<u4"),
+    ("volume_real", "<f8"),
+])
+
+# copy_ticks_* flags and tick flags (same values as the MetaTrader5 package)
+COPY_TICKS_ALL = -1
+COPY_TICKS_INFO = 1
+COPY_TICKS_TRADE = 2
+TICK_FLAG_BID = 2
+TICK_FLAG_ASK = 4
+TICK_FLAG_LAST = 8
+TICK_FLAG_VOLUME = 16
+
+DAY_SECONDS = 86400
+MAX_DIGITS = 8  # Finest decimal point size tried when packing prices
+
+
+def day_keys(start_date, end_date):
+    """
+    List (key, first_second, last_second) for every UTC day touched by [start_date, end_date].
+    """
+    start, end = to_timestamp(start_date), to_timestamp(end_date)
+    days = []
+    current = start - start % DAY_SECONDS
+    while current <= end:
+        key = datetime.fromtimestamp(current, tz=timezone.utc).strftime("%Y-%m-%d")
+        days.append((key, current, current + DAY_SECONDS - 1))
+        current += DAY_SECONDS
+    return days
+
+
+def partition_path(symbol, key, cache_dir=None):
+    """
+    Return the file path of one symbol/day tick partition.
+    """
+    return os.path.join(cache_dir or bar_cache.CACHE_DIR, symbol, "TICKS", f"{key}.npz")
+
+
+def _pack_prices(values):
+    # (digits, integer point differences) when every price is exactly a multiple of 10**-digits
+    values = np.asarray(values, dtype=np.float64)
+    for digits in range(MAX_DIGITS + 1):
+        scale = 10.0 ** digits
+        points = np.round(values * scale)
+        if np.array_equal(points / scale, values):
+            return digits, np.diff(points.astype(np.int64), prepend=0)
+    return None
+
+
+def write_partition(path, ticks):
+    """
+    Write a ticks array as one compressed column per field, integer columns
+    and decimal prices delta-encoded.  Written to a temporary name and
+    renamed into place, like bar_cache.write_partition.
+    """
+    ticks = np.asarray(ticks)
+    columns = {"time_msc": np.diff(ticks["time_msc"].astype(np.int64), prepend=0)}
+    for name in ("bid", "ask", "last", "volume_real"):
+        packed = _pack_prices(ticks[name])
+        if packed is None:
+            columns[name] = np.ascontiguousarray(ticks[name])
+        else:
+            columns[f"{name}_digits"], columns[f"{name}_points"] = np.int64(packed[0]), packed[1]
+    columns["volume"] = np.ascontiguousarray(ticks["volume"])
+    columns["flags"] = np.ascontiguousarray(ticks["flags"])
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(f, **columns)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_partition(path):
+    """
+    Load a tick partition back into an MT5-style ticks array.
+    """
+    with np.load(path) as columns:
+        time_msc = np.cumsum(columns["time_msc"])
+        ticks = np.empty(len(time_msc), dtype=TICKS_DTYPE)
+        ticks["time_msc"] = time_msc
+        ticks["time"] = time_msc // 1000
+        for name in ("bid", "ask", "last", "volume_real"):
+            if name in columns:
+                ticks[name] = columns[name]
+            else:
+                ticks[name] = np.cumsum(columns[f"{name}_points"]) / 10.0 ** int(columns[f"{name}_digits"])
+        ticks["volume"] = columns["volume"]
+        ticks["flags"] = columns["flags"]
+    return ticks
+
+
+def load_day(mt5, symbol, key, first, last, cache_dir=None, now=None):
+    """
+    Return the ticks of one day, reading the local partition when present.
+
+    Missing days are fetched from the terminal and stored once they have
+    passed, unless a weekday came back without ticks.  Returns None if the
+    terminal call fails.
+    """
+    path = partition_path(symbol, key, cache_dir)
+    if os.path.exists(path):
+        return read_partition(path)
+    if mt5 is None or getattr(mt5, "OFFLINE", False):
+        return np.empty(0, dtype=TICKS_DTYPE)
+
+    ticks = mt5.copy_ticks_range(
+        symbol,
+        datetime.fromtimestamp(first, tz=timezone.utc),
+        datetime.fromtimestamp(last + 1, tz=timezone.utc),
+        COPY_TICKS_ALL,
+    )
+    if ticks is None:
+        return None
+    ticks = np.asarray(ticks).astype(TICKS_DTYPE, copy=False)
+    # The terminal's range is inclusive; keep the day's own milliseconds only
+    ticks = ticks[(ticks["time_msc"] >= first * 1000) & (ticks["time_msc"] < (last + 1) * 1000)]
+
+    now = to_timestamp(now) if now is not None else int(datetime.now(timezone.utc).timestamp())
+    if last < now and (len(ticks) or _weekend(first)):
+        write_partition(path, ticks)
+    return ticks
+
+
+def _weekend(timestamp):
+    # Saturday or Sunday (UTC): a day without ticks is plausible, the market is closed
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).weekday() >= 5
+
+
+def _select(ticks, start_msc, end_msc, flags):
+    lo = np.searchsorted(ticks["time_msc"], start_msc, side="left")
+    hi = np.searchsorted(ticks["time_msc"], end_msc, side="right")
+    ticks = ticks[lo:hi]
+    if flags == COPY_TICKS_INFO:
+        ticks = ticks[(ticks["flags"] & (TICK_FLAG_BID | TICK_FLAG_ASK)) != 0]
+    elif flags == COPY_TICKS_TRADE:
+        ticks = ticks[(ticks["flags"] & (TICK_FLAG_LAST | TICK_FLAG_VOLUME)) != 0]
+    return ticks
+
+
+def iter_ticks(mt5, symbol, start_date, end_date, flags=COPY_TICKS_ALL, cache_dir=None):
+    """
+    Yield the ticks of [start_date, end_date] one day partition at a time.
+    """
+    start, end = to_timestamp(start_date), to_timestamp(end_date)
+    for key, first, last in day_keys(start, end):
+        ticks = load_day(mt5, symbol, key, first, last, cache_dir)
+        if ticks is None:
+            raise RuntimeError(f"Failed to fetch {symbol} ticks for {key}")
+        yield _select(ticks, start * 1000, end * 1000 + 999, flags)
+
+
+def copy_ticks_range(mt5, symbol, date_from, date_to, flags=COPY_TICKS_ALL, cache_dir=None):
+    """
+    Drop-in replacement for mt5.copy_ticks_range(symbol, date_from, date_to, flags)
+    that serves ticks from the local store and only asks the terminal for
+    missing days.  Prefer iter_ticks() for long ranges.
+    """
+    parts = []
+    start, end = to_timestamp(date_from), to_timestamp(date_to)
+    for key, first, last in day_keys(start, end):
+        ticks = load_day(mt5, symbol, key, first, last, cache_dir)
+        if ticks is None:
+            return None
+        parts.append(_select(ticks, start * 1000, end * 1000 + 999, flags))
+    return np.concatenate(parts) if parts else np.empty(0, dtype=TICKS_DTYPE)
+
+
+class TickAggregator:
+    """
+    Bars of interval seconds from consecutive chunks of ticks.
+
+    price: tick field the bars are built from, "bid" (like MT5's own FX
+        bars), "ask", "last" or "mid"; ticks without that price are skipped.
+    point: price point size, to report the bar's smallest spread in points
+        (the spread column stays 0 without it).
+
+    update() returns the bars completed by a chunk (RATES_DTYPE, time = bar
+    open in epoch seconds, tick_volume = ticks in the bar, real_volume = the
+    summed tick volume); flush() returns the last, still open bar.
+    """
+
+    def __init__(self, interval, price="bid", point=None):
+        if isinstance(interval, timedelta):
+            interval = interval.total_seconds()
+        if interval < 1 or interval != int(interval):
+            raise ValueError(f"Bar interval must be a whole number of seconds, got {interval}")
+        self.interval_msc = int(interval) * 1000
+        self.price = price
+        self.point = point
+        self.pending = np.zeros(0, dtype=RATES_DTYPE)  # The open bar, carried to the next chunk
+
+    def _prices(self, ticks):
+        if self.price == "mid":
+            return (ticks["bid"] + ticks["ask"]) / 2
+        return ticks[self.price]
+
+    def update(self, ticks):
+        """
+        Add the next chunk of ticks (in time order) and return the bars it completed.
+        """
+        prices = np.asarray(self._prices(ticks), dtype=np.float64)
+        keep = prices > 0
+        if self.price == "mid":
+            keep &= (ticks["bid"] > 0) & (ticks["ask"] > 0)
+        if not keep.all():
+            ticks, prices = ticks[keep], prices[keep]
+        if len(prices) == 0:
+            return np.zeros(0, dtype=RATES_DTYPE)
+
+        buckets = np.asarray(ticks["time_msc"], dtype=np.int64) // self.interval_msc
+        starts = np.concatenate(([0], np.flatnonzero(buckets[1:] != buckets[:-1]) + 1))
+        bars = np.zeros(len(starts), dtype=RATES_DTYPE)
+        bars["time"] = buckets[starts] * self.interval_msc // 1000
+        bars["open"] = prices[starts]
+        bars["high"] = np.maximum.reduceat(prices, starts)
+        bars["low"] = np.minimum.reduceat(prices, starts)
+        bars["close"] = prices[np.append(starts[1:], len(prices)) - 1]
+        bars["tick_volume"] = np.diff(np.append(starts, len(prices)))
+        bars["real_volume"] = np.add.reduceat(np.asarray(ticks["volume"], dtype=np.uint64), starts)
+        if self.point:
+            spread = np.round((ticks["ask"] - ticks["bid"]) / self.point)
+            bars["spread"] = np.minimum.reduceat(spread, starts)
+
+        if len(self.pending):
+            if self.pending["time"][0] == bars["time"][0]:
+                bars[0] = _merge(self.pending[0], bars[0])
+            else:
+                bars = np.concatenate((self.pending, bars))
+        self.pending = bars[-1:].copy()
+        return bars[:-1]
+
+    def flush(self):
+        """
+        Return the bar still open (if any) and start afresh.
+        """
+        pending, self.pending = self.pending, np.zeros(0, dtype=RATES_DTYPE)
+        return pending
+
+
+def _merge(first, second):
+    # One bar from the part of it in the previous chunk and the part in this one
+    merged = np.zeros(1, dtype=RATES_DTYPE)[0]
+    merged["time"] = first["time"]
+    merged["open"] = first["open"]
+    merged["high"] = max(first["high"], second["high"])
+    merged["low"] = min(first["low"], second["low"])
+    merged["close"] = second["close"]
+    merged["tick_volume"] = first["tick_volume"] + second["tick_volume"]
+    merged["real_volume"] = first["real_volume"] + second["real_volume"]
+    merged["spread"] = min(first["spread"], second["spread"])
+    return merged
+
+
+def iter_bars(mt5, symbol, start_date, end_date, interval, price="bid", point=None, cache_dir=None):
+    """
+    Yield the bars of [start_date, end_date] built from ticks, one day of ticks at a time.
+    """
+    aggregator = TickAggregator(interval, price, point)
+    for ticks in iter_ticks(mt5, symbol, start_date, end_date, cache_dir=cache_dir):
+        bars = aggregator.update(ticks)
+        if len(bars):
+            yield bars
+    last = aggregator.flush()
+    if len(last):
+        yield last
+
+
+def aggregate_range(mt5, symbol, start_date, end_date, interval, price="bid", point=None, cache_dir=None):
+    """
+    Bars of interval seconds over [start_date, end_date] built from ticks, as one array.
+    """
+    parts = list(iter_bars(mt5, symbol, start_date, end_date, interval, price, point, cache_dir))
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=RATES_DTYPE)
+
+
+if __name__ == "__main__":
+    try:
+        import MetaTrader5 as mt5
+    except ImportError:  # No terminal (e.g. Linux workers): serve ticks from the local store
+        import mt5_offline as mt5
+    import time
+
+    # Initialize MetaTrader 5 connection
+    if not mt5.initialize():
+        print("Failed to initialize MT5!")
+        quit()
+
+    symbol = "EURUSD"
+    start_date, end_date = datetime(2024, 1, 1), datetime(2024, 1, 31, 23, 59, 59)
+    started = time.perf_counter()
+    bars = aggregate_range(mt5, symbol, start_date, end_date, interval=10, point=0.00001)
+    elapsed = time.perf_counter() - started
+    mt5.shutdown()
+
+    print(f"{len(bars)} 10-second bars of {symbol} from {int(bars['tick_volume'].sum())} ticks in {elapsed:.2f}s")
+    if len(bars):
+        print(bars[:5])
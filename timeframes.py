@@ -0,0 +1,58 @@
+# MetaTrader 5 timeframe constants, names and bar lengths
+#
+# The values match the TIMEFRAME_* constants exported by the MetaTrader5
+# package, so they can be used interchangeably with mt5.TIMEFRAME_*.
+
+TIMEFRAMES = {
+    "M1": 1,
+    "M2": 2,
+    "M3": 3,
+    "M4": 4,
+    "M5": 5,
+    "M6": 6,
+    "M10": 10,
+    "M12": 12,
+    "M15": 15,
+    "M20": 20,
+    "M30": 30,
+    "H1": 16385,
+    "H2": 16386,
+    "H3": 16387,
+    "H4": 16388,
+    "H6": 16390,
+    "H8": 16392,
+    "H12": 16396,
+    "D1": 16408,
+    "W1": 32769,
+    "MN1": 49153,
+}
+
+TIMEFRAME_NAMES = {value: name for name, value in TIMEFRAMES.items()}
+
+# Nominal bar length in seconds (MN1 uses 31 days as an upper bound)
+TIMEFRAME_SECONDS = {
+    value: (
+        int(name[1:]) * 60 if name[0] == "M" and name != "MN1"
+        else int(name[1:]) * 3600 if name[0] == "H"
+        else 86400 if name == "D1"
+        else 7 * 86400 if name == "W1"
+        else 31 * 86400
+    )
+    for name, value in TIMEFRAMES.items()
+}
+
+
+def timeframe_name(timeframe):
+    """
+    Return the short name (e.g. "M1", "H4") for an MT5 timeframe constant.
+    """
+    return TIMEFRAME_NAMES.get(timeframe, str(timeframe))
+
+
+def timeframe_seconds(timeframe):
+    """
+    Return the nominal bar length in seconds for an MT5 timeframe constant.
+    """
+    if timeframe not in TIMEFRAME_SECONDS:
+        raise ValueError(f"Unknown timeframe: {timeframe}")
+    return TIMEFRAME_SECONDS[timeframe]
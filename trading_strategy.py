@@ -1,4 +1,7 @@
-import MetaTrader5 as mt5
+try:
+    import MetaTrader5 as mt5
+except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+    import mt5_offline as mt5
 import pandas as pd
 
 # Initialize MetaTrader 5 connection
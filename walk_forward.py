@@ -0,0 +1,116 @@
+# Walk-forward optimization over the cached bar history
+#
+# Parameters such as atr_multiplier_sl or the cooldown in
+# refined_strategy_backtest.py were picked by hand from one in-sample run.
+# The walk-forward driver cuts the history into rolling train/test windows
+# (e.g. four weeks of training followed by one week of testing, moved
+# forward a week at a time), searches the parameter grid on each train
+# window in parallel (param_sweep.SweepPool) and backtests the winner on
+# the following, unseen test window:
+#
+#     bars = param_sweep.load_bars(mt5, "EURUSD", mt5.TIMEFRAME_M1, start_date, end_date)
+#     table = run_walk_forward("sma_cross_bb", bars, grid, train=timedelta(weeks=4), test=timedelta(weeks=1))
+#
+# Every indicator column the grid needs is computed once over the whole
+# history (a value only depends on earlier bars, so slicing it is the same
+# as recomputing it on a window, without the warm-up) and published once to
+# the pool; each window is a zero-copy slice of those columns.
+
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+from param_sweep import STRATEGIES, SweepPool, evaluate, expand_grid, prepare_columns
+
+
+def _seconds(duration):
+    if isinstance(duration, timedelta):
+        return np.timedelta64(int(duration.total_seconds()), "s")
+    return np.timedelta64(duration).astype("timedelta64[s]")
+
+
+def rolling_windows(times, train, test, step=None):
+    """
+    Bar ranges (train_lo, train_hi, test_lo, test_hi) of rolling windows over
+    sorted bar times: train of history, then test, moved forward by step
+    (default: test) until no test bar is left.  Windows whose train or test
+    range holds no bar (data gaps such as weekends or holidays) are skipped.
+    """
+    times = np.asarray(times).astype("datetime64[s]")
+    train, test = _seconds(train), _seconds(test)
+    step = _seconds(step) if step is not None else test
+    windows = []
+    if len(times) == 0:
+        return windows
+    begin = times[0]
+    while True:
+        lo, mid, hi = np.searchsorted(times, [begin, begin + train, begin + train + test])
+        if mid >= len(times):
+            break
+        if lo < mid < hi:
+            windows.append((int(lo), int(mid), int(mid), int(hi)))
+        begin = begin + step
+    return windows
+
+
+def run_walk_forward(strategy_name, bars, grid, train, test, step=None, metric="net_profit",
+                     workers=None, chunk_size=None, cache=None, cache_key=None):
+    """
+    Optimize grid on every train window and evaluate the best parameters on
+    the test window after it.  Returns one row per window: its dates, the
+    chosen parameters, the train metric and the out-of-sample summary
+    (test_net_profit, test_trades, test_win_rate, test_max_drawdown).
+
+    metric: summary column maximized on the train windows.
+    workers, chunk_size, cache, cache_key: as for param_sweep.run_sweep.
+    """
+    strategy = STRATEGIES[strategy_name]
+    param_sets = [dict(strategy.defaults, **params) for params in expand_grid(grid)]
+    columns = prepare_columns(strategy, bars, param_sets, cache, cache_key)
+    times = bars["time"]
+    grid_names = sorted({name for params in expand_grid(grid) for name in params})
+
+    rows = []
+    with SweepPool(strategy_name, columns, workers, chunk_size) as pool:
+        for train_lo, train_hi, test_lo, test_hi in rolling_windows(times, train, test, step):
+            scores = pd.DataFrame(pool.evaluate(param_sets, (train_lo, train_hi)))[metric]
+            best = param_sets[int(np.argmax(scores.fillna(-np.inf).to_numpy()))]
+            summary = evaluate(strategy, columns, best, (test_lo, test_hi))
+            row = {
+                "train_start": times[train_lo], "train_end": times[train_hi - 1],
+                "test_start": times[test_lo], "test_end": times[test_hi - 1],
+            }
+            row.update({name: best[name] for name in grid_names})
+            row[f"train_{metric}"] = scores.max()
+            row.update({f"test_{name}": summary[name] for name in ("net_profit", "trades", "win_rate", "max_drawdown")})
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    try:
+        import MetaTrader5 as mt5
+    except ImportError:  # No terminal (e.g. Linux workers): serve bars from the local store
+        import mt5_offline as mt5
+    from datetime import datetime
+    from param_sweep import load_bars
+
+    # Initialize MetaTrader 5 connection
+    if not mt5.initialize():
+        print("Failed to initialize MT5!")
+        quit()
+
+    bars = load_bars(mt5, "EURUSD", mt5.TIMEFRAME_M1, datetime(2024, 1, 1), datetime(2024, 12, 31, 23, 59))
+    mt5.shutdown()
+    if bars is not None:
+        grid = {
+            "atr_multiplier_sl": [0.75, 1, 1.5, 2],
+            "atr_multiplier_tp": [1, 1.5, 2, 3],
+            "cooldown_minutes": [5, 15, 30],
+            "rsi_level": [45, 50, 55],
+            "sma_fast": [5, 10],
+        }
+        table = run_walk_forward("sma_cross_bb", bars, grid, train=timedelta(weeks=4), test=timedelta(weeks=1))
+        print(table.to_string(index=False))
+        print(f"Out-of-sample net profit: ${table['test_net_profit'].sum():.2f} "
+              f"over {len(table)} windows, {table['test_trades'].sum()} trades")